@@ -0,0 +1,140 @@
+import av
+import librosa
+import numpy as np
+
+TARGET_SR = 16000
+
+
+def load_audio_with_av(file_path, sr=TARGET_SR, duration=3):
+    try:
+        container = av.open(file_path)
+        audio_stream = next(s for s in container.streams if s.type == 'audio')
+
+        # Resample to target sample rate
+        resampler = av.audio.resampler.AudioResampler(format='flt', layout='mono', rate=sr)
+
+        audio_data = []
+        for frame in container.decode(audio_stream):
+            # Resample frame
+            resampled_frames = resampler.resample(frame)
+            for resampled_frame in resampled_frames:
+                # Flatten to 1D array immediately to avoid shape mismatch during concatenation
+                # (1, samples) -> (samples,)
+                audio_data.append(resampled_frame.to_ndarray().flatten())
+        container.close()
+
+        # Concatenate all frames
+        if not audio_data:
+            return None, None
+
+        audio = np.concatenate(audio_data)
+
+        # Flatten if necessary (should be 1D array for mono)
+        if audio.ndim > 1:
+            audio = audio.flatten()
+
+        # Handle duration limit
+        if duration is not None:
+            target_length = int(sr * duration)
+            if len(audio) > target_length:
+                audio = audio[:target_length]
+
+        return audio, sr
+    except Exception as e:
+        print(f"PyAV loading error: {e}")
+        return None, None
+
+
+class DecodedAudio:
+    """
+    One 16 kHz mono float32 buffer for a single upload.
+    Every pipeline stage reads from this instead of re-decoding the file.
+    """
+
+    def __init__(self, samples, sr=TARGET_SR, filename=None):
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.sr = sr
+        self.filename = filename
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sr
+
+    def head(self, seconds):
+        """First `seconds` of audio (a view, no copy)"""
+        if seconds is None:
+            return self.samples
+        return self.samples[:int(self.sr * seconds)]
+
+    def slice(self, start, end):
+        """Samples between `start` and `end` seconds (a view, no copy)"""
+        return self.samples[int(start * self.sr):int(end * self.sr)]
+
+    def pcm16_bytes(self, start=None, end=None):
+        """16-bit little-endian PCM, as expected by speech_recognition.AudioData"""
+        chunk = self.samples if start is None else self.slice(start, end)
+        return (np.clip(chunk, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def decode_audio(file_path, sr=TARGET_SR, filename=None):
+    """Decode an upload once (PyAV, librosa fallback). Returns None if undecodable."""
+    audio, _ = load_audio_with_av(file_path, sr=sr, duration=None)
+    if audio is None:
+        try:
+            # Fallback to librosa if PyAV fails (though unlikely for m4a)
+            print("PyAV failed, trying librosa...")
+            audio, _ = librosa.load(file_path, sr=sr, mono=True)
+        except Exception as e:
+            print(f"Audio decode error: {e}")
+            return None
+    if audio is None or len(audio) == 0:
+        return None
+    return DecodedAudio(audio, sr=sr, filename=filename)
+
+
+class StreamDecoder:
+    """
+    Incremental decoder for Live Monitor frames -> 16 kHz mono float32.
+
+    codec="pcm16": raw little-endian int16 mono at `sample_rate`
+    codec="opus":  one Opus packet per message (decoded with PyAV/libopus)
+    The resampler keeps state between frames, so chunk edges stay seamless.
+    """
+
+    def __init__(self, codec="pcm16", sample_rate=TARGET_SR, target_sr=TARGET_SR):
+        if codec not in ("pcm16", "opus"):
+            raise ValueError(f"Unsupported codec: {codec}")
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.target_sr = target_sr
+        self._decoder = av.CodecContext.create("libopus", "r") if codec == "opus" else None
+        self._resampler = av.audio.resampler.AudioResampler(format='flt', layout='mono', rate=target_sr)
+        self._carry = b""  # Odd trailing byte of a split int16 sample
+
+    def _resample(self, frame):
+        return [f.to_ndarray().flatten() for f in self._resampler.resample(frame)]
+
+    def decode(self, payload):
+        if self.codec == "pcm16":
+            data = self._carry + payload
+            usable = len(data) - len(data) % 2
+            self._carry = data[usable:]
+            pcm = np.frombuffer(data[:usable], dtype='<i2')
+            if len(pcm) == 0:
+                return np.zeros(0, dtype=np.float32)
+            if self.sample_rate == self.target_sr:
+                return pcm.astype(np.float32) / 32768.0
+            frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format='s16', layout='mono')
+            frame.sample_rate = self.sample_rate
+            parts = self._resample(frame)
+        else:
+            parts = []
+            for frame in self._decoder.decode(av.Packet(payload)):
+                parts.extend(self._resample(frame))
+
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts).astype(np.float32, copy=False)
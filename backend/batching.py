@@ -0,0 +1,120 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """
+    Collects single inputs from concurrent callers and runs them through
+    `predict_fn` as one stacked batch.
+
+    A batch is flushed when it reaches `max_batch_size` or when the oldest
+    queued item has waited `max_wait_ms`. One worker thread owns the model,
+    so `predict_fn` never runs concurrently with itself.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, name="batcher"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.batch_size_hist = histogram(
+            f"{name}_batch_size", "Inputs per batched forward pass", BATCH_SIZE_BUCKETS)
+        self.queue_wait_hist = histogram(
+            f"{name}_queue_wait_seconds", "Time an input waited before its batch ran")
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)  # Wake the worker
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, x):
+        """Queue one input (without batch dimension). Returns a concurrent Future."""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((np.asarray(x), future, time.perf_counter()))
+        return future
+
+    def submit_many(self, xs):
+        """Queue every row of `xs`; rows are batched like independent callers"""
+        return [self.submit(x) for x in xs]
+
+    async def predict_many_async(self, xs):
+        return await asyncio.gather(*(asyncio.wrap_future(f) for f in self.submit_many(xs)))
+
+    def predict(self, x, timeout=None):
+        """Blocking single-input prediction"""
+        return self.submit(x).result(timeout=timeout)
+
+    async def predict_async(self, x):
+        return await asyncio.wrap_future(self.submit(x))
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        items = [first]
+        deadline = first[2] + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Keep the stop signal for the outer loop
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while not self._stopped.is_set():
+            items = self._collect()
+            if not items:
+                continue
+
+            started = time.perf_counter()
+            for _, _, queued_at in items:
+                self.queue_wait_hist.observe(started - queued_at)
+            self.batch_size_hist.observe(len(items))
+
+            try:
+                outputs = self.predict_fn(np.stack([x for x, _, _ in items]))
+                for (_, future, _), out in zip(items, outputs):
+                    if not future.cancelled():
+                        future.set_result(out)
+            except Exception as e:
+                print(f"{self.name} batch error: {e}")
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+        # Fail anything still queued after shutdown
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and not item[1].done():
+                item[1].set_exception(RuntimeError(f"{self.name} stopped"))
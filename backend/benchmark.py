@@ -0,0 +1,465 @@
+"""
+Offline benchmark harness for the VoiceShield backend.
+
+    python benchmark.py --audio-seconds 10 60 --speakers 2 --codec wav m4a \
+        --image-size 1024x768 --iterations 20 --output bench.json
+
+Generates deterministic synthetic calls (alternating speakers with distinct
+pitch) and images, swaps models whose weights are missing for lightweight
+local stubs, then times the pipeline functions and the HTTP endpoints
+(through FastAPI's TestClient). Writes one JSON document with latency
+percentiles, throughput and peak RSS per target.
+
+With --baseline old.json, exits with status 1 when a target's p95 got more
+than --tolerance slower, so it can gate a deploy.
+
+The run uses a scratch working directory (so voiceshield.db is untouched),
+the mock STT backend (unless --stt google) and, unless --online, Hugging Face
+offline mode.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SR = 16000
+
+
+# --- Synthetic inputs ---
+
+def synth_speech(seconds, speakers=2, sr=SR, seed=0, turn_seconds=2.5, pause_seconds=0.4):
+    """
+    Speech-like test signal: speakers take turns, each a harmonic source with
+    its own pitch and spectral tilt, amplitude-modulated at syllable rate,
+    separated by short pauses (so VAD and diarization have work to do).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    out = np.zeros(n, dtype=np.float32)
+    f0s = np.linspace(105, 225, speakers) if speakers > 1 else np.array([150.0])
+    tilts = np.linspace(1.0, 1.8, speakers) if speakers > 1 else np.array([1.3])
+
+    pos = 0
+    turn = 0
+    while pos < n:
+        spk = turn % speakers
+        length = min(int(rng.uniform(0.6, 1.4) * turn_seconds * sr), n - pos)
+        t = np.arange(length) / sr
+        f0 = f0s[spk] * (1 + 0.03 * np.sin(2 * np.pi * rng.uniform(3, 6) * t))
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        voice = sum(np.sin(k * phase) / k ** tilts[spk] for k in range(1, 12))
+        syllables = np.sin(np.pi * rng.uniform(3.5, 5.5) * t) ** 2
+        out[pos:pos + length] = (voice * syllables).astype(np.float32)
+        pos += length + int(pause_seconds * sr)
+        turn += 1
+
+    out += 0.003 * rng.standard_normal(n).astype(np.float32)
+    return (0.3 * out / max(1e-6, float(np.abs(out).max()))).astype(np.float32)
+
+
+def write_audio(path, samples, codec, sr=SR):
+    if codec == "wav":
+        import soundfile as sf
+        sf.write(path, samples, sr, format="WAV", subtype="PCM_16")
+        return path
+
+    # m4a: AAC in an MP4 container via PyAV
+    import av
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    container = av.open(path, "w", format="mp4")
+    stream = container.add_stream("aac", rate=sr, layout="mono")
+    for i in range(0, len(pcm), 1024):
+        frame = av.AudioFrame.from_ndarray(pcm[i:i + 1024].reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = sr
+        for packet in stream.encode(frame):
+            container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return path
+
+
+def synth_image(path, width, height, seed=0):
+    """Photo-like test image: gradients, texture, a few flat shapes and sensor noise"""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.empty((height, width, 3), dtype=np.float32)
+    for c in range(3):
+        fx, fy = rng.uniform(2, 12, size=2)
+        img[..., c] = (128 + 60 * np.sin(2 * np.pi * fx * xx / width + c)
+                       + 40 * np.cos(2 * np.pi * fy * yy / height - c))
+    for _ in range(8):
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        img[y0:y0 + height // 6, x0:x0 + width // 6] = rng.uniform(0, 255, size=3)
+    img += rng.normal(0, 6, size=img.shape)
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(path, "JPEG", quality=92)
+    return path
+
+
+# --- Model stubs (used when weights are missing) ---
+
+class StubCNN:
+    """Stands in for best_model.h5: (N, 128, 94, 1) mel windows -> (N, 1) scores"""
+
+    def predict_on_batch(self, X):
+        X = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+        return 1.0 / (1.0 + np.exp(-(X.mean(axis=1, keepdims=True) - X.std(axis=1, keepdims=True))))
+
+
+class StubSpeakerEncoder:
+    """Stands in for ECAPA: mean log magnitude spectrum of 512-sample frames (192 dims)"""
+    dim = 192
+
+    def encode_batch(self, wavs, wav_lens=None):
+        import torch
+        rows = []
+        for i, row in enumerate(wavs):
+            n = wavs.shape[1] if wav_lens is None else max(512, int(round(float(wav_lens[i]) * wavs.shape[1])))
+            usable = (min(n, row.shape[0]) // 512) * 512
+            frames = row[:usable].reshape(-1, 512)
+            spectrum = torch.log1p(torch.fft.rfft(frames).abs().mean(dim=0))[:self.dim]
+            rows.append(spectrum)
+        return torch.stack(rows).unsqueeze(1)
+
+
+def stub_vad(wav, model, sampling_rate=SR, frame_ms=30, min_speech_ms=250, min_silence_ms=200):
+    """Energy-threshold VAD with Silero's return format [{'start', 'end'}] (samples)"""
+    x = wav.numpy() if hasattr(wav, "numpy") else np.asarray(wav)
+    frame = int(sampling_rate * frame_ms / 1000)
+    n_frames = len(x) // frame
+    if n_frames == 0:
+        return []
+    rms = np.sqrt((x[:n_frames * frame].reshape(n_frames, frame) ** 2).mean(axis=1))
+    active = rms > max(1e-4, 0.1 * float(rms.max()))
+
+    spans = []
+    start = None
+    for i, on in enumerate(np.append(active, False)):
+        if on and start is None:
+            start = i
+        elif not on and start is not None:
+            spans.append([start * frame, i * frame])
+            start = None
+    merged = []
+    for s, e in spans:
+        if merged and s - merged[-1][1] < sampling_rate * min_silence_ms / 1000:
+            merged[-1][1] = e
+        else:
+            merged.append([s, e])
+    return [{"start": s, "end": e} for s, e in merged if e - s >= sampling_rate * min_speech_ms / 1000]
+
+
+class StubAgeGenderProcessor:
+    def __call__(self, audios, sampling_rate=SR, return_tensors="pt", padding=True):
+        import torch
+        longest = max(len(a) for a in audios)
+        values = torch.zeros(len(audios), longest)
+        mask = torch.zeros(len(audios), longest, dtype=torch.long)
+        for i, a in enumerate(audios):
+            values[i, :len(a)] = torch.as_tensor(np.asarray(a, dtype=np.float32))
+            mask[i, :len(a)] = 1
+        return SimpleNamespace(input_values=values, attention_mask=mask)
+
+
+class StubAgeGenderModel:
+    """Zero-crossing rate as a pitch proxy -> female/male label"""
+    config = SimpleNamespace(id2label={0: "male_35", 1: "female_28"})
+
+    def __call__(self, input_values, attention_mask=None):
+        import torch
+        signs = torch.sign(input_values)
+        zcr = (signs[:, 1:] != signs[:, :-1]).float().mean(dim=1)
+        logits = torch.stack([0.02 - zcr, zcr - 0.02], dim=1)
+        return SimpleNamespace(logits=logits)
+
+
+class StubImageProcessor:
+    def __call__(self, images, return_tensors="pt"):
+        import torch
+        batch = images if isinstance(images, list) else [images]
+        arrays = [np.asarray(img.convert("RGB").resize((224, 224)), dtype=np.float32) / 255.0 for img in batch]
+        return {"pixel_values": torch.from_numpy(np.stack(arrays)).permute(0, 3, 1, 2)}
+
+
+class StubImageModel:
+    """Channel statistics -> artificial/human logits"""
+    config = SimpleNamespace(id2label={0: "artificial", 1: "human"})
+
+    def __call__(self, pixel_values):
+        import torch
+        stats = pixel_values.std(dim=(2, 3)).mean(dim=1)
+        return SimpleNamespace(logits=torch.stack([0.25 - stats, stats - 0.25], dim=1))
+
+
+def install_stubs(server, mode):
+    """Replace missing (mode="auto") or all (mode="always") models. Returns the stubbed names."""
+    from batching import MicroBatcher
+    stubbed = []
+    force = mode == "always"
+    if mode == "never":
+        return stubbed
+
+    if force or server.model is None:
+        if server.cnn_batcher is not None:
+            server.cnn_batcher.stop()
+        server.model = StubCNN()
+        server.cnn_batcher = MicroBatcher(
+            server.model.predict_on_batch, max_batch_size=server.CNN_BATCH_MAX_SIZE,
+            max_wait_ms=server.CNN_BATCH_WINDOW_MS, name="cnn_lstm").start()
+        stubbed.append("cnn_lstm")
+    if force or server.speaker_recognition_model is None:
+        server.speaker_recognition_model = StubSpeakerEncoder()
+        stubbed.append("speaker_recognition")
+    if force or server.vad_model is None:
+        server.vad_model = object()
+        server.vad_get_speech_timestamps = stub_vad
+        stubbed.append("vad")
+    if force or server.age_gender_model is None:
+        server.age_gender_model = StubAgeGenderModel()
+        server.age_gender_processor = StubAgeGenderProcessor()
+        stubbed.append("age_gender")
+    if force or not len(server.image_ensemble):
+        server.image_ensemble.clear()
+        server.image_ensemble.add("stub", StubImageProcessor(), StubImageModel())
+        stubbed.append("image_models")
+    return stubbed
+
+
+# --- Measurement ---
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except Exception:
+            return None
+
+
+def measure(name, fn, iterations, warmup, work_units=None):
+    """
+    Time `fn` sequentially. `work_units` = (unit name, units per call), e.g.
+    ("audio_seconds", 30) adds an audio-seconds-per-second throughput.
+    """
+    try:
+        for _ in range(warmup):
+            fn()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        print(f"⚠️ Benchmark {name} failed: {e}", file=sys.stderr)
+        return {"name": name, "error": str(e), "peak_rss_mb": peak_rss_mb()}
+
+    ms = np.array(latencies) * 1000
+    result = {
+        "name": name,
+        "iterations": iterations,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "throughput_per_s": round(iterations / elapsed, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if work_units:
+        unit, per_call = work_units
+        result[f"{unit}_per_s"] = round(per_call * iterations / elapsed, 3)
+    return result
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return response
+
+
+def run_benchmarks(args, workdir):
+    # Imported here: server reads env (STT backend, HF offline) at import/startup time
+    from fastapi.testclient import TestClient
+    import server
+    from audio_io import decode_audio
+    from image_hash_index import NearDuplicateIndex
+    from result_cache import ResultCache
+
+    model_path = os.path.join(BACKEND_DIR, server.MODEL_PATH)
+    if not os.path.isabs(server.MODEL_PATH) and os.path.exists(model_path):
+        server.MODEL_PATH = model_path  # We run from a scratch cwd
+
+    audio_files = []
+    for seconds in args.audio_seconds:
+        samples = synth_speech(seconds, speakers=args.speakers, seed=args.seed)
+        for codec in args.codec:
+            path = os.path.join(workdir, f"call_{seconds:g}s_{args.speakers}spk.{codec}")
+            audio_files.append((seconds, codec, write_audio(path, samples, codec)))
+    image_files = []
+    for size in args.image_size:
+        width, height = (int(v) for v in size.lower().split("x"))
+        path = os.path.join(workdir, f"image_{width}x{height}.jpg")
+        image_files.append((width, height, synth_image(path, width, height, seed=args.seed)))
+
+    results = []
+    with TestClient(server.app) as client:
+        stubbed = install_stubs(server, args.stubs)
+        real_cache = server.result_cache
+        server.result_cache = ResultCache(max_bytes=0)  # Measure the pipeline, not cache hits
+        real_near_duplicates = server.near_duplicates
+        server.near_duplicates = NearDuplicateIndex(max_entries=0)  # Nor near-duplicate reuse of model scores
+
+        if "functions" in args.targets:
+            for seconds, codec, path in audio_files:
+                tag = f"{seconds:g}s_{codec}"
+                audio = decode_audio(path)
+                results.append(measure(f"decode_audio[{tag}]", lambda: decode_audio(path),
+                                       args.iterations, args.warmup, ("audio_seconds", seconds)))
+                results.append(measure(f"extract_mel_spectrogram[{tag}]", lambda: server.extract_mel_spectrogram(audio),
+                                       args.iterations, args.warmup))
+                results.append(measure(f"diarize_audio[{tag}]", lambda: server.diarize_audio(audio),
+                                       args.iterations, args.warmup, ("audio_seconds", seconds)))
+                results.append(measure(f"predict_age_gender[{tag}]", lambda: server.predict_age_gender(audio.head(60)),
+                                       args.iterations, args.warmup))
+            for width, height, path in image_files:
+                results.append(measure(f"analyze_image_combined[{width}x{height}]",
+                                       lambda: server.analyze_image_combined(path),
+                                       args.iterations, args.warmup, ("megapixels", width * height / 1e6)))
+
+        if "http" in args.targets:
+            def post(endpoint, path, **data):
+                with open(path, "rb") as f:
+                    return _check(client.post(endpoint, files={"file": (os.path.basename(path), f)}, data=data))
+
+            for seconds, codec, path in audio_files:
+                tag = f"{seconds:g}s_{codec}"
+                for scoring in ("head", "windowed"):
+                    for profile in args.profiles:
+                        results.append(measure(f"POST /analyze[{tag},{scoring},{profile}]",
+                                               lambda: post("/analyze", path, scoring=scoring, profile=profile),
+                                               args.iterations, args.warmup, ("audio_seconds", seconds)))
+            for width, height, path in image_files:
+                results.append(measure(f"POST /analyze_image[{width}x{height}]",
+                                       lambda: post("/analyze_image", path),
+                                       args.iterations, args.warmup, ("megapixels", width * height / 1e6)))
+
+            # Repeated identical uploads with the result cache back on
+            server.result_cache = real_cache
+            if audio_files:
+                seconds, codec, path = audio_files[0]
+                results.append(measure(f"POST /analyze[{seconds:g}s_{codec},cached]",
+                                       lambda: post("/analyze", path), args.iterations, max(1, args.warmup)))
+
+        server.result_cache = real_cache
+        server.near_duplicates = real_near_duplicates
+
+    return results, stubbed
+
+
+def compare(results, baseline, tolerance):
+    """Targets whose p95 regressed beyond `tolerance` (fraction) vs the baseline"""
+    previous = {r["name"]: r for r in baseline.get("results", []) if "p95_ms" in r}
+    regressions = []
+    for r in results:
+        old = previous.get(r["name"])
+        if old and "p95_ms" in r and r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append({"name": r["name"], "baseline_p95_ms": old["p95_ms"], "p95_ms": r["p95_ms"]})
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="VoiceShield backend benchmarks")
+    parser.add_argument("--audio-seconds", type=float, nargs="+", default=[10.0])
+    parser.add_argument("--speakers", type=int, default=2)
+    parser.add_argument("--codec", nargs="+", choices=["wav", "m4a"], default=["wav"])
+    parser.add_argument("--image-size", nargs="+", default=["1024x768"], help="WIDTHxHEIGHT")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--targets", nargs="+", choices=["functions", "http"], default=["functions", "http"])
+    parser.add_argument("--profiles", nargs="+", choices=["fast", "standard", "full"], default=["fast", "full"],
+                        help="/analyze analysis profiles to time")
+    parser.add_argument("--stubs", choices=["auto", "always", "never"], default="auto",
+                        help="auto: stub only models whose weights failed to load")
+    parser.add_argument("--stt", choices=["mock", "google"], default="mock")
+    parser.add_argument("--online", action="store_true", help="Allow Hugging Face downloads")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="Previous JSON output to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["VOICESHIELD_STT_BACKEND"] = args.stt
+    if not args.online:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="voiceshield-bench-") as workdir:
+        os.chdir(workdir)  # database.py opens ./voiceshield.db
+        try:
+            # Model loading chatter goes to stderr; stdout stays valid JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                results, stubbed = run_benchmarks(args, workdir)
+        finally:
+            os.chdir(original_cwd)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stubbed_models": stubbed,
+            "config": vars(args),
+        },
+        "results": results,
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime, LargeBinary, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import datetime
+import struct
+import numpy as np
 
 DATABASE_URL = "sqlite:///./voiceshield.db"
 
@@ -10,14 +12,48 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Binary fingerprint format: 12-byte header + raw little-endian values
+#   magic "VSFP" | version u8 | dtype code u8 | reserved u16 | dimension u32
+FINGERPRINT_MAGIC = b"VSFP"
+FINGERPRINT_VERSION = 1
+FINGERPRINT_HEADER = struct.Struct("<4sBBHI")
+FINGERPRINT_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+FINGERPRINT_DTYPE_CODES = {dtype: code for code, dtype in FINGERPRINT_DTYPES.items()}
+
+def encode_fingerprint(vector, dtype="<f4"):
+    dtype = np.dtype(dtype)
+    values = np.ascontiguousarray(vector, dtype=dtype).ravel()
+    header = FINGERPRINT_HEADER.pack(FINGERPRINT_MAGIC, FINGERPRINT_VERSION, FINGERPRINT_DTYPE_CODES[dtype], 0, values.size)
+    return header + values.tobytes()
+
+def decode_fingerprint(blob):
+    """Zero-copy (read-only) view over the stored values"""
+    magic, version, dtype_code, _, dim = FINGERPRINT_HEADER.unpack_from(blob)
+    if magic != FINGERPRINT_MAGIC or version != FINGERPRINT_VERSION:
+        raise ValueError(f"Unknown fingerprint format: {magic!r} v{version}")
+    return np.frombuffer(blob, dtype=FINGERPRINT_DTYPES[dtype_code], count=dim, offset=FINGERPRINT_HEADER.size)
+
 class Voice(Base):
     __tablename__ = "voices"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
-    fingerprint = Column(JSON) # Storing list of floats as JSON
+    fingerprint = Column(JSON(none_as_null=True)) # Legacy: list of floats as JSON (migrated to fingerprint_blob)
+    fingerprint_blob = Column(LargeBinary) # encode_fingerprint() bytes
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    def set_fingerprint(self, vector):
+        self.fingerprint_blob = encode_fingerprint(vector)
+        self.fingerprint = None
+
+def load_fingerprint(blob, legacy_json=None):
+    """Decode a stored fingerprint, falling back to the legacy JSON column"""
+    if blob is not None:
+        return decode_fingerprint(blob)
+    if legacy_json is not None:
+        return np.asarray(legacy_json, dtype=np.float32)
+    return None
+
 class AnalysisLog(Base):
     __tablename__ = "analysis_logs"
 
@@ -26,8 +62,66 @@ class AnalysisLog(Base):
     result = Column(JSON)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+class AnalysisJob(Base):
+    """Queued /jobs/analyze request (the queue survives restarts)"""
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String, primary_key=True) # uuid4 hex
+    status = Column(String, index=True, default="queued") # queued | running | done | failed
+    filename = Column(String)
+    upload_path = Column(String) # Saved upload, removed when the job finishes
+    cache_key = Column(String, index=True)
+    params = Column(JSON) # {"scoring": ..., "profile": ...}
+    progress = Column(JSON) # {stage: "running" | "done" | "skipped" | "failed"}
+    partial = Column(JSON) # Results of finished stages while the job runs
+    result = Column(JSON)
+    error = Column(String)
+    log_id = Column(Integer) # AnalysisLog row of the finished job
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class ImageVerdict(Base):
+    """Past /analyze_image verdict, found again by perceptual hash (near-duplicate cache)"""
+    __tablename__ = "image_verdicts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    phash = Column(String(16)) # 64-bit hashes as hex
+    dhash = Column(String(16))
+    variant = Column(String) # "full" | "tiled" (analysis mode that produced the result)
+    cache_version = Column(String, index=True) # IMAGE_CACHE_VERSION; rows from other versions are dropped
+    content_hash = Column(String) # SHA-256 of the upload that was analyzed
+    result = Column(JSON) # Without the base64 visualizations
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrate_fingerprints()
+
+def migrate_fingerprints():
+    """Add the fingerprint_blob column if needed and convert legacy JSON rows"""
+    columns = [c["name"] for c in inspect(engine).get_columns("voices")]
+    if "fingerprint_blob" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE voices ADD COLUMN fingerprint_blob BLOB"))
+
+    db = SessionLocal()
+    try:
+        legacy = db.query(Voice).filter(Voice.fingerprint_blob.is_(None), Voice.fingerprint.isnot(None)).all()
+        migrated = 0
+        for voice in legacy:
+            if voice.fingerprint is None: # JSON 'null'
+                continue
+            voice.set_fingerprint(voice.fingerprint)
+            migrated += 1
+        if migrated:
+            db.commit()
+            print(f"✅ Migrated {migrated} voice fingerprints to binary storage")
+    finally:
+        db.close()
 
 def get_db():
     db = SessionLocal()
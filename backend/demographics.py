@@ -0,0 +1,173 @@
+"""
+Batched age/gender estimation (wav2vec2) with chunking & voting.
+
+All chunks from every audio in a request are stacked into padded batches,
+so one forward pass covers several speakers at once.
+"""
+import re
+from collections import Counter
+
+import torch
+
+CHUNK_SECONDS = 5
+OVERLAP_SECONDS = 2
+
+
+def chunk_audio(audio, sr=16000):
+    """Split into 5-second chunks with 2s overlap (a short clip is one chunk)"""
+    chunk_samples = int(CHUNK_SECONDS * sr)
+    step = int((CHUNK_SECONDS - OVERLAP_SECONDS) * sr)
+
+    if len(audio) <= chunk_samples:
+        return [audio]
+
+    chunks = [audio[i:i + chunk_samples] for i in range(0, len(audio) - chunk_samples + 1, step)]
+
+    # Add last chunk if skipped and meaningful length remains (> 1s)
+    last_end = (len(chunks) - 1) * step + chunk_samples
+    if len(audio) - last_end > sr:
+        chunks.append(audio[-chunk_samples:])
+    return chunks
+
+
+def parse_label(label):
+    """
+    Labels format examples: 'female_26', 'male_32', 'child_female_10', etc.
+    Returns (gender, age) with "Unknown" / None when not present.
+    """
+    gender = "Unknown"
+    if "female" in label:
+        gender = "Female"
+    elif "male" in label:
+        gender = "Male"
+    elif "child" in label:
+        gender = "Child"
+
+    age = None
+    age_match = re.search(r'_(\d+)', label)
+    if age_match:
+        age = int(age_match.group(1))
+    return gender, age
+
+
+class _Votes:
+    """Running gender votes and ages for one audio"""
+
+    def __init__(self, total_chunks):
+        self.genders = []
+        self.ages = []
+        self.seen = 0
+        self.total = total_chunks
+        self.age_buckets = []
+
+    def add(self, gender, age):
+        self.seen += 1
+        if gender != "Unknown":
+            self.genders.append(gender)
+        if age is not None:
+            self.ages.append(age)
+            self.age_buckets.append(int((sum(self.ages) / len(self.ages)) // 10))
+
+    def converged(self, min_votes, stable_votes):
+        """Gender majority can no longer flip and the age decade has stopped moving"""
+        if self.seen < min_votes:
+            return False
+        remaining = self.total - self.seen
+        counts = Counter(self.genders).most_common(2)
+        if not counts:
+            return False
+        lead = counts[0][1] - (counts[1][1] if len(counts) > 1 else 0)
+        gender_settled = lead > remaining or counts[0][1] / len(self.genders) >= 0.8
+
+        recent = self.age_buckets[-stable_votes:]
+        age_settled = len(recent) == stable_votes and len(set(recent)) == 1
+        return gender_settled and age_settled
+
+    def result(self):
+        final_gender = "Unknown"
+        final_age_str = "Unknown"
+
+        if self.genders:
+            # Majority vote
+            final_gender = Counter(self.genders).most_common(1)[0][0]
+
+        if self.ages:
+            # Average age
+            avg_age = sum(self.ages) / len(self.ages)
+            # Create age group string (e.g. "20s", "30s")
+            age_tens = int(avg_age // 10) * 10
+            final_age_str = f"{age_tens}s"
+
+            # Refine Child logic
+            if avg_age < 13:
+                final_gender = "Child" # Override gender if age is clearly child
+                final_age_str = "Child"
+
+        return {
+            "raw_label": f"{final_gender}_{final_age_str}", # Synthetic label
+            "gender": final_gender,
+            "age_group": final_age_str
+        }
+
+
+def predict_batch(model, processor, audios, sr=16000, batch_size=8,
+                  early_stop=False, min_votes=3, stable_votes=3):
+    """
+    Age/gender for each 1D array in `audios`. Returns a list aligned with
+    `audios`; entries shorter than one second are None.
+
+    Chunks are queued round-robin across audios so every speaker gets early
+    votes. With `early_stop`, an audio stops contributing chunks once its
+    vote has converged (see _Votes.converged).
+    """
+    results = [None] * len(audios)
+    per_audio = {}
+    for idx, audio in enumerate(audios):
+        if audio is None or len(audio) < sr: # Need at least 1 second
+            continue
+        per_audio[idx] = chunk_audio(audio, sr)
+
+    if not per_audio:
+        return results
+
+    votes = {idx: _Votes(len(chunks)) for idx, chunks in per_audio.items()}
+
+    # Round-robin order: first chunk of every audio, then second, ...
+    queue = []
+    for position in range(max(len(c) for c in per_audio.values())):
+        for idx, chunks in per_audio.items():
+            if position < len(chunks):
+                queue.append((idx, chunks[position]))
+
+    id2label = model.config.id2label
+    done = set()
+    cursor = 0
+    while cursor < len(queue):
+        batch = []
+        while cursor < len(queue) and len(batch) < batch_size:
+            idx, chunk = queue[cursor]
+            cursor += 1
+            if idx not in done:
+                batch.append((idx, chunk))
+        if not batch:
+            break
+
+        try:
+            inputs = processor([chunk for _, chunk in batch], sampling_rate=sr, return_tensors="pt", padding=True)
+            with torch.no_grad():
+                logits = model(inputs.input_values, attention_mask=inputs.attention_mask).logits
+            predicted = torch.argmax(logits, dim=-1).tolist()
+        except Exception as e:
+            # skip bad batches
+            print(f"Age/Gender batch error: {e}")
+            continue
+
+        for (idx, _), label_idx in zip(batch, predicted):
+            gender, age = parse_label(id2label[label_idx])
+            votes[idx].add(gender, age)
+            if early_stop and votes[idx].converged(min_votes, stable_votes):
+                done.add(idx)
+
+    for idx, vote in votes.items():
+        results[idx] = vote.result()
+    return results
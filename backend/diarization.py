@@ -0,0 +1,158 @@
+"""
+Speaker diarization helpers shared by /analyze and the streaming monitor.
+"""
+import numpy as np
+import torch
+
+
+def group_by_length(lengths, max_batch_samples):
+    """
+    Group segment indices into batches of similar length.
+
+    Segments are sorted longest first, so each batch pads to its first
+    member. A batch is closed once its padded size (count * longest)
+    would exceed `max_batch_samples`. A single over-long segment still
+    gets its own batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    current = []
+    for idx in order:
+        padded_len = lengths[current[0]] if current else lengths[idx]
+        if current and (len(current) + 1) * padded_len > max_batch_samples:
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def extract_embeddings(encoder, wav, spans, sr=16000, max_batch_seconds=60.0):
+    """
+    ECAPA embeddings for `spans` [(start, end) in samples] of a 1D `wav`
+    tensor, in a few padded `encode_batch` calls instead of one per segment.
+
+    Padding is masked through relative `wav_lens`, so each row approximately
+    matches `encode_batch(segment)` for that segment alone (not exactly: the
+    ECAPA front end reflect-pads frames at the true segment end differently).
+    Returns an (n_spans, emb_dim) array in the order of `spans`.
+    """
+    if not spans:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    lengths = [end - start for start, end in spans]
+    max_batch_samples = max(int(max_batch_seconds * sr), max(lengths))
+    embeddings = [None] * len(spans)
+
+    with torch.no_grad():
+        for batch in group_by_length(lengths, max_batch_samples):
+            max_len = lengths[batch[0]]
+            padded = torch.zeros(len(batch), max_len, dtype=wav.dtype)
+            for row, idx in enumerate(batch):
+                start, end = spans[idx]
+                padded[row, :end - start] = wav[start:end]
+            wav_lens = torch.tensor([lengths[idx] / max_len for idx in batch], dtype=torch.float32)
+
+            # (batch, 1, emb_dim) -> (batch, emb_dim)
+            out = encoder.encode_batch(padded, wav_lens).squeeze(1).cpu().numpy()
+            for row, idx in enumerate(batch):
+                embeddings[idx] = out[row]
+
+    return np.stack(embeddings)
+
+
+class OnlineSpeakerClusterer:
+    """
+    Incremental speaker clustering in bounded memory.
+
+    Each embedding joins the nearest running speaker centroid, or opens a new
+    speaker when its cosine distance to every centroid exceeds `threshold`.
+    Only one summed vector and a count per speaker are kept, so memory does
+    not grow with call length.
+    """
+
+    def __init__(self, threshold=0.7, max_speakers=8):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self._sums = []
+        self._counts = []
+
+    def __len__(self):
+        return len(self._sums)
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _centroids(self):
+        return np.stack([self._unit(s) for s in self._sums])
+
+    def assign(self, embedding):
+        """Speaker label for one embedding (updates that speaker's centroid)"""
+        vector = self._unit(embedding)
+        if self._sums:
+            distances = 1.0 - self._centroids() @ vector
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.threshold or len(self._sums) >= self.max_speakers:
+                self._sums[nearest] = self._sums[nearest] + vector
+                self._counts[nearest] += 1
+                return nearest
+        self._sums.append(vector.copy())
+        self._counts.append(1)
+        return len(self._sums) - 1
+
+    def recluster(self, merge_threshold=None, num_speakers=None):
+        """
+        Offline clean-up over the centroids (not the segments): merge the
+        closest pair while it is within `merge_threshold` or while there are
+        more than `num_speakers` speakers. Returns {old label: new label} with
+        new labels numbered in order of first appearance.
+        """
+        merge_threshold = self.threshold if merge_threshold is None else merge_threshold
+        groups = [[label] for label in range(len(self._sums))]
+        sums = list(self._sums)
+        counts = list(self._counts)
+
+        while len(sums) > 1:
+            centroids = np.stack([self._unit(s) for s in sums])
+            distances = 1.0 - centroids @ centroids.T
+            np.fill_diagonal(distances, np.inf)
+            i, j = np.unravel_index(np.argmin(distances), distances.shape)
+            too_many = num_speakers is not None and len(sums) > num_speakers
+            if distances[i, j] > merge_threshold and not too_many:
+                break
+            i, j = min(i, j), max(i, j)
+            sums[i] = sums[i] + sums[j]
+            counts[i] += counts[j]
+            groups[i].extend(groups[j])
+            del sums[j], counts[j], groups[j]
+
+        self._sums, self._counts = sums, counts
+        mapping = {}
+        for new_label, group in enumerate(sorted(groups, key=min)):
+            for old_label in group:
+                mapping[old_label] = new_label
+        return mapping
+
+
+def online_speaker_labels(encoder, wav, spans, sr=16000, threshold=0.7, max_speakers=8,
+                          recluster=True, num_speakers=None, chunk_segments=64, max_batch_seconds=60.0):
+    """
+    Speaker label per span, assigning segments in time order as their
+    embeddings are computed `chunk_segments` at a time (embeddings are not
+    retained). Optionally re-clusters the speaker centroids at the end.
+    """
+    clusterer = OnlineSpeakerClusterer(threshold=threshold, max_speakers=max_speakers)
+    labels = []
+    for i in range(0, len(spans), chunk_segments):
+        embeddings = extract_embeddings(encoder, wav, spans[i:i + chunk_segments], sr=sr,
+                                        max_batch_seconds=max_batch_seconds)
+        labels.extend(clusterer.assign(embedding) for embedding in embeddings)
+
+    if recluster or num_speakers is not None:
+        mapping = clusterer.recluster(num_speakers=num_speakers)
+        labels = [mapping[label] for label in labels]
+    return labels
@@ -0,0 +1,124 @@
+"""
+Pure NumPy/librosa feature extraction.
+
+Kept free of model imports so the functions can run in the DSP process
+pool without each worker loading TensorFlow or torch.
+"""
+import librosa
+import numpy as np
+
+
+def mel_spectrogram(audio, sr=16000, n_mels=128, duration=3):
+    """
+    Replicated from Kaggle Notebook
+    """
+    # Length normalization (3 seconds)
+    target_length = sr * duration
+    if len(audio) < target_length:
+        audio = np.pad(audio, (0, target_length - len(audio)))
+    else:
+        audio = audio[:target_length]
+
+    # Mel-spectrogram calculation
+    mel = librosa.feature.melspectrogram(
+        y=audio,
+        sr=sr,
+        n_mels=n_mels,
+        n_fft=2048,
+        hop_length=512,
+        fmax=8000
+    )
+
+    # dB scale conversion
+    mel_db = librosa.power_to_db(mel, ref=np.max)
+
+    # Normalization (mean 0, std 1)
+    mel_db = (mel_db - mel_db.mean()) / (mel_db.std() + 1e-6)
+
+    return mel_db
+
+
+def mfcc_fingerprint(audio, sr=16000, n_mfcc=40):
+    """Mean MFCC vector used as the Voice ID fingerprint"""
+    mfcc = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=n_mfcc)
+    return np.mean(mfcc, axis=1)
+
+
+# --- Sliding-window scoring over the full recording ---
+
+N_FFT = 2048
+HOP_LENGTH = 512
+FMAX = 8000
+AMIN_DB = -100.0  # 10 * log10(amin=1e-10), the floor librosa.power_to_db uses
+TOP_DB = 80.0
+
+
+def window_frames_for(sr=16000, duration=3):
+    """Mel frames in one model window (94 for 3 s at 16 kHz, hop 512)"""
+    return 1 + int(sr * duration) // HOP_LENGTH
+
+
+def log_mel_spectrogram(audio, sr=16000, n_mels=128, block_frames=2048):
+    """
+    Whole-signal log-power mel spectrogram (n_mels, frames) in dB.
+
+    Same framing as librosa's centered STFT (zero padding of n_fft // 2),
+    but computed with strided frame views and one batched rFFT per block of
+    `block_frames` frames, so STFT memory is bounded on long recordings.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    pad = N_FFT // 2
+    y = np.pad(audio, (pad, pad))
+    n_frames = 1 + (len(y) - N_FFT) // HOP_LENGTH
+
+    window = librosa.filters.get_window("hann", N_FFT, fftbins=True).astype(np.float32)
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=N_FFT, n_mels=n_mels, fmax=FMAX).astype(np.float32)
+
+    mel = np.empty((n_mels, n_frames), dtype=np.float32)
+    for f0 in range(0, n_frames, block_frames):
+        f1 = min(n_frames, f0 + block_frames)
+        segment = y[f0 * HOP_LENGTH:(f1 - 1) * HOP_LENGTH + N_FFT]
+        frames = np.lib.stride_tricks.sliding_window_view(segment, N_FFT)[::HOP_LENGTH]
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        mel[:, f0:f1] = mel_basis @ power.T.astype(np.float32)
+
+    return 10.0 * np.log10(np.maximum(mel, 1e-10))
+
+
+def window_starts(n_frames, window_frames, hop_frames):
+    """
+    Start frame of each window, every `hop_frames`, plus a final window
+    flush with the end when the hop does not land there, so the tail of
+    the recording is always scored. A short recording still yields one window.
+    """
+    if n_frames <= window_frames:
+        return np.array([0])
+    last = n_frames - window_frames
+    starts = np.arange(0, last + 1, hop_frames)
+    if starts[-1] != last:
+        starts = np.append(starts, last)
+    return starts
+
+
+def mel_windows(log_mel, window_frames):
+    """
+    (n_frames - window_frames + 1, n_mels, window_frames) view over a
+    log-mel spectrogram, one window per start frame; index it with
+    window_starts(). Recordings shorter than one window are padded with
+    silence, like the 3-second length normalization in mel_spectrogram.
+    """
+    if log_mel.shape[1] < window_frames:
+        log_mel = np.pad(log_mel, ((0, 0), (0, window_frames - log_mel.shape[1])), constant_values=AMIN_DB)
+    return np.lib.stride_tricks.sliding_window_view(log_mel, window_frames, axis=1).transpose(1, 0, 2)
+
+
+def normalize_windows(windows):
+    """
+    Per-window power_to_db(ref=np.max, top_db=80) followed by mean 0 / std 1
+    normalization, vectorized over the batch. Returns a new float32 array.
+    """
+    db = windows - windows.max(axis=(1, 2), keepdims=True)
+    db = np.maximum(db, -TOP_DB)
+    mean = db.mean(axis=(1, 2), keepdims=True)
+    std = db.std(axis=(1, 2), keepdims=True)
+    return ((db - mean) / (std + 1e-6)).astype(np.float32)
@@ -0,0 +1,187 @@
+"""
+Executor pools that keep blocking work off the asyncio event loop.
+
+- inference: bounded threads for work that releases the GIL
+  (TensorFlow, torch, PyAV decoding, OpenCV)
+- io: bounded threads for blocking network/DB calls (Google STT, SQLAlchemy)
+- dsp: process pool for Python-heavy librosa feature extraction
+- stt: bounded threads for concurrent per-segment speech-to-text requests
+- ensemble: threads that run the image detectors of one ensemble side by side
+
+Set VOICESHIELD_DSP_PROCESSES=0 to run DSP on the inference threads instead
+(e.g. on Windows dev machines where spawning workers is slow).
+
+Large NumPy arguments to run_dsp (whole recordings) are copied once into
+shared memory instead of being pickled through the pool's pipe.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+INFERENCE_THREADS = int(os.environ.get("VOICESHIELD_INFERENCE_THREADS", "4"))
+IO_THREADS = int(os.environ.get("VOICESHIELD_IO_THREADS", "16"))
+STT_THREADS = int(os.environ.get("VOICESHIELD_STT_THREADS", "8"))
+ENSEMBLE_THREADS = int(os.environ.get("VOICESHIELD_ENSEMBLE_THREADS", "2"))
+DSP_SHARED_MIN_BYTES = 1024 * 1024  # Smaller arrays are cheaper to pickle
+DSP_PROCESSES = int(os.environ.get("VOICESHIELD_DSP_PROCESSES", str(max(1, (os.cpu_count() or 2) // 2))))
+
+_inference_pool = None
+_io_pool = None
+_dsp_pool = None
+_stt_pool = None
+_ensemble_pool = None
+
+
+def _warmup():
+    # Importing dsp here makes workers pay librosa's import cost at startup
+    import dsp  # noqa: F401
+    return os.getpid()
+
+
+def start_pools():
+    global _inference_pool, _io_pool, _dsp_pool, _stt_pool, _ensemble_pool
+    if _inference_pool is None:
+        _inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+    if _stt_pool is None:
+        _stt_pool = ThreadPoolExecutor(max_workers=STT_THREADS, thread_name_prefix="stt")
+    if _ensemble_pool is None:
+        _ensemble_pool = ThreadPoolExecutor(max_workers=ENSEMBLE_THREADS, thread_name_prefix="ensemble")
+    if _dsp_pool is None and DSP_PROCESSES > 0:
+        # spawn, not fork: the parent already holds TF/torch threads
+        _dsp_pool = ProcessPoolExecutor(
+            max_workers=DSP_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(DSP_PROCESSES):
+            _dsp_pool.submit(_warmup)
+    print(f"✅ Executors ready: inference={INFERENCE_THREADS} threads, io={IO_THREADS} threads, stt={STT_THREADS} threads, ensemble={ENSEMBLE_THREADS} threads, dsp={DSP_PROCESSES} processes")
+
+
+def shutdown_pools():
+    global _inference_pool, _io_pool, _dsp_pool, _stt_pool, _ensemble_pool
+    for pool in (_inference_pool, _io_pool, _dsp_pool, _stt_pool, _ensemble_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _inference_pool = _io_pool = _dsp_pool = _stt_pool = _ensemble_pool = None
+
+
+def _thread_pool(name):
+    if _inference_pool is None:
+        start_pools()
+    return {"io": _io_pool, "stt": _stt_pool, "ensemble": _ensemble_pool}.get(name, _inference_pool)
+
+
+async def _run_in_thread(pool_name, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. per-request state) into the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_thread_pool(pool_name), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_inference(fn, *args, **kwargs):
+    """Run model inference (GIL-releasing) on the inference thread pool"""
+    return await _run_in_thread("inference", fn, *args, **kwargs)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking network/DB work on the io thread pool"""
+    return await _run_in_thread("io", fn, *args, **kwargs)
+
+
+class _SharedArray:
+    """Picklable handle to an array argument placed in shared memory"""
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _share_args(args, segments):
+    """Copy large array arguments into new shared memory segments (appended to `segments`)"""
+    shared = []
+    for arg in args:
+        if isinstance(arg, np.ndarray) and arg.nbytes >= DSP_SHARED_MIN_BYTES:
+            shm = shared_memory.SharedMemory(create=True, size=arg.nbytes)
+            segments.append(shm)
+            np.ndarray(arg.shape, dtype=arg.dtype, buffer=shm.buf)[...] = arg
+            arg = _SharedArray(shm.name, arg.shape, arg.dtype.str)
+        shared.append(arg)
+    return tuple(shared)
+
+
+def _call_with_shared(fn, args, kwargs):
+    """Worker side of run_dsp: attach the shared arrays, call fn, detach"""
+    segments = []
+
+    def attach(arg):
+        if not isinstance(arg, _SharedArray):
+            return arg
+        shm = shared_memory.SharedMemory(name=arg.name)
+        segments.append(shm)
+        return np.ndarray(arg.shape, dtype=arg.dtype, buffer=shm.buf)
+
+    resolved = [attach(arg) for arg in args]
+    try:
+        return fn(*resolved, **kwargs)
+    finally:
+        del resolved
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # The result still views the segment; the mapping goes with it
+
+
+async def run_dsp(fn, *args, **kwargs):
+    """
+    Run a picklable, module-level DSP function in the process pool.
+    Falls back to the inference threads when the process pool is disabled.
+    """
+    if _dsp_pool is None:
+        return await run_inference(fn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    segments = []
+    try:
+        if any(isinstance(arg, np.ndarray) and arg.nbytes >= DSP_SHARED_MIN_BYTES for arg in args):
+            args = await run_inference(_share_args, args, segments)
+        return await loop.run_in_executor(_dsp_pool, functools.partial(_call_with_shared, fn, args, kwargs))
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+
+def _submit_in_pool(pool_name, fn, items):
+    pool = _thread_pool(pool_name)
+    ctx = contextvars.copy_context()
+    return [pool.submit(ctx.copy().run, fn, item) for item in items]
+
+
+def _map_in_pool(pool_name, fn, items):
+    return [future.result() for future in _submit_in_pool(pool_name, fn, items)]
+
+
+def submit_stt(fn, items):
+    """map_stt without waiting: one concurrent.futures.Future per item, in order"""
+    return _submit_in_pool("stt", fn, items)
+
+
+def map_stt(fn, items):
+    """
+    Blocking, order-preserving map of `fn` over `items` on the stt pool.
+    Called from worker threads (not the event loop); the pool size bounds
+    how many STT requests are in flight across all uploads.
+    """
+    return _map_in_pool("stt", fn, items)
+
+
+def map_ensemble(fn, items):
+    """map_stt for the image detectors: one item per model, run side by side"""
+    return _map_in_pool("ensemble", fn, items)
@@ -0,0 +1,135 @@
+"""
+Runner for the AI-image detector ensemble (/analyze_image).
+
+- The artificial-label index of every detector is resolved once, at load.
+- Images are shrunk once (box reduce) to just above the largest model
+  input, then preprocessed once per distinct processor config; detectors
+  that share a config share the pixel tensor.
+- Each detector scores the whole image list in one forward pass, and the
+  detectors run side by side on the ensemble thread pool.
+"""
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from executors import map_ensemble
+from tracing import stage
+
+ENSEMBLE_BATCH_SIZE = int(os.environ.get("VOICESHIELD_ENSEMBLE_BATCH_SIZE", "8"))  # images per forward pass
+ARTIFICIAL_LABEL_HINTS = ("artificial", "fake", "ai")
+
+
+def artificial_label_index(id2label):
+    """Index of the artificial/fake class; index 0 if none matches (common convention)"""
+    for label_idx, label_name in id2label.items():
+        if any(hint in label_name.lower() for hint in ARTIFICIAL_LABEL_HINTS):
+            return int(label_idx)
+    return 0
+
+
+def combine_predictions(model_predictions):
+    """
+    Ensemble artificial probability (%) from the per-detector predictions
+    (None if there are none): the mean, reduced when the detectors disagree.
+    """
+    if not model_predictions:
+        return None
+    ai_probability = sum(model_predictions) / len(model_predictions)
+    if len(model_predictions) > 1 and np.var(model_predictions) > 500:  # High disagreement
+        ai_probability = ai_probability * 0.85  # Reduce confidence
+    return ai_probability
+
+
+def processor_key(processor):
+    """Processors with equal configs produce equal tensors"""
+    if hasattr(processor, "to_dict"):
+        try:
+            return json.dumps(processor.to_dict(), sort_keys=True, default=str)
+        except Exception:
+            pass
+    return f"id:{id(processor)}"
+
+
+def processor_input_side(processor, default=224):
+    size = getattr(processor, "size", None)
+    if isinstance(size, dict) and size:
+        return max(int(v) for v in size.values())
+    if isinstance(size, int):
+        return size
+    return default
+
+
+def shrink(img, side):
+    """Integer box reduction so the short side stays >= 2x the model input (cheap antialiasing)"""
+    factor = min(img.width, img.height) // (2 * side)
+    return img.reduce(factor) if factor >= 2 else img
+
+
+class ImageDetector:
+    def __init__(self, name, processor, model):
+        self.name = name
+        self.processor = processor
+        self.model = model
+        self.artificial_idx = artificial_label_index(model.config.id2label)
+        self.config_key = processor_key(processor)
+
+
+class ImageEnsemble:
+    def __init__(self, batch_size=ENSEMBLE_BATCH_SIZE):
+        self.detectors = []
+        self.batch_size = max(1, batch_size)
+
+    def __len__(self):
+        return len(self.detectors)
+
+    def add(self, name, processor, model):
+        if hasattr(model, "eval"):
+            model.eval()
+        self.detectors.append(ImageDetector(name, processor, model))
+
+    def clear(self):
+        self.detectors = []
+
+    def preprocess(self, images):
+        """{processor config: pixel inputs} for a list of RGB PIL images"""
+        side = max(processor_input_side(d.processor) for d in self.detectors)
+        with stage("image_preprocess"):
+            images = [shrink(img, side) for img in images]
+            inputs = {}
+            for detector in self.detectors:
+                if detector.config_key not in inputs:
+                    inputs[detector.config_key] = detector.processor(images=images, return_tensors="pt")
+        return inputs
+
+    def _score(self, job):
+        idx, detector, inputs = job
+        try:
+            with stage(f"image_model_{idx}"):
+                with torch.no_grad():
+                    probs = F.softmax(detector.model(**inputs).logits, dim=-1)
+            return (probs[:, detector.artificial_idx] * 100).tolist()
+        except Exception as e:
+            print(f"AI Model {idx} error: {e}")
+            return None
+
+    def predict(self, images):
+        """
+        Artificial probability (%) of every detector for each image:
+        one list per image, one entry per detector that succeeded.
+        """
+        predictions = [[] for _ in images]
+        if not self.detectors or not images:
+            return predictions
+        for start in range(0, len(images), self.batch_size):
+            inputs = self.preprocess(images[start:start + self.batch_size])
+            jobs = [(idx, d, inputs[d.config_key]) for idx, d in enumerate(self.detectors)]
+            for (idx, detector, _), scores in zip(jobs, map_ensemble(self._score, jobs)):
+                if scores is None:
+                    continue
+                for offset, artificial_prob in enumerate(scores):
+                    predictions[start + offset].append(artificial_prob)
+                    print(f"Model {idx} ({detector.name}): Artificial={artificial_prob:.2f}%")
+        return predictions
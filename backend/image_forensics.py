@@ -0,0 +1,92 @@
+"""
+Error level analysis (ELA) for /analyze_image.
+
+The image is recompressed as JPEG in memory and diffed against the
+original: regions edited after the last save recompress differently and
+stand out. The diff, scaling, grayscale and threshold mask are OpenCV /
+NumPy ops on uint8 buffers (no temp files, no PIL per-pixel passes), and
+the base64 visualizations are only encoded when the caller asks for them.
+"""
+import base64
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ELA_JPEG_QUALITY = 90
+REGION_THRESHOLD = 30   # Scaled ELA level (0-255) that counts as suspicious
+REGION_MIN_AREA = 100   # px
+MAX_REGIONS = 20
+
+
+def jpeg_base64(rgb, quality=75):
+    buffered = io.BytesIO()
+    Image.fromarray(rgb).save(buffered, format="JPEG", quality=quality)
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def recompress(img, quality=ELA_JPEG_QUALITY):
+    """RGB array of `img` after one in-memory JPEG round trip"""
+    buffered = io.BytesIO()
+    img.save(buffered, "JPEG", quality=quality)
+    buffered.seek(0)
+    with Image.open(buffered) as resaved:
+        return np.asarray(resaved.convert("RGB"))
+
+
+def find_regions(mask, min_area=REGION_MIN_AREA, max_regions=MAX_REGIONS):
+    """Simplified outlines ([[x, y], ...]) of the largest blobs in a binary mask"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contour_areas = sorted(((c, cv2.contourArea(c)) for c in contours), key=lambda x: x[1], reverse=True)
+    regions = []
+    for contour, area in contour_areas[:max_regions]:
+        if area > min_area:
+            epsilon = 0.005 * cv2.arcLength(contour, True)
+            regions.append(cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2).tolist())
+    return regions
+
+
+def draw_regions(rgb, regions):
+    """Copy of `rgb` with the regions outlined in red"""
+    visualized = rgb.copy()
+    for region in regions:
+        pts = np.array(region, np.int32).reshape((-1, 1, 2))
+        cv2.polylines(visualized, [pts], True, (255, 0, 0), 3)
+    return visualized
+
+
+def ela_levels(img, quality=ELA_JPEG_QUALITY):
+    """(original RGB array, ELA array stretched to 0-255, max raw diff)"""
+    original = np.asarray(img)
+    diff = cv2.absdiff(original, recompress(img, quality))
+    max_diff = int(diff.max()) or 1
+    # Stretch the diff to the full 0-255 range (saturating, like ImageEnhance.Brightness)
+    return original, cv2.convertScaleAbs(diff, alpha=255.0 / max_diff), max_diff
+
+
+def ela_score(img, quality=ELA_JPEG_QUALITY):
+    """Mean stretched ELA level only (per-tile scoring)"""
+    return float(ela_levels(img, quality)[1].mean())
+
+
+def error_level_analysis(img, visuals=False, quality=ELA_JPEG_QUALITY, threshold=REGION_THRESHOLD):
+    """
+    ELA of an RGB PIL image. Returns {"score", "max_diff", "regions",
+    "ela_image", "visualized_image"}; the two images are base64 JPEGs when
+    `visuals` is set, None otherwise.
+    """
+    original, ela, max_diff = ela_levels(img, quality)
+    score = float(ela.mean())
+
+    gray = cv2.cvtColor(ela, cv2.COLOR_RGB2GRAY)
+    _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+    regions = find_regions(mask)
+    print(f"[ELA] score={score:.2f}, max_diff={max_diff}, regions={len(regions)}")
+
+    result = {"score": score, "max_diff": max_diff, "regions": regions,
+              "ela_image": None, "visualized_image": None}
+    if visuals:
+        result["ela_image"] = jpeg_base64(ela)
+        result["visualized_image"] = jpeg_base64(draw_regions(original, regions), quality=85)
+    return result
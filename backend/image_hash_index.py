@@ -0,0 +1,165 @@
+"""
+Near-duplicate index of past image verdicts (/analyze_image).
+
+Scam campaigns reuse the same forged ID or portrait, re-compressed or
+resized. Such copies have a different SHA-256 (so the result cache misses)
+but nearly the same perceptual hashes. Every analyzed image gets a 64-bit
+pHash (DCT of a 32x32 thumbnail) and dHash (horizontal gradients of a 9x8
+thumbnail). pHashes are kept in a BK-tree for Hamming-radius search; a
+match must also be close in dHash.
+
+The index holds ids and hashes only; verdicts live in the image_verdicts
+table, which is the persisted copy of the index. Entries are evicted in
+LRU order beyond `max_entries`.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PHASH_MAX_DISTANCE = int(os.environ.get("VOICESHIELD_PHASH_MAX_DISTANCE", "6"))
+DHASH_MAX_DISTANCE = int(os.environ.get("VOICESHIELD_DHASH_MAX_DISTANCE", "10"))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.environ.get("VOICESHIELD_NEAR_DUPLICATE_MAX_ENTRIES", "10000"))
+HASH_DECODE_SIDE = 256  # JPEG draft size; the hashes only need a thumbnail
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def phash(gray):
+    pixels = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float32)
+    low = cv2.dct(pixels)[:8, :8]
+    median = np.median(low.ravel()[1:])  # DC term excluded
+    return _bits_to_int(low > median)
+
+
+def dhash(gray):
+    pixels = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def image_hashes(path):
+    """(phash, dhash) of an image file; JPEGs are decoded at thumbnail scale"""
+    with Image.open(path) as img:
+        if img.format == "JPEG":
+            img.draft("L", (HASH_DECODE_SIDE, HASH_DECODE_SIDE))
+        gray = img.convert("L")
+    return phash(gray), dhash(gray)
+
+
+def to_hex(value):
+    return f"{value:016x}"
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes (Hamming metric)"""
+
+    def __init__(self):
+        self.root = None  # [hash, key, {distance: child}]
+
+    def add(self, value, key):
+        node = [value, key, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        """[(distance, key)] within `radius` of `value`"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[1]))
+            # Triangle inequality: only children at distance-radius..distance+radius can match
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_entries=NEAR_DUPLICATE_MAX_ENTRIES,
+                 phash_radius=PHASH_MAX_DISTANCE, dhash_radius=DHASH_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.phash_radius = phash_radius
+        self.dhash_radius = dhash_radius
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (phash, dhash, variant), LRU order
+        self._tree = BKTree()
+        self._dead = 0  # Removed ids still in the tree (skipped on search)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _rebuild(self):
+        self._tree = BKTree()
+        for entry_id, (ph, _, _) in self._entries.items():
+            self._tree.add(ph, entry_id)
+        self._dead = 0
+
+    def _evict(self):
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            entry_id, _ = self._entries.popitem(last=False)
+            evicted.append(entry_id)
+            self._dead += 1
+        if self._dead > max(64, len(self._entries)):
+            self._rebuild()
+        return evicted
+
+    def load(self, rows):
+        """Replace the index with (id, phash, dhash, variant) rows, oldest use first. Returns evicted ids."""
+        with self._lock:
+            self._entries = OrderedDict((entry_id, (ph, dh, variant)) for entry_id, ph, dh, variant in rows)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self._rebuild()
+        return evicted
+
+    def add(self, entry_id, ph, dh, variant):
+        """Returns the ids evicted to stay within max_entries (delete their rows)"""
+        with self._lock:
+            self._entries[entry_id] = (ph, dh, variant)
+            self._tree.add(ph, entry_id)
+            return self._evict()
+
+    def remove(self, entry_id):
+        with self._lock:
+            if self._entries.pop(entry_id, None) is not None:
+                self._dead += 1
+
+    def lookup(self, ph, dh, variant):
+        """Closest live entry as (id, phash distance, dhash distance), or None"""
+        with self._lock:
+            best = None
+            for distance, entry_id in self._tree.search(ph, self.phash_radius):
+                entry = self._entries.get(entry_id)
+                if entry is None or entry[2] != variant:  # Evicted, or from the other analysis mode
+                    continue
+                d_distance = hamming(entry[1], dh)
+                if d_distance > self.dhash_radius:
+                    continue
+                if best is None or (distance, d_distance) < (best[1], best[2]):
+                    best = (entry_id, distance, d_distance)
+            if best is not None:
+                self._entries.move_to_end(best[0])
+            return best
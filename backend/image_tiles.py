@@ -0,0 +1,119 @@
+"""
+Tiled mode for very large images (ID-card scans, long screenshots).
+
+The image is decoded to a bounded working resolution: JPEGs use PIL's
+draft mode, so the decoder itself scales by 1/2..1/8 and the full-size
+bitmap is never allocated. Other formats (PNG, WebP, ...) can only be
+decoded at full size and box-reduced afterwards, so they are refused
+above TILED_MAX_DECODE_PIXELS (and PIL's MAX_IMAGE_PIXELS), checked from
+the header before decoding. The working image is then cut into fixed-size tiles, scored a
+batch at a time, and summarised as a per-tile heatmap. Only the working
+image and one batch of tiles are in memory at once.
+"""
+import math
+import os
+
+from PIL import Image
+
+TILE_SIZE = int(os.environ.get("VOICESHIELD_TILE_SIZE", "512"))
+TILE_BATCH_SIZE = int(os.environ.get("VOICESHIELD_TILE_BATCH_SIZE", "8"))
+TILED_MAX_PIXELS = int(float(os.environ.get("VOICESHIELD_TILED_MAX_MP", "16")) * 1e6)  # working resolution cap
+TILED_AUTO_PIXELS = int(float(os.environ.get("VOICESHIELD_TILED_AUTO_MP", "24")) * 1e6)  # "auto" switches on above this
+TILED_MAX_DECODE_PIXELS = int(float(os.environ.get("VOICESHIELD_TILED_MAX_DECODE_MP", "64")) * 1e6)  # full decodes (non-JPEG)
+OVERVIEW_SIDE = 2048  # Whole-image pass in tiled mode
+MIN_TILE_SIDE = 64    # Narrower edge strips are not scored
+SUSPICIOUS_TILE_PROBABILITY = 70  # Same bar as the whole-image "Artificial" verdict
+
+
+class ImageTooLarge(ValueError):
+    """The image cannot be decoded within the memory bound"""
+
+
+def decode_limit():
+    if Image.MAX_IMAGE_PIXELS:
+        return min(TILED_MAX_DECODE_PIXELS, Image.MAX_IMAGE_PIXELS)
+    return TILED_MAX_DECODE_PIXELS
+
+
+def image_size(path):
+    """(width, height) from the header, without decoding"""
+    with Image.open(path) as img:
+        return img.size
+
+
+def open_working_image(path, max_pixels=TILED_MAX_PIXELS):
+    """RGB image of at most ~max_pixels, and the original (width, height)"""
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    width, height = img.size
+    if width * height > max_pixels:
+        if img.format == "JPEG":
+            factor = math.sqrt(width * height / max_pixels)
+            img.draft("RGB", (math.ceil(width / factor), math.ceil(height / factor)))
+        elif width * height > decode_limit():
+            img.close()
+            raise ImageTooLarge(f"{img.format or 'Image'} of {width}x{height} px exceeds the "
+                                f"{decode_limit() / 1e6:.0f} MP decode limit (JPEG has no such limit)")
+    img = img.convert("RGB")
+    factor = math.ceil(math.sqrt(img.width * img.height / max_pixels))
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img, (width, height)
+
+
+def overview(img, side=OVERVIEW_SIDE):
+    factor = math.ceil(max(img.width, img.height) / side)
+    return img.reduce(factor) if factor >= 2 else img
+
+
+def grid_boxes(width, height, size=TILE_SIZE):
+    """[(row, col, (left, top, right, bottom))] covering the image; edge tiles may be smaller"""
+    return [
+        (row, col, (left, top, min(left + size, width), min(top + size, height)))
+        for row, top in enumerate(range(0, height, size))
+        for col, left in enumerate(range(0, width, size))
+    ]
+
+
+def scan_tiles(img, score_fn, original_size, size=TILE_SIZE, batch_size=TILE_BATCH_SIZE):
+    """
+    Score every tile of `img`. `score_fn(tiles)` returns one
+    (ai_probability, ela_score) per tile (ai_probability may be None).
+    Boxes in the result are in original-image pixels.
+    """
+    boxes = grid_boxes(img.width, img.height, size)
+    rows = max(row for row, _, _ in boxes) + 1
+    cols = max(col for _, col, _ in boxes) + 1
+    scale = original_size[0] / img.width
+    ai_map = [[None] * cols for _ in range(rows)]
+    ela_map = [[None] * cols for _ in range(rows)]
+    suspicious = []
+
+    scored = [b for b in boxes if min(b[2][2] - b[2][0], b[2][3] - b[2][1]) >= MIN_TILE_SIDE]
+    for start in range(0, len(scored), batch_size):
+        batch = scored[start:start + batch_size]
+        tiles = [img.crop(box) for _, _, box in batch]
+        for (row, col, box), (ai_probability, ela) in zip(batch, score_fn(tiles)):
+            ai_map[row][col] = ai_probability
+            ela_map[row][col] = ela
+            if ai_probability is not None and ai_probability >= SUSPICIOUS_TILE_PROBABILITY:
+                suspicious.append({
+                    "row": row, "col": col,
+                    "box": [round(v * scale) for v in box],
+                    "ai_probability": ai_probability, "ela_score": ela,
+                })
+        del tiles
+
+    ai_values = [v for line in ai_map for v in line if v is not None]
+    suspicious.sort(key=lambda t: t["ai_probability"], reverse=True)
+    return {
+        "tile_size": round(size * scale),
+        "working_scale": scale,
+        "grid": [rows, cols],
+        "heatmap": ai_map,
+        "ela_heatmap": ela_map,
+        "max_ai_probability": max(ai_values) if ai_values else None,
+        "suspicious_tiles": suspicious,
+    }
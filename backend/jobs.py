@@ -0,0 +1,257 @@
+"""
+Background analysis jobs (/jobs/analyze).
+
+Jobs are rows in the analysis_jobs table, so queued work survives a restart.
+A fixed number of asyncio workers claim the oldest queued job, run it and
+store the result; the table doubles as the queue and gives backpressure
+(the API refuses new jobs once too many are waiting).
+"""
+import asyncio
+import datetime
+import json
+import threading
+import uuid
+
+from database import SessionLocal, AnalysisJob
+from executors import run_io
+
+_claim_lock = threading.Lock()
+_submit_lock = threading.Lock()
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def jsonable(value):
+    """Round-trip through JSON so numpy scalars/arrays fit a JSON column"""
+    def default(obj):
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        return str(obj)
+    return json.loads(json.dumps(value, default=default))
+
+
+# --- Queue table ---
+
+def create_job(filename, upload_path, cache_key, params):
+    db = SessionLocal()
+    try:
+        job = AnalysisJob(
+            id=uuid.uuid4().hex, status="queued", filename=filename, upload_path=upload_path,
+            cache_key=cache_key, params=params, progress={}, partial={},
+        )
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def submit_job(filename, upload_path, cache_key, params):
+    """
+    Queue a job unless one for the same upload and settings is already queued
+    or running. Returns (job id, created). The lock makes check + insert
+    atomic, so two identical submissions at once still create one job.
+    """
+    with _submit_lock:
+        existing = find_active_job(cache_key)
+        if existing is not None:
+            return existing, False
+        return create_job(filename, upload_path, cache_key, params), True
+
+
+def find_active_job(cache_key):
+    """Queued or running job for the same upload and settings (client retries)"""
+    db = SessionLocal()
+    try:
+        job = (db.query(AnalysisJob.id)
+               .filter(AnalysisJob.cache_key == cache_key, AnalysisJob.status.in_(("queued", "running")))
+               .first())
+        return job[0] if job else None
+    finally:
+        db.close()
+
+
+def queued_count():
+    db = SessionLocal()
+    try:
+        return db.query(AnalysisJob).filter(AnalysisJob.status == "queued").count()
+    finally:
+        db.close()
+
+
+def claim_next_job():
+    """Mark the oldest queued job as running and return it (None if the queue is empty)"""
+    with _claim_lock:  # Workers share one process; the lock makes select + update atomic
+        db = SessionLocal()
+        try:
+            job = (db.query(AnalysisJob).filter(AnalysisJob.status == "queued")
+                   .order_by(AnalysisJob.created_at).first())
+            if job is None:
+                return None
+            job.status = "running"
+            job.started_at = _utcnow()
+            job.attempts = (job.attempts or 0) + 1
+            db.commit()
+            return {"id": job.id, "filename": job.filename, "upload_path": job.upload_path,
+                    "cache_key": job.cache_key, "params": dict(job.params or {})}
+        finally:
+            db.close()
+
+
+def update_job(job_id, **fields):
+    if fields.get("status") in ("done", "failed"):
+        fields.setdefault("finished_at", _utcnow())
+    db = SessionLocal()
+    try:
+        db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+def requeue_interrupted_jobs(max_attempts=3):
+    """
+    Jobs left "running" by a previous process go back to the queue, unless
+    they already had `max_attempts` runs: a job that takes the process down
+    every time is failed instead of retried on every restart.
+    Returns (requeued count, upload paths of the jobs given up on).
+    """
+    db = SessionLocal()
+    try:
+        interrupted = db.query(AnalysisJob).filter(AnalysisJob.status == "running")
+        exhausted = interrupted.filter(AnalysisJob.attempts >= max_attempts).all()
+        uploads = [job.upload_path for job in exhausted if job.upload_path]
+        for job in exhausted:
+            job.status = "failed"
+            job.error = f"Interrupted {job.attempts} times, giving up."
+            job.finished_at = _utcnow()
+            job.upload_path = None
+        db.flush()
+        count = interrupted.update({"status": "queued", "progress": {}, "partial": {}}, synchronize_session=False)
+        db.commit()
+        return count, uploads
+    finally:
+        db.close()
+
+
+def get_job(job_id):
+    db = SessionLocal()
+    try:
+        job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+        if job is None:
+            return None
+        info = {
+            "job_id": job.id,
+            "status": job.status,
+            "filename": job.filename,
+            "params": job.params,
+            "progress": job.progress or {},
+            "partial": job.partial or {},
+            "result": job.result,
+            "error": job.error,
+            "log_id": job.log_id,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+        if job.status == "queued":
+            info["queue_position"] = (db.query(AnalysisJob)
+                                      .filter(AnalysisJob.status == "queued",
+                                              AnalysisJob.created_at < job.created_at)
+                                      .count()) + 1
+        return info
+    finally:
+        db.close()
+
+
+# --- Progress reporting ---
+
+class JobProgress:
+    """
+    StageGraph on_stage callback that mirrors stage status (and, through
+    `partial_fn`, the results of finished stages) into the job row. Writes
+    are coalesced: at most one DB update is in flight per job.
+    """
+
+    def __init__(self, job_id, partial_fn=None):
+        self.job_id = job_id
+        self.partial_fn = partial_fn
+        self.stages = {}
+        self.partial = {}
+        self._dirty = False
+        self._flusher = None
+
+    def __call__(self, name, status, result=None):
+        self.stages[name] = status
+        if status == "done" and self.partial_fn is not None:
+            partial = self.partial_fn(name, result)
+            if partial:
+                self.partial.update(jsonable(partial))
+        self._dirty = True
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+
+    async def _flush(self):
+        while self._dirty:
+            self._dirty = False
+            try:
+                await run_io(update_job, self.job_id, progress=dict(self.stages), partial=dict(self.partial))
+            except Exception as e:
+                print(f"Job progress update error: {e}")
+
+    async def wait(self):
+        if self._flusher is not None:
+            await self._flusher
+
+
+# --- Workers ---
+
+class JobWorkerPool:
+    """`workers` asyncio tasks running `process(job)` for claimed jobs"""
+
+    def __init__(self, process, workers=2, poll_seconds=2.0):
+        self.process = process
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._tasks = []
+        self._wake = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._run(i)) for i in range(self.workers)]
+        print(f"✅ Job workers started: {self.workers}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers (a job was queued)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self, index):
+        while True:
+            self._wake.clear()  # Before claiming, so a job queued meanwhile is not missed
+            try:
+                job = await run_io(claim_next_job)
+            except Exception as e:
+                print(f"Job claim error: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # process() records its own failures; this only guards the worker loop
+                print(f"Job worker {index} error: {e}")
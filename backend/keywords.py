@@ -0,0 +1,130 @@
+"""
+Transcript keyword risk scoring.
+
+The keyword table is compiled once into an Aho-Corasick automaton, so one
+pass over the text finds every phrase no matter how large the table grows.
+Whitespace is skipped while matching ("대포 통장" matches "대포통장"), and a
+KeywordStream keeps its automaton state between fed fragments, so a phrase
+split across two STT segments is still found.
+"""
+import json
+import os
+from collections import deque
+
+DEFAULT_KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keywords.json")
+
+
+def _strip(text):
+    return "".join(text.split())
+
+
+def risk_score_for(weights):
+    """
+    Risk score (0-100) for the weights of the detected keywords.
+    Any high-risk keyword (>= 20) lifts the score to the alert level (60),
+    any moderate one (>= 15) to the warning level (35).
+    """
+    score = sum(weights)
+    if any(w >= 20 for w in weights):
+        score = max(score, 60)
+    elif any(w >= 15 for w in weights):
+        score = max(score, 35)
+    return min(score, 100)
+
+
+class KeywordScanner:
+    """Aho-Corasick automaton over a {phrase: weight} table"""
+
+    def __init__(self, keywords):
+        self.weights = {}
+        self._goto = [{}]  # state -> {char: state}
+        self._fail = [0]
+        self._output = [()]  # state -> phrases ending here (incl. via fail links)
+
+        for phrase, weight in keywords.items():
+            pattern = _strip(phrase)
+            if not pattern:
+                continue
+            self.weights[phrase] = weight
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = nxt
+            self._output[state] = self._output[state] + (phrase,)
+
+        # Breadth-first fail links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def step(self, state, ch):
+        """Automaton transition for one (non-space) character"""
+        while state and ch not in self._goto[state]:
+            state = self._fail[state]
+        return self._goto[state].get(ch, 0)
+
+    def matches(self, state):
+        """Phrases ending at `state`"""
+        return self._output[state]
+
+    def stream(self):
+        return KeywordStream(self)
+
+    def analyze(self, text):
+        """One-shot scoring: (detected keywords, risk score)"""
+        stream = self.stream()
+        stream.feed(text)
+        return stream.detected, stream.risk_score
+
+
+class KeywordStream:
+    """Incremental scorer: feed transcript fragments as they arrive"""
+
+    def __init__(self, scanner):
+        self.scanner = scanner
+        self._state = 0
+        self.detected = []  # In order of first appearance, each counted once
+        self._seen = set()
+
+    def feed(self, fragment):
+        """Scan one fragment; returns the keywords it newly detected"""
+        new = []
+        for ch in fragment or "":
+            if ch.isspace():
+                continue
+            self._state = self.scanner.step(self._state, ch)
+            for phrase in self.scanner.matches(self._state):
+                if phrase not in self._seen:
+                    self._seen.add(phrase)
+                    self.detected.append(phrase)
+                    new.append(phrase)
+        return new
+
+    @property
+    def risk_score(self):
+        return risk_score_for([self.scanner.weights[w] for w in self.detected])
+
+
+def load_keywords(path=None):
+    """{phrase: weight} from a JSON file ({"keywords": {...}} or a flat object)"""
+    path = path or os.environ.get("VOICESHIELD_KEYWORDS_PATH", DEFAULT_KEYWORDS_PATH)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    table = data.get("keywords", data)
+    return {str(phrase): int(weight) for phrase, weight in table.items() if not str(phrase).startswith("_")}
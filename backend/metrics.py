@@ -0,0 +1,97 @@
+"""
+Process-wide histograms, exported in the Prometheus text format at /metrics.
+"""
+import threading
+
+# Default buckets (seconds) for latency-style histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram (Prometheus-style buckets)"""
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS, labels=None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+                running += count
+                cumulative.append(("+Inf" if bound == float("inf") else bound, running))
+            return {
+                "name": self.name,
+                "labels": dict(self.labels),
+                "buckets": cumulative,
+                "sum": self._sum,
+                "count": self._count,
+                "mean": self._sum / self._count if self._count else 0.0,
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, description, buckets=LATENCY_BUCKETS, labels=None):
+    """Get or create a process-wide histogram by name (and label values)"""
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = Histogram(name, description, buckets, labels)
+        return _registry[key]
+
+
+def all_histograms():
+    with _registry_lock:
+        return list(_registry.values())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels, extra=None):
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items.items()) + "}"
+
+
+def render_prometheus():
+    """All histograms in the Prometheus text exposition format (0.0.4)"""
+    families = {}
+    for hist in all_histograms():
+        families.setdefault(hist.name, []).append(hist)
+
+    lines = []
+    for name in sorted(families):
+        members = families[name]
+        lines.append(f"# HELP {name} {members[0].description}")
+        lines.append(f"# TYPE {name} histogram")
+        for hist in members:
+            snap = hist.snapshot()
+            for bound, count in snap["buckets"]:
+                lines.append(f"{name}_bucket{_label_str(hist.labels, {'le': bound})} {count}")
+            lines.append(f"{name}_sum{_label_str(hist.labels)} {snap['sum']}")
+            lines.append(f"{name}_count{_label_str(hist.labels)} {snap['count']}")
+    return "\n".join(lines) + "\n"
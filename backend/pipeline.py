@@ -0,0 +1,191 @@
+"""
+Analysis profiles, the stage planner and the stage graph for /analyze.
+
+fast:     deepfake verdict only (CNN-LSTM [+ HF ensemble])
+standard: + whole-file context (STT, keywords, summary) and Voice ID
+full:     + diarization, per-speaker age/gender and speaker transcript
+
+The planner starts from the requested profile and escalates when a cheap
+stage crosses a risk threshold, so callers can ask for "fast" and still get
+the full report when it matters.
+
+StageGraph runs the stages as a dependency graph: every stage names the
+results it needs, independent stages run concurrently on the executor
+pools, and a stage starts as soon as its inputs are ready.
+"""
+import asyncio
+
+from executors import run_dsp, run_inference, run_io
+
+PROFILES = ("fast", "standard", "full")
+
+PROFILE_STAGES = {
+    "fast": ("deepfake",),
+    "standard": ("deepfake", "context", "voice_id"),
+    "full": ("deepfake", "context", "voice_id", "diarization"),
+}
+
+
+class StagePlanner:
+    """
+    Escalation rules:
+    - deepfake score in the uncertain zone (low < score < moderate) -> standard
+    - deepfake score at or above the moderate threshold            -> full
+    - any detected keyword with weight >= high_risk_weight         -> full
+    """
+
+    def __init__(self, profile="full", low=0.30, moderate=0.55, high_risk_weight=20):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown analysis profile: {profile} (expected one of {', '.join(PROFILES)})")
+        self.requested = profile
+        self.profile = profile
+        self.low = low
+        self.moderate = moderate
+        self.high_risk_weight = high_risk_weight
+        self.escalations = []
+
+    def wants(self, stage):
+        return stage in PROFILE_STAGES[self.profile]
+
+    def escalate(self, profile, reason):
+        if PROFILES.index(profile) <= PROFILES.index(self.profile):
+            return False
+        self.escalations.append({"from": self.profile, "to": profile, "reason": reason})
+        self.profile = profile
+        return True
+
+    def observe_deepfake(self, score):
+        if score >= self.moderate:
+            self.escalate("full", f"deepfake score {score:.2f} >= {self.moderate}")
+        elif score > self.low:
+            self.escalate("standard", f"deepfake score {score:.2f} in uncertain zone")
+
+    def observe_context(self, context, weights):
+        """`weights`: the keyword table ({phrase: weight})"""
+        if not context:
+            return
+        risky = [w for w in context.get("detected_keywords", []) if weights.get(w, 0) >= self.high_risk_weight]
+        if risky:
+            self.escalate("full", f"high-risk keywords: {', '.join(risky)}")
+
+    def as_dict(self):
+        return {
+            "requested_profile": self.requested,
+            "profile": self.profile,
+            "stages": list(PROFILE_STAGES[self.profile]),
+            "escalations": list(self.escalations),
+        }
+
+
+_POOLS = {"inference": run_inference, "io": run_io, "dsp": run_dsp}
+
+
+class Stage:
+    def __init__(self, name, fn, deps=(), optional=(), pool="async", when=None, gates=()):
+        if pool != "async" and pool not in _POOLS:
+            raise ValueError(f"Unknown pool: {pool}")
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.optional = tuple(optional)
+        self.pool = pool
+        self.when = when
+        self.gates = tuple(gates)
+
+
+class StageGraph:
+    """
+    Small async DAG executor.
+
+    - deps: results the stage needs; the stage is skipped if one was skipped
+    - optional: results it waits for but accepts as None (skipped)
+    - pool: "inference" | "io" | "dsp" for sync functions, "async" for coroutines
+    - when/gates: run condition. While `when()` is False the stage waits for
+      its gate stages (whose results may change the answer, e.g. profile
+      escalation) and is skipped once they are all done.
+
+    `fn` is called with the dependency results as keyword arguments.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, fn, deps=(), optional=(), pool="async", when=None, gates=()):
+        for gate in gates:
+            if gate not in self.stages:  # Gates must be earlier stages too
+                raise ValueError(f"Stage '{name}' is gated on unknown stage '{gate}'")
+        self.stages[name] = Stage(name, fn, deps, optional, pool, when, gates)
+        return self
+
+    async def _should_run(self, stage, done):
+        if stage.when is None:
+            return True
+        while not stage.when():
+            pending = [done[g] for g in stage.gates if not done[g].is_set()]
+            if not pending:
+                return False
+            waiters = [asyncio.ensure_future(event.wait()) for event in pending]
+            try:
+                await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+        return True
+
+    async def run(self, on_stage=None, **inputs):
+        """
+        Run every stage; returns {name: result} (None for skipped stages) and
+        the skipped names. `on_stage(name, status, result=None)` is called on
+        the event loop as stages become "running", "done", "skipped" or "failed".
+        """
+        def report(name, status, result=None):
+            if on_stage is not None:
+                try:
+                    on_stage(name, status, result)
+                except Exception as e:
+                    print(f"Stage callback error ({name}): {e}")
+
+        # Stages only depend on inputs or on earlier stages, so the graph has no cycles
+        order = {name: i for i, name in enumerate(self.stages)}
+        for stage in self.stages.values():
+            for dep in stage.deps + stage.optional:
+                if dep not in inputs and order.get(dep, len(order)) >= order[stage.name]:
+                    raise ValueError(f"Stage '{stage.name}' depends on '{dep}', which is neither an input nor an earlier stage")
+        results = dict(inputs)
+        skipped = set()
+        done = {name: asyncio.Event() for name in self.stages}
+
+        async def run_stage(stage):
+            try:
+                for dep in stage.deps + stage.optional:
+                    if dep in done:
+                        await done[dep].wait()
+                if any(dep in skipped for dep in stage.deps) or not await self._should_run(stage, done):
+                    skipped.add(stage.name)
+                    results[stage.name] = None
+                    report(stage.name, "skipped")
+                    return
+                kwargs = {dep: results.get(dep) for dep in stage.deps + stage.optional}
+                report(stage.name, "running")
+                try:
+                    if stage.pool == "async":
+                        results[stage.name] = await stage.fn(**kwargs)
+                    else:
+                        results[stage.name] = await _POOLS[stage.pool](stage.fn, **kwargs)
+                except Exception:
+                    report(stage.name, "failed")
+                    raise
+                report(stage.name, "done", results[stage.name])
+            finally:
+                done[stage.name].set()
+
+        tasks = [asyncio.ensure_future(run_stage(stage)) for stage in self.stages.values()]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One stage failed (or the request was cancelled): stop the rest
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return results, skipped
@@ -0,0 +1,232 @@
+"""
+Content-hash result cache for /analyze and /analyze_image.
+
+Keys are SHA-256 digests of the upload bytes plus a model/config version
+tag. Results are stored serialized, so both tiers can evict by size
+and every hit hands out an independent copy. Disk reads and writes run on
+the io thread pool, never on the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from executors import run_io
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def copy_and_hash(src, dst):
+    """Copy a file object in chunks while computing its SHA-256 (one pass)"""
+    digest = hashlib.sha256()
+    while True:
+        chunk = src.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        dst.write(chunk)
+    return digest.hexdigest()
+
+
+def make_key(kind, content_hash, version, **params):
+    parts = [kind, content_hash, version] + [f"{k}={params[k]}" for k in sorted(params)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _json_default(obj):
+    # numpy scalars / arrays that slip into results
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+class ResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()  # key -> serialized bytes, LRU order
+        self._bytes = 0
+        self._disk_entries = OrderedDict()  # key -> file size, LRU order
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> asyncio.Future (single-flight)
+        self.stats_counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "coalesced": 0, "evictions": 0, "disk_evictions": 0, "errors": 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    # --- Storage tiers ---
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key, payload):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            if len(payload) > self.max_bytes:
+                return
+            self._entries[key] = payload
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.stats_counters["evictions"] += 1
+
+    def _scan_disk(self):
+        """Index existing files; modification times (touched on every hit) give the LRU order"""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        self._prune_disk()
+
+    def _prune_disk(self):
+        evicted = []
+        with self._lock:
+            while self._disk_bytes > self.max_disk_bytes and self._disk_entries:
+                key, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                self.stats_counters["disk_evictions"] += 1
+                evicted.append(key)
+        for key in evicted:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError as e:
+                print(f"Result cache prune error: {e}")
+
+    def _read_disk(self, key):
+        with self._lock:
+            if key not in self._disk_entries:
+                return None
+            self._disk_entries.move_to_end(key)
+        try:
+            path = self._disk_path(key)
+            with open(path, "rb") as f:
+                payload = f.read()
+            os.utime(path)  # Keeps the LRU order across restarts
+        except OSError as e:
+            print(f"Result cache read error: {e}")
+            return None
+        self._remember(key, payload)  # Promote to memory
+        with self._lock:
+            self.stats_counters["disk_hits"] += 1
+        return payload
+
+    def _write_disk(self, key, payload):
+        if len(payload) > self.max_disk_bytes:
+            return
+        try:
+            tmp = self._disk_path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, self._disk_path(key))
+        except OSError as e:
+            print(f"Result cache write error: {e}")
+            return
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = len(payload)
+            self._disk_bytes += len(payload)
+        self._prune_disk()
+
+    async def _lookup(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.stats_counters["memory_hits"] += 1
+                return payload
+        if self.disk_dir:
+            return await run_io(self._read_disk, key)
+        return None
+
+    async def get(self, key):
+        payload = await self._lookup(key)
+        return json.loads(payload) if payload is not None else None
+
+    async def put(self, key, result):
+        payload = json.dumps(result, default=_json_default).encode("utf-8")
+        self._remember(key, payload)
+        if self.disk_dir:
+            await run_io(self._write_disk, key, payload)
+        return payload
+
+    # --- Single-flight ---
+
+    async def get_or_compute(self, key, compute):
+        """
+        Cached result for `key`, or await `compute()` once. Concurrent callers
+        with the same key wait on the first computation instead of repeating it.
+        Returns (result, status) with status "hit", "coalesced" or "miss".
+        If the caller running the computation is cancelled (client gone), the
+        callers waiting on it start over instead of failing with it.
+        """
+        while True:
+            payload = await self._lookup(key)
+            if payload is not None:
+                return json.loads(payload), "hit"
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            with self._lock:
+                self.stats_counters["coalesced"] += 1
+            try:
+                payload = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # This caller was cancelled, not the computation
+                continue
+            return json.loads(payload), "coalesced"
+
+        with self._lock:
+            self.stats_counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+            future.set_result(await self.put(key, result))
+            return result, "miss"
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            with self._lock:
+                self.stats_counters["errors"] += 1
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.stats_counters)
+            entries = len(self._entries)
+            size = self._bytes
+            disk_entries = len(self._disk_entries)
+            disk_size = self._disk_bytes
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["coalesced"] + counters["misses"]
+        hits = lookups - counters["misses"]
+        return {
+            **counters,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "disk_enabled": bool(self.disk_dir),
+            "disk_entries": disk_entries,
+            "disk_bytes": disk_size,
+            "max_disk_bytes": self.max_disk_bytes,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,12 @@
+"""
+Backend entry point: `python serve.py`
+(same as `uvicorn server:app --host 0.0.0.0 --port 8000`).
+
+The DSP process pool spawns workers that re-import the __main__ module.
+Starting from this module keeps that import cheap: server.py, with its
+models and TensorFlow, is only imported by uvicorn in the parent process.
+"""
+import uvicorn
+
+if __name__ == "__main__":
+    uvicorn.run("server:app", host="0.0.0.0", port=8000)
@@ -7,21 +7,43 @@ os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
 os.environ["HF_HUB_DISABLE_SYMLINKS"] = "1"
 
 from contextlib import asynccontextmanager
+import asyncio
+import concurrent.futures
 import numpy as np
-import librosa
 import tensorflow as tf
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List
 import shutil
 import tempfile
+import zipfile
 import speech_recognition as sr
-from scipy.spatial.distance import cosine
 import json
 from fastapi import Form, Depends
-from PIL import Image, ImageChops, ImageEnhance, ImageStat
+from PIL import Image
 from sqlalchemy.orm import Session
-from database import init_db, get_db, Voice, AnalysisLog
+from database import init_db, get_db, SessionLocal, Voice, AnalysisLog, ImageVerdict, load_fingerprint
+from batching import MicroBatcher
+from stt import create_backend, GoogleSTT
+from image_forensics import error_level_analysis, ela_score
+from image_ensemble import ImageEnsemble, combine_predictions
+from image_hash_index import NearDuplicateIndex, image_hashes, to_hex
+from image_tiles import ImageTooLarge, image_size, open_working_image, overview, scan_tiles, TILE_SIZE, TILED_MAX_PIXELS, TILED_AUTO_PIXELS
+from spectral import radial_spectrum, SPECTRAL_CROP, SPECTRAL_TILES
+from tracing import stage, traced, timed_call, record_stage, observe_input, start_trace
+from metrics import render_prometheus
+from pipeline import StagePlanner, StageGraph, PROFILES
+from jobs import (JobWorkerPool, JobProgress, jsonable, submit_job, queued_count,
+                  update_job, requeue_interrupted_jobs, get_job)
+from keywords import KeywordScanner, load_keywords, risk_score_for
+from diarization import extract_embeddings, online_speaker_labels, OnlineSpeakerClusterer
+from voice_index import VoiceIndex
+from result_cache import ResultCache, copy_and_hash, make_key
+import hashlib
+import demographics
 import datetime
+import threading
 from transformers import AutoImageProcessor, AutoModelForImageClassification
 import torch
 import torchaudio
@@ -31,13 +53,17 @@ if not hasattr(torchaudio, 'list_audio_backends'):
     torchaudio.list_audio_backends = lambda: ['soundfile']
 
 import torch.nn.functional as F
-import cv2
 from speechbrain.inference.classifiers import EncoderClassifier
 from sklearn.cluster import AgglomerativeClustering
 
 MODEL_PATH = "best_model.h5"
 model = None
 
+# Cross-request micro-batching for the CNN-LSTM model
+CNN_BATCH_MAX_SIZE = int(os.environ.get("VOICESHIELD_CNN_BATCH_MAX_SIZE", "16"))
+CNN_BATCH_WINDOW_MS = float(os.environ.get("VOICESHIELD_CNN_BATCH_WINDOW_MS", "5"))
+cnn_batcher = None
+
 # Secondary audio deepfake detection using transformers
 # Secondary audio deepfake detection using transformers
 AUDIO_HF_MODEL_NAME = None # Disabled to prevent mix-up or 404
@@ -49,24 +75,35 @@ AI_MODEL_NAMES = [
     "umm-maybe/AI-image-detector",
     "Organika/sdxl-detector",  # Better SDXL detection
 ]
-ai_models = []
-ai_models = []
-ai_processors = []
+image_ensemble = ImageEnsemble()
 
 # Age/Gender Recognition Model
 AGE_GENDER_MODEL_NAME = "audeering/wav2vec2-large-robust-24-ft-age-gender"
 age_gender_model = None
 age_gender_processor = None
 
+# Chunks per wav2vec2 forward pass; early stop ends voting once converged
+AGE_GENDER_BATCH_SIZE = int(os.environ.get("VOICESHIELD_AGE_GENDER_BATCH_SIZE", "8"))
+AGE_GENDER_EARLY_STOP = os.environ.get("VOICESHIELD_AGE_GENDER_EARLY_STOP", "0") == "1"
+
 # Summarization Model (Korean)
 SUMMARIZATION_MODEL_NAME = "gogamza/kobart-summarization"
 summarization_pipeline = None
 
 def load_model():
-    global model
+    global model, cnn_batcher
     if os.path.exists(MODEL_PATH):
         try:
             model = tf.keras.models.load_model(MODEL_PATH)
+            if cnn_batcher is not None:
+                cnn_batcher.stop()
+            # predict_on_batch skips the per-call setup that model.predict pays
+            cnn_batcher = MicroBatcher(
+                lambda X: model.predict_on_batch(X),
+                max_batch_size=CNN_BATCH_MAX_SIZE,
+                max_wait_ms=CNN_BATCH_WINDOW_MS,
+                name="cnn_lstm",
+            ).start()
             print(f"✅ Audio Model loaded from {MODEL_PATH}")
         except Exception as e:
             print(f"❌ Failed to load audio model: {e}")
@@ -91,14 +128,12 @@ def load_audio_hf_model():
         # Continue without secondary model
 
 def load_ai_model():
-    global ai_models, ai_processors
     for model_name in AI_MODEL_NAMES:
         try:
             print(f"⏳ Loading AI Image Detection Model: {model_name}...")
             processor = AutoImageProcessor.from_pretrained(model_name)
             model = AutoModelForImageClassification.from_pretrained(model_name)
-            ai_processors.append(processor)
-            ai_models.append(model)
+            image_ensemble.add(model_name, processor, model)
             print(f"✅ AI Image Model loaded: {model_name}")
         except Exception as e:
             print(f"⚠️ Failed to load {model_name}: {e}")
@@ -143,6 +178,162 @@ def load_speaker_recognition_model():
         if "WinError 1314" in str(e):
              print("💡 TIP: Try running the terminal as Administrator or enable Developer Mode in Windows Settings.")
 
+# Max padded audio per ECAPA encode_batch call during diarization
+DIARIZATION_MAX_BATCH_SECONDS = float(os.environ.get("VOICESHIELD_DIARIZATION_MAX_BATCH_SECONDS", "60"))
+
+# Deepfake confidence zones for the (ensembled) CNN-LSTM score
+THRESHOLD_HIGH_CONFIDENCE = 0.70  # High confidence deepfake
+THRESHOLD_MODERATE = 0.55          # Moderate confidence deepfake
+THRESHOLD_LOW_CONFIDENCE = 0.30    # High confidence real
+
+# /analyze profiles (fast | standard | full, see pipeline.py). "full" runs every
+# stage, as before; a keyword at least this heavy escalates to "full"
+ANALYSIS_DEFAULT_PROFILE = os.environ.get("VOICESHIELD_ANALYSIS_PROFILE", "full")
+ANALYSIS_ESCALATION_KEYWORD_WEIGHT = 20
+
+# Sliding-window scoring ("windowed" mode): 3s model windows over the whole call
+SCORING_MODES = ("head", "windowed")  # first 3s, or every window of the recording
+WINDOW_SECONDS = 3
+WINDOW_HOP_SECONDS = float(os.environ.get("VOICESHIELD_WINDOW_HOP_SECONDS", "1.5"))
+WINDOW_CHUNK = int(os.environ.get("VOICESHIELD_WINDOW_CHUNK", "64"))  # windows materialized at once
+
+# Diarization clustering: "batch" (agglomerative over all segments) or
+# "online" (running centroids, bounded memory, for long/streaming audio)
+DIARIZATION_MODE = os.environ.get("VOICESHIELD_DIARIZATION_MODE", "batch")
+DIARIZATION_ONLINE_THRESHOLD = float(os.environ.get("VOICESHIELD_DIARIZATION_THRESHOLD", "0.7"))  # cosine distance
+DIARIZATION_MAX_SPEAKERS = int(os.environ.get("VOICESHIELD_DIARIZATION_MAX_SPEAKERS", "8"))
+DIARIZATION_RECLUSTER = os.environ.get("VOICESHIELD_DIARIZATION_RECLUSTER", "1") == "1"
+
+# Voice Activity Detection (Silero), loaded once and shared by all requests.
+# Point VOICESHIELD_VAD_DIR at a local checkout of snakers4/silero-vad so
+# offline containers never hit the hub. The hub fallback follows the default
+# branch, as before; set VOICESHIELD_VAD_HUB_REPO (e.g. "snakers4/silero-vad:v4.0") to pin it.
+VAD_HUB_REPO = os.environ.get("VOICESHIELD_VAD_HUB_REPO", "snakers4/silero-vad")
+VAD_MODEL_DIR = os.environ.get(
+    "VOICESHIELD_VAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "silero-vad"),
+)
+vad_model = None
+vad_get_speech_timestamps = None
+vad_lock = threading.Lock()
+
+def load_vad_model():
+    global vad_model, vad_get_speech_timestamps
+    try:
+        if os.path.isdir(VAD_MODEL_DIR):
+            print(f"⏳ Loading Silero VAD from {VAD_MODEL_DIR}...")
+            vad_model, utils = torch.hub.load(repo_or_dir=VAD_MODEL_DIR, model='silero_vad', source='local', trust_repo=True)
+        else:
+            print(f"⚠️ VAD directory not found at {VAD_MODEL_DIR}, loading {VAD_HUB_REPO} from torch hub cache...")
+            vad_model, utils = torch.hub.load(repo_or_dir=VAD_HUB_REPO, model='silero_vad', force_reload=False, trust_repo=True)
+        (vad_get_speech_timestamps, _, _, _, _) = utils
+        print("✅ Silero VAD loaded")
+    except Exception as e:
+        print(f"⚠️ Failed to load Silero VAD: {e}")
+
+def detect_speech(wav, sr=16000):
+    """
+    Speech timestamps (in samples) for a 1D float tensor.
+    Silero keeps recurrent state inside the model, so calls are serialized.
+    """
+    if vad_model is None:
+        raise RuntimeError("VAD model not loaded")
+    with vad_lock:
+        return vad_get_speech_timestamps(wav, vad_model, sampling_rate=sr)
+
+# Speech-to-text backend (VOICESHIELD_STT_BACKEND=google|mock)
+stt_backend = None
+
+def load_stt_backend():
+    global stt_backend
+    try:
+        stt_backend = create_backend()
+    except ValueError as e:
+        print(f"⚠️ {e}, falling back to Google STT")
+        stt_backend = GoogleSTT()
+    print(f"✅ STT backend: {stt_backend.name}")
+
+# Transcript keyword scanner (Aho-Corasick over keywords.json / VOICESHIELD_KEYWORDS_PATH)
+keyword_scanner = KeywordScanner({})
+# Segment STT stops once the keyword risk reaches this (100 = the cap, so the score never changes)
+KEYWORD_STOP_SCORE = int(os.environ.get("VOICESHIELD_KEYWORD_STOP_SCORE", "100"))
+
+def load_keyword_scanner():
+    global keyword_scanner
+    try:
+        keyword_scanner = KeywordScanner(load_keywords())
+        print(f"✅ Keyword scanner loaded ({len(keyword_scanner)} phrases)")
+    except Exception as e:
+        print(f"⚠️ Failed to load keyword table: {e}")
+
+# In-memory Voice ID index (optionally persisted/memory-mapped at VOICESHIELD_VOICE_INDEX_PATH)
+voice_index = VoiceIndex(path=os.environ.get("VOICESHIELD_VOICE_INDEX_PATH"))
+
+def load_voice_index():
+    db = SessionLocal()
+    try:
+        rows = db.query(Voice.name, Voice.fingerprint_blob, Voice.fingerprint).all()
+        items = [(name, load_fingerprint(blob, legacy)) for name, blob, legacy in rows]
+        if voice_index.load_persisted(items):
+            print(f"✅ Voice index memory-mapped: {len(voice_index)} voices")
+            return
+        voice_index.load(items)
+        print(f"✅ Voice index built: {len(voice_index)} voices")
+    except Exception as e:
+        print(f"⚠️ Failed to build voice index: {e}")
+    finally:
+        db.close()
+
+# Content-hash result cache (memory LRU + optional disk tier next to voiceshield.db)
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("VOICESHIELD_RESULT_CACHE_MB", "64")) * 1024 * 1024)
+RESULT_CACHE_DIR = "./result_cache" if os.environ.get("VOICESHIELD_RESULT_CACHE_DISK", "0") == "1" else None
+RESULT_CACHE_DISK_MAX_BYTES = int(float(os.environ.get("VOICESHIELD_RESULT_CACHE_DISK_MB", "512")) * 1024 * 1024)
+RESULT_CACHE_SCHEMA = "6"  # Bump when the response format or pipeline logic changes
+result_cache = ResultCache(max_bytes=RESULT_CACHE_MAX_BYTES, disk_dir=RESULT_CACHE_DIR,
+                           max_disk_bytes=RESULT_CACHE_DISK_MAX_BYTES)
+ANALYSIS_CACHE_VERSION = None
+IMAGE_CACHE_VERSION = None
+
+def compute_cache_versions():
+    """Version tags so cached results are dropped when models or settings change"""
+    global ANALYSIS_CACHE_VERSION, IMAGE_CACHE_VERSION
+    model_stamp = "missing"
+    if os.path.exists(MODEL_PATH):
+        stat = os.stat(MODEL_PATH)
+        model_stamp = f"{stat.st_size}-{int(stat.st_mtime)}"
+    audio_parts = [
+        RESULT_CACHE_SCHEMA, model_stamp, AUDIO_HF_MODEL_NAME, AGE_GENDER_MODEL_NAME,
+        SUMMARIZATION_MODEL_NAME, SPEAKER_MODEL_NAME, VAD_HUB_REPO,
+        THRESHOLD_HIGH_CONFIDENCE, THRESHOLD_MODERATE, THRESHOLD_LOW_CONFIDENCE, ANALYSIS_ESCALATION_KEYWORD_WEIGHT,
+        WINDOW_SECONDS, WINDOW_HOP_SECONDS, stt_backend.name if stt_backend else None, sorted(keyword_scanner.weights.items()),
+        KEYWORD_STOP_SCORE,
+    ]
+    image_parts = [RESULT_CACHE_SCHEMA, SPECTRAL_CROP, SPECTRAL_TILES, TILE_SIZE, TILED_MAX_PIXELS] + [name for name in AI_MODEL_NAMES]
+    ANALYSIS_CACHE_VERSION = hashlib.sha256(repr(audio_parts).encode()).hexdigest()[:16]
+    IMAGE_CACHE_VERSION = hashlib.sha256(repr(image_parts).encode()).hexdigest()[:16]
+
+# Near-duplicate image verdicts (re-compressed/resized copies), persisted in image_verdicts
+near_duplicates = NearDuplicateIndex()
+
+def load_near_duplicate_index():
+    """Needs IMAGE_CACHE_VERSION: verdicts from other model/settings versions are dropped"""
+    db = SessionLocal()
+    try:
+        stale = (db.query(ImageVerdict).filter(ImageVerdict.cache_version != IMAGE_CACHE_VERSION)
+                 .delete(synchronize_session=False))
+        rows = (db.query(ImageVerdict.id, ImageVerdict.phash, ImageVerdict.dhash, ImageVerdict.variant)
+                .order_by(ImageVerdict.last_used_at).all())
+        evicted = near_duplicates.load((row_id, int(ph, 16), int(dh, 16), variant) for row_id, ph, dh, variant in rows)
+        if evicted:
+            db.query(ImageVerdict).filter(ImageVerdict.id.in_(evicted)).delete(synchronize_session=False)
+        db.commit()
+        print(f"✅ Near-duplicate image index: {len(near_duplicates)} verdicts" + (f" ({stale} stale dropped)" if stale else ""))
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Failed to load near-duplicate image index: {e}")
+    finally:
+        db.close()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     load_model()
@@ -153,10 +344,29 @@ async def lifespan(app: FastAPI):
     load_age_gender_model()
     load_summarization_model()
     load_speaker_recognition_model()
+    load_vad_model()
+    load_keyword_scanner()
+    load_stt_backend()
     init_db()
     init_db()
     print("✅ Database initialized.")
+    load_voice_index()
+    compute_cache_versions()
+    load_near_duplicate_index()
+    start_pools()
+    requeued, abandoned = requeue_interrupted_jobs(JOB_MAX_ATTEMPTS)
+    if requeued:
+        print(f"⏳ Re-queued {requeued} interrupted analysis jobs")
+    if abandoned:
+        print(f"⚠️ Failed {len(abandoned)} analysis jobs interrupted {JOB_MAX_ATTEMPTS} times")
+        for path in abandoned:
+            remove_upload(path)
+    job_workers.start()
     yield
+    await job_workers.stop()
+    shutdown_pools()
+    if cnn_batcher is not None:
+        cnn_batcher.stop()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -169,251 +379,205 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-import av
+from audio_io import decode_audio, StreamDecoder
+from streaming import MonitorSession
+import dsp
+from executors import start_pools, shutdown_pools, run_inference, run_io, run_dsp, submit_stt
 
-def load_audio_with_av(file_path, sr=16000, duration=3):
-    try:
-        container = av.open(file_path)
-        audio_stream = next(s for s in container.streams if s.type == 'audio')
-        
-        # Resample to target sample rate
-        resampler = av.audio.resampler.AudioResampler(format='flt', layout='mono', rate=sr)
-        
-        audio_data = []
-        for frame in container.decode(audio_stream):
-            # Resample frame
-            resampled_frames = resampler.resample(frame)
-            for resampled_frame in resampled_frames:
-                # Flatten to 1D array immediately to avoid shape mismatch during concatenation
-                # (1, samples) -> (samples,)
-                audio_data.append(resampled_frame.to_ndarray().flatten())
-        
-        # Concatenate all frames
-        if not audio_data:
-            return None, None
-            
-        audio = np.concatenate(audio_data)
-        
-        # Flatten if necessary (should be 1D array for mono)
-        if audio.ndim > 1:
-            audio = audio.flatten()
-            
-        # Handle duration limit
-        if duration is not None:
-            target_length = int(sr * duration)
-            if len(audio) > target_length:
-                audio = audio[:target_length]
-            
-        return audio, sr
-    except Exception as e:
-        print(f"PyAV loading error: {e}")
-        return None, None
-
-def extract_mel_spectrogram(file_path, sr=16000, n_mels=128, duration=3):
+def extract_mel_spectrogram(audio, n_mels=128, duration=3):
     """
     Replicated from Kaggle Notebook
     """
     try:
-        # Load audio using PyAV (more robust for m4a/aac)
-        audio, _ = load_audio_with_av(file_path, sr=sr, duration=duration)
-        
-        if audio is None:
-            # Fallback to librosa if PyAV fails (though unlikely for m4a)
-            print("PyAV failed, trying librosa...")
-            audio, _ = librosa.load(file_path, sr=sr, duration=duration)
-        
-        # Length normalization (3 seconds)
-        target_length = sr * duration
-        if len(audio) < target_length:
-            audio = np.pad(audio, (0, target_length - len(audio)))
-        else:
-            audio = audio[:target_length]
-        
-        # Mel-spectrogram calculation
-        mel = librosa.feature.melspectrogram(
-            y=audio,
-            sr=sr,
-            n_mels=n_mels,
-            n_fft=2048,
-            hop_length=512,
-            fmax=8000
-        )
-        
-        # dB scale conversion
-        mel_db = librosa.power_to_db(mel, ref=np.max)
-        
-        # Normalization (mean 0, std 1)
-        mel_db = (mel_db - mel_db.mean()) / (mel_db.std() + 1e-6)
-        
-        return mel_db
-    
+        return dsp.mel_spectrogram(audio.head(duration), sr=audio.sr, n_mels=n_mels, duration=duration)
     except Exception as e:
         print(f"Error extracting features: {e}")
         return None
 
-import io
-import base64
-
-def analyze_image_combined(file_path):
-    try:
+def open_image(file_path):
+    with stage("image_decode"):
         img = Image.open(file_path)
         img = img.convert('RGB')
-        
-        # --- 0. NEW: Frequency Domain Analysis (FFT) ---
-        # Detects periodic artifacts common in GAN/Diffusion models
-        fft_score = 0
-        is_fft_suspicious = False
-        try:
-             # Convert to grayscale for FFT
-             img_gray = img.convert('L')
-             img_np = np.array(img_gray)
-             
-             # Perform 2D FFT
-             f = np.fft.fft2(img_np)
-             fshift = np.fft.fftshift(f)
-             magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1)
-             
-             # Calculate azimuthal average to detect abnormal high-frequency spikes
-             # Simplification: Check for unusual energy concentrations in high freq
-             h, w = magnitude_spectrum.shape
-             center_x, center_y = w // 2, h // 2
-             
-             # Define high-frequency region (outer ring)
-             radius_inner = min(h, w) // 4
-             y, x = np.ogrid[:h, :w]
-             mask_area = (x - center_x)**2 + (y - center_y)**2 >= radius_inner**2
-             
-             high_freq_mean = np.mean(magnitude_spectrum[mask_area])
-             total_mean = np.mean(magnitude_spectrum)
-             
-             # AI images often have unusually uniform or unusually decaying high freqs
-             # Real images have natural 1/f decay.
-             # This is a simplified heuristic: High frequency energy ratio
-             fft_ratio = high_freq_mean / total_mean
-             
-             print(f"[FFT] High Freq Ratio: {fft_ratio:.4f}")
-             
-             # Thresholds tuned for NanoBanana/StableDiffusion (often have specific spectral signature)
-             # Relaxed thresholds to reduce false positives on real photos
-             # Real photos can vary from 0.55 (bokeh/blur) to 0.98 (noise/grain).
-             # AI often produces < 0.5 (super smooth) or > 0.99 (checkerboard artifacts).
-             if fft_ratio < 0.50 or fft_ratio > 0.985: 
-                 is_fft_suspicious = True
-                 fft_score = 75 
-             else:
-                 fft_score = 10 
-                 
-        except Exception as e:
-            print(f"FFT Analysis Error: {e}")
+    observe_input("image_pixels", img.width * img.height)
+    return img
 
-        # --- 1. Heuristic Analysis (ELA) ---
-        ela_score = 0
-        is_ela_suspicious = False
-        ela_image_base64 = None
-        suspicious_regions = []  # Initialize here to ensure it's always defined
+def analyze_image_combined(file_path, visuals=True, model_scores=None):
+    """`model_scores`: per-model predictions to reuse (near-duplicate match) instead of running the ensemble"""
+    try:
+        img = open_image(file_path)
+    except Exception as e:
+        print(f"Image analysis error: {e}")
+        return None
+    if model_scores is None:
+        model_scores = image_ensemble.predict([img])[0]
+    return analyze_loaded_image(img, model_scores, visuals=visuals)
 
-        tmp_filename = None
-        try:
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                img.save(tmp, 'JPEG', quality=90)
-                tmp_filename = tmp.name
-            
-            resaved = Image.open(tmp_filename)
-            try:
-                ela = ImageChops.difference(img, resaved)
-                extrema = ela.getextrema()
-                max_diff = max([ex[1] for ex in extrema])
-                if max_diff == 0:
-                    max_diff = 1
-                scale = 255.0 / max_diff
-                ela = ImageEnhance.Brightness(ela).enhance(scale)
-                
-                # Convert ELA to base64 for visualization
-                buffered = io.BytesIO()
-                ela.save(buffered, format="JPEG")
-                ela_image_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                
-                stat = ImageStat.Stat(ela)
-                ela_score = sum(stat.mean) / len(stat.mean)
+IMAGE_TILING_MODES = ("auto", "on", "off")
 
-                # --- Contour Detection for Red Line Visualization ---
-                try:
-                    # Convert ELA to grayscale numpy array
-                    ela_np = np.array(ela.convert('L'))
+def use_tiling(file_path, tiling="auto"):
+    """"auto": tiled mode for images above TILED_AUTO_PIXELS"""
+    if tiling != "auto":
+        return tiling == "on"
+    try:
+        width, height = image_size(file_path)
+    except Exception:
+        return False  # Not an image; the normal path reports the error
+    return width * height > TILED_AUTO_PIXELS
+
+def score_image_tiles(tiles):
+    """(ensemble AI probability, ELA score) per tile; the detectors see each batch once"""
+    predictions = image_ensemble.predict(tiles)
+    return [(combine_predictions(p), ela_score(tile)) for tile, p in zip(tiles, predictions)]
+
+def analyze_image_tiled(file_path, visuals=True):
+    """
+    Tiled mode for very large images (see image_tiles.py): the verdict comes
+    from a downscaled overview, and the "tiles" block adds a per-tile heatmap
+    from the bounded working resolution, where local edits are still visible.
+    """
+    try:
+        with stage("image_decode"):
+            img, (width, height) = open_working_image(file_path)
+        observe_input("image_pixels", width * height)
+        with stage("image_tiles"):
+            tiles = scan_tiles(img, score_image_tiles, (width, height))
+        small = overview(img)
+        del img
+        result = analyze_loaded_image(small, image_ensemble.predict([small])[0], visuals=visuals)
+        if result is None:
+            return None
 
-                    # Threshold to find bright spots (suspicious areas)
-                    # Using lower threshold for testing - can be adjusted later
-                    threshold_value = 30  # Lowered for testing
-                    _, thresh = cv2.threshold(ela_np, threshold_value, 255, cv2.THRESH_BINARY)
+        # Report regions in original-image pixels
+        scale = width / small.width
+        result["suspicious_regions"] = [[[round(x * scale), round(y * scale)] for x, y in region]
+                                        for region in result["suspicious_regions"]]
+        result["image_dimensions"] = {"width": width, "height": height}
+        result["tiles"] = tiles
+        return result
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Tiled image analysis error: {e}")
+        return None
 
-                    print(f"[CONTOUR] ELA threshold={threshold_value}, ELA score={ela_score:.2f}")
+# Near-duplicates reuse only the model-ensemble scores of the matched verdict.
+# pHash/dHash ignore small local edits (a swapped photo or edited digits), so
+# the cheap forensics (FFT, ELA) always run on the upload itself. Tiled mode
+# does not use the index: its per-tile scores are the local evidence.
+NEAR_DUPLICATE_UNSTORED = ("ela_image", "visualized_image", "timings", "cache_match")
+NEAR_DUPLICATE_VARIANT = "full"
 
-                    # Find contours
-                    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+def find_near_duplicate(path):
+    """(perceptual hashes, match or None); a match carries the stored per-model scores"""
+    try:
+        with stage("image_hash"):
+            hashes = image_hashes(path)
+    except Exception as e:
+        print(f"Image hash error: {e}")
+        return None, None
+    match = near_duplicates.lookup(*hashes, variant=NEAR_DUPLICATE_VARIANT)
+    if match is None:
+        return hashes, None
 
-                    print(f"[CONTOUR] Found {len(contours)} total contours")
+    verdict_id, phash_distance, dhash_distance = match
+    db = SessionLocal()
+    try:
+        row = db.query(ImageVerdict).filter(ImageVerdict.id == verdict_id).first()
+        model_scores = (row.result or {}).get("model_scores") if row is not None else None
+        if not model_scores:
+            near_duplicates.remove(verdict_id)
+            return hashes, None
+        row.hits = (row.hits or 0) + 1
+        row.last_used_at = datetime.datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
 
-                    # Sort contours by area (largest first) and take top N
-                    contour_areas = [(contour, cv2.contourArea(contour)) for contour in contours]
-                    contour_areas.sort(key=lambda x: x[1], reverse=True)
+    print(f"Near-duplicate image verdict #{verdict_id} (pHash distance {phash_distance}, dHash distance {dhash_distance})")
+    return hashes, {"type": "near_duplicate", "verdict_id": verdict_id, "model_scores": model_scores,
+                    "phash_distance": phash_distance, "dhash_distance": dhash_distance}
 
-                    # Take top 20 largest contours or those above min_area
-                    min_area = 100  # Very low threshold
-                    max_regions = 20  # Limit to prevent too many regions
+def public_match(match):
+    """cache_match field for a response (the reused scores are already in the result)"""
+    if match is None:
+        return None
+    return {k: v for k, v in match.items() if k != "model_scores"}
+
+def remember_image_verdict(hashes, content_hash, result):
+    """Store a freshly computed verdict for future near-duplicate lookups (LRU-bounded)"""
+    if hashes is None:
+        return
+    stored = {k: v for k, v in result.items() if k not in NEAR_DUPLICATE_UNSTORED}
+    db = SessionLocal()
+    try:
+        row = ImageVerdict(phash=to_hex(hashes[0]), dhash=to_hex(hashes[1]), variant=NEAR_DUPLICATE_VARIANT,
+                           cache_version=IMAGE_CACHE_VERSION, content_hash=content_hash, result=jsonable(stored))
+        db.add(row)
+        db.commit()
+        evicted = near_duplicates.add(row.id, hashes[0], hashes[1], NEAR_DUPLICATE_VARIANT)
+        if evicted:
+            db.query(ImageVerdict).filter(ImageVerdict.id.in_(evicted)).delete(synchronize_session=False)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Near-duplicate index write error: {e}")
+    finally:
+        db.close()
 
-                    for contour, area in contour_areas[:max_regions]:
-                        if area > min_area:
-                            # Simplify contour to reduce data size
-                            epsilon = 0.005 * cv2.arcLength(contour, True)
-                            approx = cv2.approxPolyDP(contour, epsilon, True)
+def analyze_loaded_image(img, model_predictions, visuals=True):
+    """
+    FFT + ELA heuristics for a decoded image, combined with its AI model
+    predictions. `visuals`: include the base64 ELA / outlined images.
+    """
+    try:
+        # --- 0. NEW: Frequency Domain Analysis (FFT) ---
+        # Detects periodic artifacts common in GAN/Diffusion models
+        with stage("fft"):
+            fft_score = 0
+            is_fft_suspicious = False
+            spectrum = None
+            try:
+                # Radial spectrum of a bounded center crop (see spectral.py)
+                spectrum = radial_spectrum(img)
+                if spectrum is not None:
+                    # AI images often have unusually uniform or unusually decaying high freqs
+                    # Real images have natural 1/f decay.
+                    # This is a simplified heuristic: High frequency energy ratio
+                    fft_ratio = spectrum["high_freq_ratio"]
+
+                    print(f"[FFT] High Freq Ratio: {fft_ratio:.4f}, slope={spectrum['slope']:.1f} dB/decade")
+
+                    # Thresholds tuned for NanoBanana/StableDiffusion (often have specific spectral signature)
+                    # Relaxed thresholds to reduce false positives on real photos
+                    # Real photos can vary from 0.55 (bokeh/blur) to 0.98 (noise/grain).
+                    # AI often produces < 0.5 (super smooth) or > 0.99 (checkerboard artifacts).
+                    if fft_ratio < 0.50 or fft_ratio > 0.985:
+                        is_fft_suspicious = True
+                        fft_score = 75
+                    else:
+                        fft_score = 10
 
-                            # Convert to list of points [[x, y], ...]
-                            points = approx.reshape(-1, 2).tolist()
-                            suspicious_regions.append(points)
-                            print(f"[CONTOUR] Added suspicious region #{len(suspicious_regions)} with area={area:.1f}, points={len(points)}")
+            except Exception as e:
+                print(f"FFT Analysis Error: {e}")
 
-                    print(f"[CONTOUR] Total suspicious regions after filtering: {len(suspicious_regions)}")
+        # --- 1. Heuristic Analysis (ELA) ---
+        ela_score = 0
+        is_ela_suspicious = False
+        ela_image_base64 = None
+        visualized_image_base64 = None
+        suspicious_regions = []  # Initialize here to ensure it's always defined
 
-                    # --- Generate Visualized Image for Sharing ---
-                    # Convert original PIL image to numpy array (RGB)
-                    visualized_np = np.array(img)
-                    # OpenCV uses BGR, but we are working with RGB from PIL. 
-                    # If we use cv2.polylines on RGB array, we need to specify color as (R, G, B).
-                    # Red color in RGB is (255, 0, 0).
-                    
-                    # Draw contours
-                    for region in suspicious_regions:
-                        # Convert list of lists to numpy array of points (int32)
-                        pts = np.array(region, np.int32)
-                        pts = pts.reshape((-1, 1, 2))
-                        cv2.polylines(visualized_np, [pts], True, (255, 0, 0), 3) # Red color, thickness 3
-                    
-                    # Convert back to PIL Image
-                    visualized_img = Image.fromarray(visualized_np)
-                    
-                    # Convert to base64
-                    buffered_vis = io.BytesIO()
-                    visualized_img.save(buffered_vis, format="JPEG", quality=85)
-                    visualized_image_base64 = base64.b64encode(buffered_vis.getvalue()).decode('utf-8')
-
-                except Exception as e:
-                    print(f"Contour detection/visualization error: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    visualized_image_base64 = None
-
-            finally:
-                resaved.close()
-                
-            if tmp_filename and os.path.exists(tmp_filename):
-                os.remove(tmp_filename)
-                
-        except Exception as e:
-            print(f"ELA error: {e}")
-            if tmp_filename and os.path.exists(tmp_filename):
-                try: os.remove(tmp_filename)
-                except: pass
-            visualized_image_base64 = None
+        with stage("ela"):
+            try:
+                ela = error_level_analysis(img, visuals=visuals)
+                ela_score = ela["score"]
+                suspicious_regions = ela["regions"]
+                ela_image_base64 = ela["ela_image"]
+                visualized_image_base64 = ela["visualized_image"]
+            except Exception as e:
+                print(f"ELA error: {e}")
 
         # Improved ELA threshold (more conservative)
         is_ela_suspicious = ela_score > 55  # Raised from 30 to 55
@@ -421,52 +585,12 @@ def analyze_image_combined(file_path):
         # --- 2. AI Model Analysis (Ensemble) ---
         ai_probability = 0
         ai_verdict = "Unknown"
-        model_predictions = []
-
-        if len(ai_models) > 0 and len(ai_processors) > 0:
-            for idx, (processor, model) in enumerate(zip(ai_processors, ai_models)):
-                try:
-                    inputs = processor(images=img, return_tensors="pt")
-                    with torch.no_grad():
-                        outputs = model(**inputs)
-                        logits = outputs.logits
-                        probs = F.softmax(logits, dim=-1)
-
-                    # Check labels - handle different label configurations
-                    id2label = model.config.id2label
-
-                    # Try to identify which index is artificial/fake
-                    artificial_idx = None
-                    for label_idx, label_name in id2label.items():
-                        if 'artificial' in label_name.lower() or 'fake' in label_name.lower() or 'ai' in label_name.lower():
-                            artificial_idx = label_idx
-                            break
-
-                    # If not found, assume index 0 is artificial (common convention)
-                    if artificial_idx is None:
-                        artificial_idx = 0
-
-                    artificial_prob = float(probs[0][artificial_idx]) * 100
-                    human_prob = 100 - artificial_prob
-
-                    model_predictions.append(artificial_prob)
-                    print(f"Model {idx} ({AI_MODEL_NAMES[idx]}): Artificial={artificial_prob:.2f}%")
-
-                except Exception as e:
-                    print(f"AI Model {idx} error: {e}")
-
-            # Ensemble: Use weighted average (more weight to models that agree)
-            if len(model_predictions) > 0:
-                # Simple average
-                ai_probability = sum(model_predictions) / len(model_predictions)
-
-                # Check agreement between models
-                if len(model_predictions) > 1:
-                    variance = np.var(model_predictions)
-                    # If models disagree significantly, reduce confidence
-                    if variance > 500:  # High disagreement
-                        ai_probability = ai_probability * 0.85  # Reduce confidence
 
+        if len(image_ensemble) > 0:
+            # Ensemble: average, with reduced confidence when the models disagree
+            combined = combine_predictions(model_predictions)
+            if combined is not None:
+                ai_probability = combined
                 ai_verdict = "Artificial" if ai_probability > 50 else "Human"
                 print(f"Ensemble Result: Artificial={ai_probability:.2f}%, Verdict={ai_verdict}")
             else:
@@ -483,7 +607,7 @@ def analyze_image_combined(file_path):
         ELA_HIGH_THRESHOLD = 65     # High confidence ELA detection
         ELA_MODERATE_THRESHOLD = 50 # Moderate confidence
 
-        if len(ai_models) > 0 and len(ai_processors) > 0:
+        if len(image_ensemble) > 0:
             # Primary decision based on AI model (Independent of ELA)
             # Higher threshold for "Artificial" to prevent false positives
             if ai_probability >= 70:
@@ -539,6 +663,8 @@ def analyze_image_combined(file_path):
             "ela_image": ela_image_base64,
             "visualized_image": visualized_image_base64,
             "suspicious_regions": suspicious_regions,
+            "spectrum": spectrum,
+            "model_scores": model_predictions,
             "image_dimensions": {"width": img.width, "height": img.height}
         }
 
@@ -551,41 +677,30 @@ def analyze_image_combined(file_path):
         print(f"Image analysis error: {e}")
         return None
 
-def convert_to_wav(input_path):
-    """Convert any audio file to WAV format for SpeechRecognition"""
-    try:
-        # Load audio with PyAV (robust for m4a/aac) - read entire file (duration=None)
-        audio, sr_rate = load_audio_with_av(input_path, sr=16000, duration=None)
+def cluster_speakers(embeddings, num_speakers=None):
+    """Offline agglomerative clustering over all segment embeddings"""
+    X = np.array(embeddings)
+    
+    # Determine number of clusters
+    if len(X) < 2:
+         # Not enough samples for clustering, assume 1 speaker
+         return [0] * len(X)
+
+    if num_speakers is None:
+        # Simple heuristic: if < 5 segments, assume 1 speaker. Else try to find 2.
+        n_clusters = 2 if len(X) >= 4 else 1
+    else:
+        n_clusters = num_speakers
         
-        if audio is None:
-             # Fallback to librosa
-             audio, sr_rate = librosa.load(input_path, sr=16000, mono=True)
-
-        # Create temporary WAV file
-        import soundfile as sf
-        wav_path = input_path.rsplit('.', 1)[0] + '_converted.wav'
-        sf.write(wav_path, audio, sr_rate)
-
-        return wav_path
-    except Exception as e:
-        print(f"Audio conversion error: {e}")
-        return None
-
-def extract_voice_fingerprint(file_path):
-    try:
-        # Use PyAV for robust loading
-        y, sr = load_audio_with_av(file_path, sr=16000, duration=10)
-        if y is None:
-            y, sr = librosa.load(file_path, sr=16000, duration=10)
-            
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=40)
-        fingerprint = np.mean(mfcc, axis=1)
-        return fingerprint
-    except Exception as e:
-        print(f"Fingerprint error: {e}")
-        return None
+    if len(X) < n_clusters:
+         n_clusters = len(X)
+    
+    if n_clusters < 2:
+         return [0] * len(X)
+    clustering = AgglomerativeClustering(n_clusters=n_clusters).fit(X)
+    return clustering.labels_
 
-def diarize_audio(file_path, num_speakers=None):
+def diarize_audio(audio, num_speakers=None):
     """
     Perform speaker diarization:
     1. VAD (Voice Activity Detection) to find speech segments
@@ -595,90 +710,67 @@ def diarize_audio(file_path, num_speakers=None):
     if speaker_recognition_model is None:
         print("Speaker recognition model not loaded.")
         return None
+    if vad_model is None:
+        print("VAD model not loaded.")
+        return None
 
     try:
-        # 1. Load Audio (16kHz mono)
-        wav_path = convert_to_wav(file_path)
-        if not wav_path:
-            return None
-        
-        # Load using librosa to avoid torchaudio backend issues (TorchCodec error)
-        # librosa loads as (T,) float32, resamples automatically
-        wav_np, sr = librosa.load(wav_path, sr=16000) 
-        wav = torch.FloatTensor(wav_np)
-        
-        # Ensure (1, T) shape for compatibility with downstream processing
-        if wav.dim() == 1:
-            wav = wav.unsqueeze(0)
-            
-        # sr is already 16000 from librosa.load
+        # 1. Shared decoded audio (16kHz mono) -> (1, T) tensor, no copy
+        sr = audio.sr
+        wav = torch.from_numpy(audio.samples).unsqueeze(0)
 
-        # 2. VAD - Get speech timestamps
-        model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=False, trust_repo=True)
-        (get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
-        
-        # Get speech timestamps
+        # 2. VAD - Get speech timestamps (shared, startup-loaded model)
         # Silero VAD expects 1D tensor for single file
-        speech_timestamps = get_speech_timestamps(wav.squeeze(), model, sampling_rate=sr)
+        with stage("vad"):
+            speech_timestamps = detect_speech(wav.squeeze(0), sr)
         
         if not speech_timestamps:
             print("No speech detected.")
             return []
 
-        # 3. Extract Embeddings for each segment
-        embeddings = []
+        # 3. Extract Embeddings for each segment (length-bucketed batches)
         segments = []
-        
+        spans = []
+
         for ts in speech_timestamps:
             start = ts['start']
             end = ts['end']
-            
-            # Extract segment (ensure min length for embedding)
-            segment = wav[:, start:end]
-            
+
             # Skip very short segments (< 0.5s)
-            if segment.shape[1] < 8000: 
+            if end - start < 8000:
                 continue
-                
-            # Extract embedding
-            # EncoderClassifier expects (batch, time)
-            embedding = speaker_recognition_model.encode_batch(segment)
-            # Embedding shape: (batch, 1, emb_dim) -> flatten to (emb_dim,)
-            embedding = embedding.squeeze().cpu().numpy()
-            
-            embeddings.append(embedding)
+
+            spans.append((start, end))
             segments.append({
                 'start': start / sr,
                 'end': end / sr,
-                'audio': segment # Keep audio for gender analysis
+                'audio': wav[:, start:end] # Keep audio for gender analysis
             })
 
-        if not embeddings:
+        if not spans:
             return []
 
-        # 4. Clustering
-        X = np.array(embeddings)
-        
-        # Determine number of clusters
-        if len(X) < 2:
-             # Not enough samples for clustering, assume 1 speaker
-             labels = [0] * len(X)
+        if DIARIZATION_MODE == "online":
+            # 4. Incremental clustering: bounded memory, any number of speakers
+            # (embedding and assignment interleave, so they are timed as one stage)
+            with stage("embeddings_online_clustering"):
+                labels = online_speaker_labels(
+                    speaker_recognition_model, wav.squeeze(0), spans, sr=sr,
+                    threshold=DIARIZATION_ONLINE_THRESHOLD,
+                    max_speakers=DIARIZATION_MAX_SPEAKERS,
+                    recluster=DIARIZATION_RECLUSTER,
+                    num_speakers=num_speakers,
+                    max_batch_seconds=DIARIZATION_MAX_BATCH_SECONDS,
+                )
         else:
-            if num_speakers is None:
-                # Simple heuristic: if < 5 segments, assume 1 speaker. Else try to find 2.
-                n_clusters = 2 if len(X) >= 4 else 1
-            else:
-                n_clusters = num_speakers
-                
-            if len(X) < n_clusters:
-                 n_clusters = len(X)
-            
-            if n_clusters < 2:
-                 labels = [0] * len(X)
-            else:
-                 clustering = AgglomerativeClustering(n_clusters=n_clusters).fit(X)
-                 labels = clustering.labels_
-        
+            with stage("embeddings"):
+                embeddings = extract_embeddings(
+                    speaker_recognition_model, wav.squeeze(0), spans, sr=sr,
+                    max_batch_seconds=DIARIZATION_MAX_BATCH_SECONDS,
+                )
+            with stage("clustering"):
+                labels = cluster_speakers(embeddings, num_speakers)
+
         # Group segments by speaker
         speakers = {}
         for i, label in enumerate(labels):
@@ -699,30 +791,22 @@ def diarize_audio(file_path, num_speakers=None):
             speakers[speaker_id]['total_duration'] += (seg['end'] - seg['start'])
             speakers[speaker_id]['audio_tensors'].append(seg['audio'])
 
-        # 5. Analyze each speaker (Age/Gender)
+        # 5. Analyze each speaker (Age/Gender), all speakers batched together
+        speaker_items = [(spk_id, data) for spk_id, data in speakers.items() if data['audio_tensors']]
+        # Concatenate all audio segments for each speaker, as numpy for the processor
+        speaker_audios = [torch.cat(data['audio_tensors'], dim=1).squeeze(0).numpy() for _, data in speaker_items]
+        with stage("age_gender"):
+            speaker_demographics = predict_age_gender_batch(speaker_audios)
+
         diarization_result = []
-        for spk_id, data in speakers.items():
-            # Concatenate all audio segments for this speaker
-            if data['audio_tensors']:
-                combined_audio = torch.cat(data['audio_tensors'], dim=1)
-                # Convert to numpy for predict_age_gender compatibility
-                combined_audio_np = combined_audio.squeeze().numpy()
-                
-                # Analyze demographics
-                demographics = predict_age_gender(None, audio_data=combined_audio_np)
-                
-                diarization_result.append({
-                    'id': spk_id,
-                    'duration': data['total_duration'],
-                    'demographics': demographics,
-                    'segments': data['segments'] # Optional: return all segments
-                })
-        
-        # Clean up
-        if os.path.exists(wav_path) and wav_path != file_path: # Don't delete original if same
-             try: os.remove(wav_path)
-             except: pass
-             
+        for (spk_id, data), demographics_result in zip(speaker_items, speaker_demographics):
+            diarization_result.append({
+                'id': spk_id,
+                'duration': data['total_duration'],
+                'demographics': demographics_result,
+                'segments': data['segments'] # Optional: return all segments
+            })
+
         return diarization_result
 
     except Exception as e:
@@ -731,20 +815,31 @@ def diarize_audio(file_path, num_speakers=None):
         traceback.print_exc()
         return None
 
-        return None
-        
-def transcribe_segments(file_path, diarization_result):
+def transcribe_span(audio, start, end):
+    """Text for [start, end) seconds of the shared buffer ("" if nothing recognized or on error)"""
+    try:
+        with stage("stt"):
+            return stt_backend.transcribe(audio.pcm16_bytes(start, end), audio.sr)
+    except Exception as e:
+        print(f"Segment transcription error: {e}")
+        return ""
+
+def transcribe_segments(audio, diarization_result):
     """
     Transcribe audio segments for each speaker.
     Returns a list of { "speaker": "Speaker 1", "text": "...", "timestamp": "00:00" } sorted by time.
+    Each entry also carries the keywords it newly triggered and the running risk score so far.
+    Segments are sent to the STT backend concurrently (bounded by the stt pool)
+    and scanned for keywords as each one comes back; once the keyword risk
+    reaches KEYWORD_STOP_SCORE the remaining segments are not transcribed.
     """
-    r = sr.Recognizer()
-    transcript_entries = []
-    
     # Flatten segments from all speakers
     all_segments = []
     for speaker in diarization_result:
         for seg in speaker['segments']:
+            # Skip very short segments (< 1s)
+            if seg['end'] - seg['start'] < 1.0:
+                continue
             all_segments.append({
                 "speaker": speaker['id'],
                 "start": seg['start'],
@@ -753,231 +848,75 @@ def transcribe_segments(file_path, diarization_result):
     
     # Sort by start time
     all_segments.sort(key=lambda x: x['start'])
-    
-    try:
-        # Load audio using librosa (robust)
-        y, sr_rate = librosa.load(file_path, sr=16000)
-        
-        import soundfile as sf
-        import io
-        
-        for seg in all_segments:
-            start_sample = int(seg['start'] * sr_rate)
-            end_sample = int(seg['end'] * sr_rate)
-            
-            # Skip very short segments (< 1s)
-            if end_sample - start_sample < sr_rate:
-                continue
-                
-            chunk = y[start_sample:end_sample]
-            
-            # Write chunk to memory buffer as WAV
-            buf = io.BytesIO()
-            sf.write(buf, chunk, sr_rate, format='WAV')
-            buf.seek(0)
-            
-            with sr.AudioFile(buf) as source:
-                audio_data = r.record(source)
-                try:
-                    text = r.recognize_google(audio_data, language='ko-KR')
-                    if text:
-                        transcript_entries.append({
-                            "speaker": seg['speaker'],
-                            "text": text,
-                            "start": seg['start'],
-                            "timestamp": f"{int(seg['start']//60):02d}:{int(seg['start']%60):02d}"
-                        })
-                except sr.UnknownValueError:
-                    pass # No speech detected
-                except Exception as e:
-                    print(f"Segment transcription error: {e}")
-                    
-    except Exception as e:
-        print(f"Transcription setup error: {e}")
-        
-    return transcript_entries
-
-def predict_age_gender(file_path, audio_data=None):
-    """Predict age and gender from audio file or raw audio data using Chunking & Voting"""
-    if age_gender_model is None or age_gender_processor is None:
-        return None
-
-    try:
-        audio = None
-        sr = 16000
-
-        # 1. Load Audio
-        if audio_data is not None:
-            audio = audio_data
-        elif file_path:
-            # Load full audio (up to 60s to capture more context)
-            audio, sr = load_audio_with_av(file_path, sr=16000, duration=60)
-            if audio is None:
-                audio, sr = librosa.load(file_path, sr=16000, duration=60)
-        
-        if audio is None or len(audio) < 16000: # Need at least 1 second
-            return None
-        
-        # 2. Chunking Logic (Split into 5-second chunks with 2s overlap)
-        chunk_duration = 5 # seconds
-        overlap = 2 # seconds
-        chunk_samples = int(chunk_duration * sr)
-        step = int((chunk_duration - overlap) * sr)
-        
-        chunks = []
-        if len(audio) <= chunk_samples:
-            chunks.append(audio)
-        else:
-            for i in range(0, len(audio) - chunk_samples + 1, step):
-                chunks.append(audio[i : i + chunk_samples])
-            
-            # Add last chunk if skipped and meaningful length remains
-            if len(audio) > chunk_samples and (len(audio) - chunks[-1][-1]) > 16000:
-                chunks.append(audio[-chunk_samples:])
 
-        if not chunks:
-            chunks.append(audio) # Fallback
+    futures = submit_stt(lambda seg: transcribe_span(audio, seg['start'], seg['end']), all_segments)
+    texts = [None] * len(futures)
+    index_of = {future: i for i, future in enumerate(futures)}
+    found = set()
+    for future in concurrent.futures.as_completed(futures):
+        i = index_of[future]
+        texts[i] = future.result()
+        found.update(keyword_scanner.analyze(texts[i])[0])
+        if risk_score_for([keyword_scanner.weights[k] for k in found]) >= KEYWORD_STOP_SCORE:
+            skipped = sum(f.cancel() for f in futures if not f.done())
+            print(f"Keyword risk reached {KEYWORD_STOP_SCORE}, {skipped} segments left untranscribed")
+            break
+
+    # Chronological pass: a phrase split across two adjacent segments is still found
+    transcript_entries = []
+    keyword_stream = keyword_scanner.stream()
+    for seg, text in zip(all_segments, texts):
+        if text:
+            new_keywords = keyword_stream.feed(text)
+            transcript_entries.append({
+                "speaker": seg['speaker'],
+                "text": text,
+                "start": seg['start'],
+                "timestamp": f"{int(seg['start']//60):02d}:{int(seg['start']%60):02d}",
+                "detected_keywords": new_keywords,
+                "risk_score": keyword_stream.risk_score,
+            })
 
-        gender_votes = []
-        age_values = []
-        
-        id2label = age_gender_model.config.id2label
+    return transcript_entries
 
-        # 3. Predict for each chunk
-        for chunk in chunks:
-            try:
-                inputs = age_gender_processor(chunk, sampling_rate=16000, return_tensors="pt", padding=True)
-                with torch.no_grad():
-                    logits = age_gender_model(inputs.input_values, attention_mask=inputs.attention_mask).logits
-                
-                predicted_idx = torch.argmax(logits, dim=-1).item()
-                predicted_label = id2label[predicted_idx]
-                
-                # Retrieve parsed gender and age
-                # Labels format examples: 'female_26', 'male_32', 'child_female_10', etc.
-                
-                curr_gender = "Unknown"
-                curr_age = None
-                
-                # Parse Gender
-                if "female" in predicted_label:
-                    curr_gender = "Female"
-                elif "male" in predicted_label:
-                    curr_gender = "Male"
-                elif "child" in predicted_label:
-                    curr_gender = "Child"
-                
-                # Parse Age
-                # Try to extract number from string
-                import re
-                age_match = re.search(r'_(\d+)', predicted_label)
-                if age_match:
-                    curr_age = int(age_match.group(1))
-                
-                if curr_gender != "Unknown":
-                    gender_votes.append(curr_gender)
-                if curr_age is not None:
-                    age_values.append(curr_age)
-                    
-            except Exception as e:
-                # skip bad chunks
-                continue
+def predict_age_gender(audio_data, sr=16000):
+    """Predict age and gender from raw 16kHz audio data using Chunking & Voting"""
+    results = predict_age_gender_batch([audio_data], sr=sr)
+    return results[0] if results else None
 
-        # 4. Voting / Aggregation
-        from collections import Counter
-        
-        final_gender = "Unknown"
-        final_age_str = "Unknown"
-        
-        if gender_votes:
-            # Majority vote
-            final_gender = Counter(gender_votes).most_common(1)[0][0]
-            
-        if age_values:
-            # Average age
-            avg_age = sum(age_values) / len(age_values)
-            # Create age group string (e.g. "20s", "30s")
-            age_tens = int(avg_age // 10) * 10
-            final_age_str = f"{age_tens}s"
-            
-            # Refine Child logic
-            if avg_age < 13:
-                 final_gender = "Child" # Override gender if age is clearly child
-                 final_age_str = "Child"
-        
-        return {
-            "raw_label": f"{final_gender}_{final_age_str}", # Synthetic label
-            "gender": final_gender,
-            "age_group": final_age_str
-        }
+def predict_age_gender_batch(audios, sr=16000):
+    """Age/gender for several audios (e.g. every diarized speaker) in shared batches"""
+    if age_gender_model is None or age_gender_processor is None:
+        return [None] * len(audios)
 
+    try:
+        return demographics.predict_batch(
+            age_gender_model, age_gender_processor, audios, sr=sr,
+            batch_size=AGE_GENDER_BATCH_SIZE,
+            early_stop=AGE_GENDER_EARLY_STOP,
+        )
     except Exception as e:
         print(f"Age/Gender prediction error: {e}")
-        return None
-
-def analyze_context(file_path):
-    r = sr.Recognizer()
-    wav_path = None
+        return [None] * len(audios)
 
+def analyze_context(audio, transcript=None):
+    """
+    Keyword risk + summary for the call. The text is assembled from the
+    per-segment `transcript` when there is one; the whole file is only sent
+    to STT when diarization produced no segments.
+    """
     try:
-        # Convert to WAV if not already
-        if not file_path.lower().endswith('.wav'):
-            wav_path = convert_to_wav(file_path)
-            if wav_path is None:
-                raise Exception("Failed to convert audio to WAV")
-            file_to_analyze = wav_path
+        if transcript:
+            text = " ".join(entry['text'] for entry in transcript)
         else:
-            file_to_analyze = file_path
-
-        with sr.AudioFile(file_to_analyze) as source:
-            audio_data = r.record(source)
-            # Recognize (Korean)
-            text = r.recognize_google(audio_data, language='ko-KR')
-            
-        keywords = {
-            # High Risk (Direct Threats / Actions)
-            "검찰": 20, "검사": 20, "수사관": 20, "금융감독원": 20, "금감원": 20,
-            "송금": 20, "이체": 20, "현금": 15, "인출": 20, "전달": 15,
-            "대포통장": 35, "통장": 15, "계좌": 15, "비밀번호": 25, "보안카드": 25, "OTP": 20,
-            "납치": 50, "협박": 30, "감금": 30, "사고": 15, "합의금": 20,
-            "개인정보": 15, "유출": 15, "도용": 15, "범죄": 20, "연루": 20,
-            "상품권": 20, "기프트카드": 20, "어플": 15, "설치": 15, "원격": 25,
-            "신분증": 15, 
-            
-            # Contextual / Persuasion
-            "양도": 20, "판매": 20, "대여": 20, "가족": 10, "자녀": 10, "엄마": 10, "아빠": 10,
-            "대출": 15, "신용": 15, "등급": 10, "저금리": 15, "상환": 15,
-            "명의": 15, "도망": 15, "구속": 20, "영장": 20,
-            "서울중앙지검": 30, "사건": 15, "번호": 10,
-            "은행": 10, "용도": 10, "적금": 10,
-            
-            # Additional Keywords from Analysis Logs
-            "발급": 10, "보호": 10, "등록": 10, "금융": 10, "확인": 5
-        }
-        
-        detected = []
-        score = 0
-        
-        # Improved Keyword Matching (Partial Match Guard & Spacing Fix)
-        # Check against BOTH the original text and normalized text (no spaces)
-        # This fixes STT issues like "대포 통장" not matching "대포통장"
-        normalized_text = text.replace(" ", "")
-        
-        for word, weight in keywords.items():
-            if word in text or word in normalized_text:
-                if word not in detected: # Prevent double counting
-                    detected.append(word)
-                    score += weight
-        
-        # Risk Score Logic
-        # Max score is capped at 100.
-        # If "High Risk" keywords (>15) are found, boost score significantly
-        if any(keywords[w] >= 20 for w in detected):
-            score = max(score, 60) # High risk -> Immediate alert level
-        elif any(keywords[w] >= 15 for w in detected):
-            score = max(score, 35) # Moderate risk -> Warning level
-            
-        risk_score = min(score, 100) # Ensure 0-100 range
+            with stage("stt"):
+                text = stt_backend.transcribe(audio.pcm16_bytes(), audio.sr)
+        if not text:
+            raise sr.UnknownValueError()
+
+        # Compiled multi-pattern match (whitespace-insensitive, so STT splits
+        # like "대포 통장" still match "대포통장")
+        detected, risk_score = keyword_scanner.analyze(text)
         
         # --- Summarization ---
         summary_text = ""
@@ -988,7 +927,8 @@ def analyze_context(file_path):
                 max_len = min(100, int(len(text) / 2))
                 min_len = min(20, int(len(text) / 4))
                 
-                summary_result = summarization_pipeline(text, max_length=max_len, min_length=min_len, do_sample=False)
+                with stage("summarization"):
+                    summary_result = summarization_pipeline(text, max_length=max_len, min_length=min_len, do_sample=False)
                 summary_text = summary_result[0]['summary_text']
             except Exception as e:
                 print(f"Summarization error: {e}")
@@ -1007,36 +947,169 @@ def analyze_context(file_path):
     except Exception as e:
         print(f"Context analysis error: {e}")
         return {"text": "(분석 오류)", "summary": "", "detected_keywords": [], "risk_score": 0}
-    finally:
-        # Clean up converted WAV file
-        if wav_path and os.path.exists(wav_path):
-            try:
-                os.remove(wav_path)
-            except:
-                pass
 
-@app.post("/register_voice")
-async def register_voice(name: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+def new_stage_planner(profile):
+    return StagePlanner(
+        profile,
+        low=THRESHOLD_LOW_CONFIDENCE,
+        moderate=THRESHOLD_MODERATE,
+        high_risk_weight=ANALYSIS_ESCALATION_KEYWORD_WEIGHT,
+    )
+
+def save_upload_to_temp(file):
     with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
         shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+        return tmp.name
+
+def save_upload_with_hash(file, directory=None):
+    """save_upload_to_temp plus a streaming SHA-256 of the upload bytes"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1], dir=directory) as tmp:
+        content_hash = copy_and_hash(file.file, tmp)
+        return tmp.name, content_hash
+
+async def run_dsp_stage(name, fn, *args, **kwargs):
+    """run_dsp, timed inside the worker and recorded as stage `name`"""
+    result, wall, cpu = await run_dsp(timed_call, fn, *args, **kwargs)
+    record_stage(name, wall, cpu)
+    return result
+
+async def extract_mel_spectrogram_async(audio, n_mels=128, duration=3):
+    """extract_mel_spectrogram on the DSP process pool"""
+    try:
+        return await run_dsp_stage("mel", dsp.mel_spectrogram, audio.head(duration), sr=audio.sr, n_mels=n_mels, duration=duration)
+    except Exception as e:
+        print(f"Error extracting features: {e}")
+        return None
+
+async def extract_voice_fingerprint_async(audio):
+    """Voice ID fingerprint (mean MFCC of the first 10s) on the DSP process pool"""
+    try:
+        return await run_dsp_stage("fingerprint", dsp.mfcc_fingerprint, audio.head(10), sr=audio.sr)
+    except Exception as e:
+        print(f"Fingerprint error: {e}")
+        return None
+
+def aggregate_window_scores(scores):
+    """Window scores -> summary; the verdict uses the mean of the top quarter of windows"""
+    arr = np.asarray(scores, dtype=np.float32)
+    k = max(1, int(np.ceil(len(arr) / 4)))
+    return {
+        "mean": float(arr.mean()),
+        "max": float(arr.max()),
+        "flagged_ratio": float(np.mean(arr >= THRESHOLD_MODERATE)),
+        "aggregate_score": float(np.sort(arr)[-k:].mean()),
+    }
+
+async def score_windows(audio):
+    """
+    Score the whole recording with overlapping 3s windows.
+    One block-wise STFT covers the full signal; windows are normalized and
+    sent to the CNN-LSTM batcher WINDOW_CHUNK at a time to bound memory.
+    Returns (windowed result, first normalized window for feature details).
+    """
+    log_mel = await run_dsp_stage("mel", dsp.log_mel_spectrogram, audio.samples, sr=audio.sr)
+    window_frames = dsp.window_frames_for(audio.sr, WINDOW_SECONDS)
+    hop_frames = max(1, int(round(WINDOW_HOP_SECONDS * audio.sr / dsp.HOP_LENGTH)))
+    windows = dsp.mel_windows(log_mel, window_frames)
+    starts = dsp.window_starts(log_mel.shape[1], window_frames, hop_frames)
+
+    scores = []
+    first_window = None
+    for i in range(0, len(starts), WINDOW_CHUNK):
+        # Fancy indexing copies only this chunk of windows out of the strided view
+        batch = await run_inference(traced("mel_normalize", dsp.normalize_windows), windows[starts[i:i + WINDOW_CHUNK]])
+        if first_window is None:
+            first_window = batch[0]
+        with stage("cnn_predict", cpu=False):
+            predictions = await cnn_batcher.predict_many_async(batch[..., np.newaxis])
+        scores.extend(float(p[0]) for p in predictions)
+
+    frame_seconds = dsp.HOP_LENGTH / audio.sr
+    windowed = aggregate_window_scores(scores)
+    windowed.update({
+        "window_seconds": WINDOW_SECONDS,
+        "hop_seconds": hop_frames * frame_seconds,
+        "windows": [
+            {"start": round(float(start) * frame_seconds, 2), "end": round(float(start) * frame_seconds + WINDOW_SECONDS, 2), "score": score}
+            for start, score in zip(starts, scores)
+        ],
+    })
+    return windowed, first_window
+
+def identify_speaker(fingerprint):
+    """Voice ID: best-matching registered voice above the identification threshold"""
+    speaker_id = "Unknown"
+    max_similarity = 0
+
+    # Single matrix-vector top-k query against the in-memory index
+    matches = voice_index.search(fingerprint, k=1)
+    if matches and matches[0][1] > 0:
+        speaker_id, max_similarity = matches[0]
+
+    if max_similarity < 70: # Threshold for identification
+        speaker_id = "Unknown"
+    return speaker_id, max_similarity
+
+def save_analysis_log(db, filename, result):
+    with stage("db_write"):
+        log = AnalysisLog(filename=filename, result=result)
+        db.add(log)
+        db.commit()
+        return log.id
+
+def save_analysis_logs(db, entries):
+    """Insert (filename, result) rows in one transaction"""
+    with stage("db_write"):
+        db.add_all([AnalysisLog(filename=filename, result=result) for filename, result in entries])
+        db.commit()
+
+def upsert_voice(db, name, fingerprint):
+    # Validate against the index first: the DB row and the index must not disagree
+    dim = voice_index.dim
+    if dim is not None and np.asarray(fingerprint).size != dim:
+        raise ValueError(f"Fingerprint dim {np.asarray(fingerprint).size} != index dim {dim}")
+
+    # Check if voice exists
+    existing_voice = db.query(Voice).filter(Voice.name == name).first()
+    if existing_voice:
+         # Update existing
+         existing_voice.set_fingerprint(fingerprint)
+    else:
+        # Create new
+        new_voice = Voice(name=name)
+        new_voice.set_fingerprint(fingerprint)
+        db.add(new_voice)
+
+    db.commit()
+    try:
+        voice_index.upsert(name, fingerprint)
+    except Exception as e:
+        print(f"⚠️ Voice index update failed ({e}), rebuilding from the DB")
+        load_voice_index()
+
+def predict_audio_hf(audio):
+    # Process shared buffer for HF model
+    inputs = audio_hf_processor(audio.samples, sampling_rate=audio.sr, return_tensors="pt")
+
+    with torch.no_grad():
+        outputs = audio_hf_model(**inputs)
+        logits = outputs.logits
+        return F.softmax(logits, dim=-1)
+
+@app.post("/register_voice")
+async def register_voice(name: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+    tmp_path = await run_io(save_upload_to_temp, file)
 
     try:
-        fingerprint = extract_voice_fingerprint(tmp_path)
+        audio = await run_inference(decode_audio, tmp_path, filename=file.filename)
+        fingerprint = await extract_voice_fingerprint_async(audio) if audio is not None else None
         if fingerprint is None:
             raise HTTPException(status_code=400, detail="Could not extract voice fingerprint.")
         
-        # Check if voice exists
-        existing_voice = db.query(Voice).filter(Voice.name == name).first()
-        if existing_voice:
-             # Update existing
-             existing_voice.fingerprint = fingerprint.tolist()
-        else:
-            # Create new
-            new_voice = Voice(name=name, fingerprint=fingerprint.tolist())
-            db.add(new_voice)
-        
-        db.commit()
+        try:
+            await run_io(upsert_voice, db, name, fingerprint)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Could not register voice: {e}")
         return {"status": "success", "message": f"Voice registered for {name}"}
     finally:
         if os.path.exists(tmp_path):
@@ -1044,23 +1117,21 @@ async def register_voice(name: str = Form(...), file: UploadFile = File(...), db
 
 @app.post("/verify_voice")
 async def verify_voice(target_name: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
-    target_voice = db.query(Voice).filter(Voice.name == target_name).first()
-    if not target_voice:
+    if target_name not in voice_index:
         raise HTTPException(status_code=404, detail="Target voice not found.")
         
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+    tmp_path = await run_io(save_upload_to_temp, file)
 
     try:
-        fingerprint = extract_voice_fingerprint(tmp_path)
+        audio = await run_inference(decode_audio, tmp_path, filename=file.filename)
+        fingerprint = await extract_voice_fingerprint_async(audio) if audio is not None else None
         if fingerprint is None:
             raise HTTPException(status_code=400, detail="Could not extract voice fingerprint.")
         
-        target_fp = np.array(target_voice.fingerprint)
-        # Cosine distance (0 = identical, 2 = opposite). Similarity = 1 - distance
-        dist = cosine(fingerprint, target_fp)
-        similarity = (1 - dist) * 100
+        # Cosine similarity against the indexed (L2-normalized) fingerprint
+        similarity = voice_index.similarity(target_name, fingerprint)
+        if similarity is None:
+            raise HTTPException(status_code=404, detail="Target voice not found.")
         
         is_match = similarity > 80 # Threshold
         
@@ -1073,184 +1144,266 @@ async def verify_voice(target_name: str = Form(...), file: UploadFile = File(...
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
 
-@app.post("/analyze")
-async def analyze_audio(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    if model is None:
-        # Fallback if model is missing: return a mock error or simulation
-        # For now, let's return a 503 Service Unavailable
-        raise HTTPException(status_code=503, detail="Model not loaded. Please place 'best_model.h5' in the backend directory.")
-
-    # Save uploaded file to temp
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
-
-    try:
+async def cnn_lstm_stage(audio, scoring):
+    """Primary CNN-LSTM score: first 3s ("head") or every window ("windowed")"""
+    windowed_result = None
+    if scoring == "windowed":
+        # Score every 3s window of the recording and aggregate
+        windowed_result, mel_spec = await score_windows(audio)
+        cnn_lstm_score = windowed_result["aggregate_score"]
+    else:
         # Preprocess
-        mel_spec = extract_mel_spectrogram(tmp_path)
-        
+        mel_spec = await extract_mel_spectrogram_async(audio)
+
         if mel_spec is None:
             raise HTTPException(status_code=400, detail="Could not process audio file.")
 
-        # Prepare for model (add batch and channel dimensions)
-        # Shape: (1, 128, 94, 1)
-        X = mel_spec[np.newaxis, ..., np.newaxis]
-
-        # Predict with primary CNN-LSTM model
-        prediction = model.predict(X)
-        cnn_lstm_score = float(prediction[0][0]) # Probability of being FAKE (1)
+        # Prepare for model (add channel dimension; the batcher adds the batch one)
+        # Shape: (128, 94, 1) -> batched as (N, 128, 94, 1)
+        X = mel_spec[..., np.newaxis]
 
-        # Try secondary HF model for ensemble
-        hf_score = None
-        if audio_hf_model is not None and audio_hf_processor is not None:
-            try:
-                # Load audio for HF model
-                audio_data, sr = librosa.load(tmp_path, sr=16000, mono=True)
+        # Predict with primary CNN-LSTM model (batched with concurrent requests)
+        with stage("cnn_predict", cpu=False):
+            prediction = await cnn_batcher.predict_async(X)
+        cnn_lstm_score = float(prediction[0]) # Probability of being FAKE (1)
+    return {"score": cnn_lstm_score, "mel_spec": mel_spec, "windowed": windowed_result}
 
-                # Process for HF model
-                inputs = audio_hf_processor(audio_data, sampling_rate=sr, return_tensors="pt")
+def hf_audio_stage(audio):
+    """Secondary HF model score for the ensemble (None when unavailable)"""
+    if audio_hf_model is None or audio_hf_processor is None:
+        return None
+    try:
+        with stage("hf_audio_model"):
+            probs = predict_audio_hf(audio)
 
-                with torch.no_grad():
-                    outputs = audio_hf_model(**inputs)
-                    logits = outputs.logits
-                    probs = F.softmax(logits, dim=-1)
+        # Assume label 1 is fake (check model config)
+        hf_score = float(probs[0][1]) if probs.shape[1] > 1 else float(probs[0][0])
+        print(f"HF Audio Model Score: {hf_score:.4f}")
+        return hf_score
+    except Exception as e:
+        print(f"HF Audio model prediction error: {e}")
+        return None
 
-                # Assume label 1 is fake (check model config)
-                hf_score = float(probs[0][1]) if probs.shape[1] > 1 else float(probs[0][0])
-                print(f"HF Audio Model Score: {hf_score:.4f}")
-            except Exception as e:
-                print(f"HF Audio model prediction error: {e}")
+def deepfake_verdict(cnn, hf_score):
+    """Ensemble score -> verdict, confidence and feature details"""
+    cnn_lstm_score = cnn["score"]
+    mel_spec = cnn["mel_spec"]
 
-        # Ensemble: Weighted average if both models available
-        if hf_score is not None:
-            # Weight: 70% CNN-LSTM (more trained), 30% HF model
-            score = cnn_lstm_score * 0.7 + hf_score * 0.3
-            print(f"Ensemble Score: CNN-LSTM={cnn_lstm_score:.4f}, HF={hf_score:.4f}, Final={score:.4f}")
-        else:
-            score = cnn_lstm_score
-
-        # Improved Thresholding with confidence zones
-        THRESHOLD_HIGH_CONFIDENCE = 0.70  # High confidence deepfake
-        THRESHOLD_MODERATE = 0.55          # Moderate confidence deepfake
-        THRESHOLD_LOW_CONFIDENCE = 0.30    # High confidence real
-
-        if score >= THRESHOLD_HIGH_CONFIDENCE:
-            # High confidence deepfake
-            is_deepfake = True
-            confidence = min(score * 100, 99)
-        elif score >= THRESHOLD_MODERATE:
-            # Moderate confidence deepfake
-            is_deepfake = True
-            confidence = score * 85  # Reduced confidence for moderate zone
-        elif score > THRESHOLD_LOW_CONFIDENCE:
-            # Uncertain zone - use stricter threshold
-            is_deepfake = score > 0.50
-            # Penalize confidence in uncertain zone
-            confidence = max(score, 1 - score) * 70
-        else:
-            # High confidence real
-            is_deepfake = False
-            confidence = min((1 - score) * 100, 99)
-
-        # Real feature-based analysis
-        # Analyze spectral characteristics
-        mel_mean = np.mean(mel_spec)
-        mel_std = np.std(mel_spec)
-        mel_max = np.max(mel_spec)
-        mel_min = np.min(mel_spec)
-
-        # Frequency analysis - check for unnatural frequency patterns
-        freq_range = mel_max - mel_min
-        freq_variance = np.var(mel_spec)
-        frequency_score = min(int((freq_variance / (freq_range + 1e-6)) * 100), 100)
-
-        # Temporal pattern - check consistency over time
-        temporal_variance = np.var(np.mean(mel_spec, axis=0))
-        temporal_score = min(int(temporal_variance * 50), 100)
-
-        # Acoustic feature - based on model score
-        acoustic_score = int(score * 100)
-
-        details = {
+    # Ensemble: Weighted average if both models available
+    if hf_score is not None:
+        # Weight: 70% CNN-LSTM (more trained), 30% HF model
+        score = cnn_lstm_score * 0.7 + hf_score * 0.3
+        print(f"Ensemble Score: CNN-LSTM={cnn_lstm_score:.4f}, HF={hf_score:.4f}, Final={score:.4f}")
+    else:
+        score = cnn_lstm_score
+
+    # Improved Thresholding with confidence zones
+    if score >= THRESHOLD_HIGH_CONFIDENCE:
+        # High confidence deepfake
+        is_deepfake = True
+        confidence = min(score * 100, 99)
+    elif score >= THRESHOLD_MODERATE:
+        # Moderate confidence deepfake
+        is_deepfake = True
+        confidence = score * 85  # Reduced confidence for moderate zone
+    elif score > THRESHOLD_LOW_CONFIDENCE:
+        # Uncertain zone - use stricter threshold
+        is_deepfake = score > 0.50
+        # Penalize confidence in uncertain zone
+        confidence = max(score, 1 - score) * 70
+    else:
+        # High confidence real
+        is_deepfake = False
+        confidence = min((1 - score) * 100, 99)
+
+    # Real feature-based analysis
+    # Analyze spectral characteristics
+    mel_max = np.max(mel_spec)
+    mel_min = np.min(mel_spec)
+
+    # Frequency analysis - check for unnatural frequency patterns
+    freq_range = mel_max - mel_min
+    freq_variance = np.var(mel_spec)
+    frequency_score = min(int((freq_variance / (freq_range + 1e-6)) * 100), 100)
+
+    # Temporal pattern - check consistency over time
+    temporal_variance = np.var(np.mean(mel_spec, axis=0))
+    temporal_score = min(int(temporal_variance * 50), 100)
+
+    # Acoustic feature - based on model score
+    acoustic_score = int(score * 100)
+
+    return {
+        "isDeepfake": is_deepfake,
+        "confidence": confidence,
+        "score": score,
+        "details": {
             "frequencyAnalysis": frequency_score,
             "temporalPattern": temporal_score,
             "acousticFeature": acoustic_score
-        }
+        },
+        "windowed": cnn["windowed"],
+    }
+
+async def speaker_demographics_stage(audio, diarization):
+    """Primary speaker's age/gender, falling back to whole-file analysis"""
+    if diarization and len(diarization) > 0:
+        # Use the primary speaker (longest duration) for the main display
+        primary_speaker = max(diarization, key=lambda x: x['duration'])
+        speaker_demographics = primary_speaker['demographics']
+
+        # Fallback: If diarization yielded "Unknown" gender, try whole-file analysis
+        if speaker_demographics is None or speaker_demographics.get('gender') == 'Unknown':
+            print("Diarization gender unknown, falling back to whole-file analysis")
+            whole_file_demographics = await run_inference(traced("age_gender", predict_age_gender), audio.head(60))
+            if whole_file_demographics:
+                speaker_demographics = whole_file_demographics
+                # Update the primary speaker's demographics in the list too for consistency
+                primary_speaker['demographics'] = whole_file_demographics
+        return speaker_demographics
+
+    # Fallback to single-speaker analysis (up to 60s to capture more context)
+    return await run_inference(traced("age_gender", predict_age_gender), audio.head(60))
+
+def speaker_transcript_stage(audio, diarization):
+    """Speaker-separated transcript ([] without diarization segments)"""
+    if not diarization:
+        return []
+    try:
+        return transcribe_segments(audio, diarization)
+    except Exception as e:
+        print(f"Speaker transcription error: {e}")
+        return []
 
-        # Context Analysis
-        context_result = analyze_context(tmp_path)
-        
-        # Speaker Diarization & Age/Gender Analysis
-        diarization_result = diarize_audio(tmp_path)
-        speaker_demographics = None
-        speaker_transcript = []
-
-        if diarization_result and len(diarization_result) > 0:
-            # Use the primary speaker (longest duration) for the main display
-            primary_speaker = max(diarization_result, key=lambda x: x['duration'])
-            speaker_demographics = primary_speaker['demographics']
-            
-            # Fallback: If diarization yielded "Unknown" gender, try whole-file analysis
-            if speaker_demographics is None or speaker_demographics.get('gender') == 'Unknown':
-                print("Diarization gender unknown, falling back to whole-file analysis")
-                whole_file_demographics = predict_age_gender(tmp_path)
-                if whole_file_demographics:
-                    speaker_demographics = whole_file_demographics
-                    # Update the primary speaker's demographics in the list too for consistency
-                    primary_speaker['demographics'] = whole_file_demographics
-            
-            # Generate Speaker-Separated Transcript
-            try:
-                speaker_transcript = transcribe_segments(tmp_path, diarization_result)
-            except Exception as e:
-                print(f"Speaker transcription error: {e}")
-        else:
-            # Fallback to single-speaker analysis
-            speaker_demographics = predict_age_gender(tmp_path)
-
-        # Voice ID (Identify speaker)
-        fingerprint = extract_voice_fingerprint(tmp_path)
-        speaker_id = "Unknown"
-        max_similarity = 0
-        
-        if fingerprint is not None:
-            voices = db.query(Voice).all()
-            for voice in voices:
-                fp = np.array(voice.fingerprint)
-                dist = cosine(fingerprint, fp)
-                sim = (1 - dist) * 100
-                if sim > max_similarity:
-                    max_similarity = sim
-                    speaker_id = voice.name
-            
-            if max_similarity < 70: # Threshold for identification
-                speaker_id = "Unknown"
+async def voice_id_stage(audio):
+    """Voice ID: (speaker id, similarity %) against the enrolled voices"""
+    fingerprint = await extract_voice_fingerprint_async(audio)
+    if fingerprint is None:
+        return "Unknown", 0
+    return identify_speaker(fingerprint)
 
+def build_analysis_graph(planner, scoring):
+    """
+    /analyze as a stage graph. Everything except the verdict depends only on
+    the decoded audio, so CNN, STT, diarization and Voice ID run concurrently;
+    the latency approaches the longest path (usually diarization -> STT).
+    Stages outside the planner's profile wait for the stages that could
+    escalate it, and are skipped if it is not escalated.
+    """
+    def whole_file_context(audio):
+        # "standard" without diarization: whole-file STT; a high-risk keyword escalates to "full"
+        context = analyze_context(audio)
+        planner.observe_context(context, keyword_scanner.weights)
+        return context
+
+    def deepfake(cnn, hf_score):
+        verdict = deepfake_verdict(cnn, hf_score)
+        # Cheap verdict first: an uncertain or suspicious score escalates the profile
+        planner.observe_deepfake(verdict["score"])
+        return verdict
+
+    def context(audio, transcript, whole_file_context):
+        # Reuses the segment transcripts; whole-file STT only without them
+        if whole_file_context is not None:
+            return whole_file_context
+        return analyze_context(audio, transcript)
+
+    graph = StageGraph()
+    graph.add("cnn", lambda audio: cnn_lstm_stage(audio, scoring), deps=("audio",))
+    graph.add("hf_score", hf_audio_stage, deps=("audio",), pool="inference")
+    graph.add("deepfake", deepfake, deps=("cnn", "hf_score"), pool="inference")
+    graph.add("whole_file_context", whole_file_context, deps=("audio",), pool="io",
+              when=lambda: planner.wants("context") and not planner.wants("diarization"),
+              gates=("deepfake",))
+    graph.add("diarization", diarize_audio, deps=("audio",), pool="inference",
+              when=lambda: planner.wants("diarization"), gates=("deepfake", "whole_file_context"))
+    graph.add("demographics", speaker_demographics_stage, deps=("audio", "diarization"))
+    graph.add("transcript", speaker_transcript_stage, deps=("audio", "diarization"), pool="io")
+    graph.add("context", context, deps=("audio", "transcript"), optional=("whole_file_context",), pool="io")
+    graph.add("voice_id", voice_id_stage, deps=("audio",),
+              when=lambda: planner.wants("voice_id"), gates=("deepfake", "whole_file_context"))
+    return graph
+
+async def run_audio_analysis(tmp_path, filename, scoring="head", profile="full", on_stage=None):
+    """
+    /analyze pipeline for one saved upload (no DB logging). `profile` picks
+    the stages to run (see pipeline.py); cheap stages may escalate it.
+    `on_stage` receives stage progress (see StageGraph.run).
+    """
+    planner = new_stage_planner(profile)
+    # Decode once: every stage below shares this 16kHz mono buffer
+    audio = await run_inference(traced("decode", decode_audio), tmp_path, filename=filename)
+    if audio is None:
+        raise HTTPException(status_code=400, detail="Could not process audio file.")
+    observe_input("audio_seconds", audio.duration)
+
+    results, _ = await build_analysis_graph(planner, scoring).run(on_stage=on_stage, audio=audio)
+    verdict = results["deepfake"]
+    speaker_id, max_similarity = results["voice_id"] or ("Unknown", 0)
+
+    analysis_result = {
+        "isDeepfake": verdict["isDeepfake"],
+        "confidence": verdict["confidence"],
+        "score": verdict["score"],
+        "details": verdict["details"],
+        "windowed": verdict["windowed"],
+        "context": results["context"] or results["whole_file_context"],
+        "speaker": {
+            "id": speaker_id,
+            "similarity": max_similarity,
+            "demographics": results["demographics"],
+            "diarization": results["diarization"],
+            "transcript": results["transcript"] or []
+        },
+        "analysis": planner.as_dict()
+    }
+
+    return analysis_result
+
+def analysis_cache_key(content_hash, scoring, profile):
+    # Identical uploads share one computation; Voice ID depends on the enrolled voices
+    return make_key("analyze", content_hash, ANALYSIS_CACHE_VERSION,
+                    scoring=scoring, profile=profile, voices=voice_index.digest)
 
+@app.post("/analyze")
+async def analyze_audio(file: UploadFile = File(...), scoring: str = Form("head"), timings: bool = Form(False),
+                        profile: str = Form(ANALYSIS_DEFAULT_PROFILE), db: Session = Depends(get_db)):
+    """
+    scoring: "head" scores the first 3s (default), "windowed" scores the whole recording
+    timings: include per-stage wall/CPU times for this request in the response
+    profile: "fast" (deepfake only), "standard" (+ context, Voice ID) or "full" (+ diarization);
+             escalates automatically on risky intermediate results
+    """
+    if profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of: {', '.join(PROFILES)}")
+    if scoring not in SCORING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown scoring '{scoring}'. Use one of: {', '.join(SCORING_MODES)}")
+    trace = start_trace("analyze")
+    if model is None:
+        # Fallback if model is missing: return a mock error or simulation
+        # For now, let's return a 503 Service Unavailable
+        raise HTTPException(status_code=503, detail="Model not loaded. Please place 'best_model.h5' in the backend directory.")
 
+    # Save uploaded file to temp, hashing the bytes on the way
+    tmp_path, content_hash = await run_io(save_upload_with_hash, file)
 
-        analysis_result = {
-            "isDeepfake": is_deepfake,
-            "confidence": confidence,
-            "score": score,
-            "details": details,
-            "context": context_result,
-            "speaker": {
-                "id": speaker_id,
-                "similarity": max_similarity,
-                "demographics": speaker_demographics,
-                "diarization": diarization_result,
-                "transcript": speaker_transcript
-            }
-        }
+    try:
+        key = analysis_cache_key(content_hash, scoring, profile)
+        analysis_result, cache_status = await result_cache.get_or_compute(
+            key, lambda: run_audio_analysis(tmp_path, file.filename, scoring, profile))
+        if cache_status != "miss":
+            print(f"Result cache {cache_status}: {file.filename}")
 
         # Save to DB
-        log = AnalysisLog(filename=file.filename, result=analysis_result)
-        db.add(log)
-        db.commit()
+        await run_io(save_analysis_log, db, file.filename, analysis_result)
 
+        request_timings = trace.finish()
+        if timings:
+            analysis_result["timings"] = dict(request_timings, cache=cache_status)
         return analysis_result
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Prediction error: {e}")
         import traceback
@@ -1279,7 +1432,7 @@ def list_voices(db: Session = Depends(get_db)):
     return {"voices": [v.name for v in voices]}
 
 @app.delete("/delete_voice")
-async def delete_voice(name: str, db: Session = Depends(get_db)):
+def delete_voice(name: str, db: Session = Depends(get_db)):
     voice = db.query(Voice).filter(Voice.name == name).first()
     if not voice:
         raise HTTPException(status_code=404, detail="Voice not found")
@@ -1287,6 +1440,7 @@ async def delete_voice(name: str, db: Session = Depends(get_db)):
     try:
         db.delete(voice)
         db.commit()
+        voice_index.remove(name)
         return {"status": "success", "message": f"Voice '{name}' deleted"}
     except Exception as e:
         db.rollback()
@@ -1326,26 +1480,490 @@ def get_history(db: Session = Depends(get_db)):
     return {"history": sanitized_logs}
 
 @app.post("/analyze_image")
-async def analyze_image(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+async def analyze_image(file: UploadFile = File(...), timings: bool = Form(False), visuals: bool = Form(True),
+                        tiling: str = Form("auto")):
+    """
+    visuals: include the ELA and outlined-region images (base64 JPEG)
+    tiling: "on" adds a per-tile heatmap and bounds memory for very large images;
+            "auto" (default) enables it above VOICESHIELD_TILED_AUTO_MP megapixels
+    """
+    if tiling not in IMAGE_TILING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown tiling '{tiling}'. Use one of: {', '.join(IMAGE_TILING_MODES)}")
+    trace = start_trace("analyze_image")
+    tmp_path, content_hash = await run_io(save_upload_with_hash, file)
 
-    try:
-        result = analyze_image_combined(tmp_path)
-        
+    async def compute():
+        if tiled:
+            try:
+                result = await run_inference(analyze_image_tiled, tmp_path, visuals)
+            except ImageTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            match = None
+        else:
+            hashes, match = await run_inference(find_near_duplicate, tmp_path)
+            result = await run_inference(analyze_image_combined, tmp_path, visuals,
+                                         match["model_scores"] if match else None)
         if result is None:
              raise HTTPException(status_code=400, detail="Could not analyze image.")
-             
+        result["cache_match"] = public_match(match)
+        if not tiled and match is None:
+            await run_io(remember_image_verdict, hashes, content_hash, result)
+        return result
+
+    try:
+        tiled = await run_io(use_tiling, tmp_path, tiling)
+        key = make_key("analyze_image", content_hash, IMAGE_CACHE_VERSION, visuals=visuals, tiled=tiled)
+        result, cache_status = await result_cache.get_or_compute(key, compute)
+        if cache_status != "miss":
+            print(f"Result cache {cache_status}: {file.filename}")
+            result["cache_match"] = {"type": "exact"}  # Same bytes, whatever matched the first time
+        request_timings = trace.finish()
+        if timings:
+            result["timings"] = dict(request_timings, cache=cache_status)
         return result
     finally:
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
 
+# Background analysis jobs for long recordings: POST /jobs/analyze returns at
+# once, JOB_WORKERS jobs run at a time, and GET /jobs/{id} reports progress
+JOB_WORKERS = int(os.environ.get("VOICESHIELD_JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.environ.get("VOICESHIELD_JOB_QUEUE_MAX", "100"))
+JOB_UPLOAD_DIR = os.environ.get("VOICESHIELD_JOB_UPLOAD_DIR", "./job_uploads")
+JOB_MAX_ATTEMPTS = int(os.environ.get("VOICESHIELD_JOB_MAX_ATTEMPTS", "3"))  # runs before an interrupted job is failed
+
+def job_partial_result(name, result):
+    """Client-facing piece of a finished stage (None for internal stages)"""
+    if result is None:
+        return None
+    if name == "deepfake":
+        return {key: result[key] for key in ("isDeepfake", "confidence", "score", "details")}
+    if name in ("whole_file_context", "context"):
+        return {"context": result}
+    if name == "voice_id":
+        return {"speaker_id": result[0], "similarity": result[1]}
+    if name in ("demographics", "diarization", "transcript"):
+        return {name: result}
+    return None
+
+def remove_upload(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"Cleanup error: {e}")
+
+async def process_analysis_job(job):
+    params = job["params"]
+    progress = JobProgress(job["id"], partial_fn=job_partial_result)
+    try:
+        if not job["upload_path"] or not os.path.exists(job["upload_path"]):
+            raise HTTPException(status_code=410, detail="Upload for this job is no longer available.")
+        analysis_result, cache_status = await result_cache.get_or_compute(
+            job["cache_key"],
+            lambda: run_audio_analysis(job["upload_path"], job["filename"], params.get("scoring", "head"),
+                                       params.get("profile", "full"), on_stage=progress))
+        await progress.wait()
+
+        db = SessionLocal()
+        try:
+            log_id = await run_io(save_analysis_log, db, job["filename"], analysis_result)
+        finally:
+            db.close()
+        await run_io(update_job, job["id"], status="done", result=jsonable(analysis_result), log_id=log_id,
+                     progress=dict(progress.stages), partial=dict(progress.partial), upload_path=None)
+        remove_upload(job["upload_path"])
+        print(f"✅ Job {job['id']} done ({cache_status})")
+    except Exception as e:
+        await progress.wait()
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"Job {job['id']} failed: {error}")
+        await run_io(update_job, job["id"], status="failed", error=str(error),
+                     progress=dict(progress.stages), partial=dict(progress.partial), upload_path=None)
+        remove_upload(job["upload_path"])
+    # Cancellation (shutdown/reload) keeps the upload: the row stays "running"
+    # and requeue_interrupted_jobs() resumes it on the next start
+
+job_workers = JobWorkerPool(process_analysis_job, workers=JOB_WORKERS)
+
+@app.post("/jobs/analyze", status_code=202)
+async def submit_analysis_job(file: UploadFile = File(...), scoring: str = Form("head"),
+                              profile: str = Form(ANALYSIS_DEFAULT_PROFILE)):
+    """Queue an /analyze run; poll GET /jobs/{job_id} for progress and the result"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please place 'best_model.h5' in the backend directory.")
+    if profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of: {', '.join(PROFILES)}")
+    if scoring not in SCORING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown scoring '{scoring}'. Use one of: {', '.join(SCORING_MODES)}")
+    if await run_io(queued_count) >= JOB_QUEUE_MAX:
+        raise HTTPException(status_code=429, detail="Analysis queue is full, please retry later.")
+
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    upload_path, content_hash = await run_io(save_upload_with_hash, file, JOB_UPLOAD_DIR)
+    key = analysis_cache_key(content_hash, scoring, profile)
+
+    # A retried upload attaches to the job that is already queued/running
+    job_id, created = await run_io(submit_job, file.filename, upload_path, key, {"scoring": scoring, "profile": profile})
+    if not created:
+        remove_upload(upload_path)
+        return {"job_id": job_id, "status": "queued", "deduplicated": True}
+    job_workers.notify()
+    return {"job_id": job_id, "status": "queued", "deduplicated": False}
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = await run_io(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Bulk screening: many files per request (multipart and/or .zip archives),
+# answered as NDJSON, one line per file as soon as it is done
+BATCH_MAX_FILES = int(os.environ.get("VOICESHIELD_BATCH_MAX_FILES", "200"))
+BATCH_MAX_FILE_BYTES = int(float(os.environ.get("VOICESHIELD_BATCH_MAX_FILE_MB", "100")) * 1024 * 1024)  # per zip member
+BATCH_MAX_TOTAL_BYTES = int(float(os.environ.get("VOICESHIELD_BATCH_MAX_TOTAL_MB", "1024")) * 1024 * 1024)  # all members
+BATCH_AUDIO_CONCURRENCY = int(os.environ.get("VOICESHIELD_BATCH_AUDIO_CONCURRENCY", "4"))  # files in flight
+BATCH_IMAGE_SIZE = int(os.environ.get("VOICESHIELD_BATCH_IMAGE_SIZE", "8"))  # images per model forward pass
+BATCH_LOG_FLUSH = int(os.environ.get("VOICESHIELD_BATCH_LOG_FLUSH", "25"))  # AnalysisLog rows per commit
+
+def save_batch_uploads(files):
+    """[(filename, path, content_hash)] for every upload; .zip uploads are expanded"""
+    saved = []
+    extracted = 0  # Uncompressed bytes taken from zip archives so far
+    try:
+        for file in files:
+            if not file.filename.lower().endswith(".zip"):
+                path, content_hash = save_upload_with_hash(file)
+                saved.append((file.filename, path, content_hash))
+            else:
+                with zipfile.ZipFile(file.file) as archive:
+                    for info in archive.infolist():
+                        name = os.path.basename(info.filename)
+                        if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                            continue
+                        # Checked before extracting (zip bombs); zipfile never inflates a member past file_size
+                        if info.file_size > BATCH_MAX_FILE_BYTES:
+                            raise HTTPException(status_code=413, detail=f"'{name}' is too large (max {BATCH_MAX_FILE_BYTES // (1024 * 1024)} MB per file).")
+                        extracted += info.file_size
+                        if extracted > BATCH_MAX_TOTAL_BYTES:
+                            raise HTTPException(status_code=413, detail=f"Zip contents too large (max {BATCH_MAX_TOTAL_BYTES // (1024 * 1024)} MB per batch).")
+                        with archive.open(info) as member, \
+                                tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(name)[1]) as tmp:
+                            saved.append((name, tmp.name, copy_and_hash(member, tmp)))
+                        if len(saved) > BATCH_MAX_FILES:
+                            break
+            if len(saved) > BATCH_MAX_FILES:
+                raise HTTPException(status_code=413, detail=f"Too many files in one batch (max {BATCH_MAX_FILES}).")
+        if not saved:
+            raise HTTPException(status_code=400, detail="No files to analyze.")
+        return saved
+    except Exception as e:
+        for _, path, _ in saved:
+            remove_upload(path)
+        if isinstance(e, zipfile.BadZipFile):
+            raise HTTPException(status_code=400, detail=f"Invalid zip archive: {e}")
+        raise
+
+def ndjson_line(entry):
+    return json.dumps(jsonable(entry)) + "\n"
+
+def batch_entry(index, filename, result=None, cache_status=None, error=None):
+    if error is not None:
+        return {"index": index, "filename": filename, "status": "error", "error": error}
+    return {"index": index, "filename": filename, "status": "ok", "cache": cache_status, "result": result}
+
+async def stream_audio_batch(uploads, scoring, profile):
+    """
+    Runs up to BATCH_AUDIO_CONCURRENCY files at once. Their CNN-LSTM calls
+    meet in the shared micro-batcher, so inference is batched across files.
+    Log rows are committed BATCH_LOG_FLUSH at a time.
+    """
+    trace = start_trace("analyze_batch")
+    semaphore = asyncio.Semaphore(BATCH_AUDIO_CONCURRENCY)
+
+    async def analyze_one(index, filename, path, content_hash):
+        try:
+            async with semaphore:
+                key = analysis_cache_key(content_hash, scoring, profile)
+                result, cache_status = await result_cache.get_or_compute(
+                    key, lambda: run_audio_analysis(path, filename, scoring, profile))
+                return batch_entry(index, filename, result, cache_status)
+        except HTTPException as e:
+            return batch_entry(index, filename, error=e.detail)
+        except Exception as e:
+            print(f"Batch prediction error ({filename}): {e}")
+            return batch_entry(index, filename, error=str(e))
+        finally:
+            remove_upload(path)
+
+    tasks = [asyncio.ensure_future(analyze_one(index, *upload)) for index, upload in enumerate(uploads)]
+    db = SessionLocal()
+    pending_logs = []
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry = await next_done
+            if entry["status"] == "ok":
+                pending_logs.append((entry["filename"], entry["result"]))
+                if len(pending_logs) >= BATCH_LOG_FLUSH:
+                    await run_io(save_analysis_logs, db, pending_logs)
+                    pending_logs = []
+            else:
+                failed += 1
+            yield ndjson_line(entry)
+        if pending_logs:
+            await run_io(save_analysis_logs, db, pending_logs)
+            pending_logs = []
+        trace.finish()
+        yield ndjson_line({"done": True, "files": len(uploads), "failed": failed})
+    finally:
+        # Client went away: stop the remaining files but keep finished results
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            if pending_logs:
+                await run_io(save_analysis_logs, db, pending_logs)
+        finally:
+            db.close()
+
+def open_image_or_none(path):
+    try:
+        return open_image(path)
+    except Exception as e:
+        print(f"Image decode error: {e}")
+        return None
+
+async def stream_image_batch(uploads, visuals=False, tiling="auto"):
+    """
+    Cache hits are answered at once; misses are decoded in groups of
+    BATCH_IMAGE_SIZE, every AI model scores a group in one forward pass
+    (near-duplicates reuse their stored scores instead), and the per-image
+    heuristics (FFT, ELA) then run concurrently. Images that get tiled mode
+    run one at a time after the groups.
+    """
+    trace = start_trace("analyze_image_batch")
+    failed = 0
+    try:
+        misses = []
+        tiled_misses = []
+        for index, (filename, path, content_hash) in enumerate(uploads):
+            tiled = await run_io(use_tiling, path, tiling)
+            key = make_key("analyze_image", content_hash, IMAGE_CACHE_VERSION, visuals=visuals, tiled=tiled)
+            cached = await result_cache.get(key)
+            if cached is not None:
+                remove_upload(path)
+                cached["cache_match"] = {"type": "exact"}
+                yield ndjson_line(batch_entry(index, filename, cached, "hit"))
+                continue
+            if tiled:
+                tiled_misses.append((index, filename, path, key, None))
+                continue
+            hashes, match = await run_inference(find_near_duplicate, path)
+            misses.append((index, filename, path, key, (hashes, content_hash, match)))
+
+        async def finish(key, verdict, result):
+            match = verdict[2] if verdict else None
+            result["cache_match"] = public_match(match)
+            await result_cache.put(key, result)
+            if verdict is not None and match is None:
+                await run_io(remember_image_verdict, verdict[0], verdict[1], result)
+
+        for start in range(0, len(misses), BATCH_IMAGE_SIZE):
+            group = misses[start:start + BATCH_IMAGE_SIZE]
+            images = await asyncio.gather(*(run_inference(open_image_or_none, path) for _, _, path, _, _ in group))
+            # Near-duplicates reuse their stored model scores; the ensemble only sees the rest
+            unmatched = [img for img, item in zip(images, group) if img is not None and item[4][2] is None]
+            predictions = iter(await run_inference(image_ensemble.predict, unmatched)) if unmatched else iter(())
+
+            def model_scores(item, img):
+                if img is None:
+                    return None
+                match = item[4][2]
+                return match["model_scores"] if match else next(predictions)
+
+            async def analyze_one(item, img, model_predictions):
+                result = await run_inference(analyze_loaded_image, img, model_predictions, visuals) if img is not None else None
+                return item, result
+
+            pending = [analyze_one(item, img, model_scores(item, img)) for item, img in zip(group, images)]
+            for next_done in asyncio.as_completed(pending):
+                (index, filename, path, key, verdict), result = await next_done
+                remove_upload(path)
+                if result is None:
+                    failed += 1
+                    yield ndjson_line(batch_entry(index, filename, error="Could not analyze image."))
+                else:
+                    await finish(key, verdict, result)
+                    yield ndjson_line(batch_entry(index, filename, result, "near_duplicate" if verdict[2] else "miss"))
+
+        # Tiled images already batch their tiles; one at a time keeps memory bounded
+        for index, filename, path, key, verdict in tiled_misses:
+            try:
+                result = await run_inference(analyze_image_tiled, path, visuals)
+                error = "Could not analyze image."
+            except ImageTooLarge as e:
+                result, error = None, str(e)
+            remove_upload(path)
+            if result is None:
+                failed += 1
+                yield ndjson_line(batch_entry(index, filename, error=error))
+            else:
+                await finish(key, verdict, result)
+                yield ndjson_line(batch_entry(index, filename, result, "miss"))
+        trace.finish()
+        yield ndjson_line({"done": True, "files": len(uploads), "failed": failed})
+    finally:
+        for _, path, _ in uploads:
+            remove_upload(path)
+
+@app.post("/analyze_batch")
+async def analyze_audio_batch(files: List[UploadFile] = File(...), scoring: str = Form("head"),
+                              profile: str = Form(ANALYSIS_DEFAULT_PROFILE)):
+    """
+    /analyze for many recordings (multipart files and/or .zip archives).
+    Streams NDJSON: one {"index", "filename", "status", ...} line per file in
+    completion order, then a {"done": true} summary line.
+    """
+    if profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of: {', '.join(PROFILES)}")
+    if scoring not in SCORING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown scoring '{scoring}'. Use one of: {', '.join(SCORING_MODES)}")
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please place 'best_model.h5' in the backend directory.")
+    # Uploads are copied before streaming starts: the request body is gone by then
+    uploads = await run_io(save_batch_uploads, files)
+    return StreamingResponse(stream_audio_batch(uploads, scoring, profile), media_type="application/x-ndjson")
+
+@app.post("/analyze_image_batch")
+async def analyze_image_batch(files: List[UploadFile] = File(...), visuals: bool = Form(False),
+                              tiling: str = Form("auto")):
+    """
+    /analyze_image for many images; same NDJSON format as /analyze_batch.
+    Visualizations are off by default here to keep the stream small.
+    """
+    if tiling not in IMAGE_TILING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown tiling '{tiling}'. Use one of: {', '.join(IMAGE_TILING_MODES)}")
+    uploads = await run_io(save_batch_uploads, files)
+    return StreamingResponse(stream_image_batch(uploads, visuals, tiling), media_type="application/x-ndjson")
+
+# Live Monitor streaming: rolling buffer per session, scored every hop
+MONITOR_BUFFER_SECONDS = int(os.environ.get("VOICESHIELD_MONITOR_BUFFER_SECONDS", "30"))
+MONITOR_HOP_SECONDS = float(os.environ.get("VOICESHIELD_MONITOR_HOP_SECONDS", "1.0"))
+
+def new_monitor_session(codec, sample_rate):
+    return MonitorSession(
+        StreamDecoder(codec=codec, sample_rate=sample_rate),
+        buffer_seconds=MONITOR_BUFFER_SECONDS,
+        window_seconds=WINDOW_SECONDS,
+        hop_seconds=MONITOR_HOP_SECONDS,
+        speakers=OnlineSpeakerClusterer(
+            threshold=DIARIZATION_ONLINE_THRESHOLD,
+            max_speakers=DIARIZATION_MAX_SPEAKERS,
+        ),
+    )
+
+async def process_monitor_audio(session, flush=False):
+    """VAD and deepfake scoring on audio that arrived since the last update"""
+    chunk = session.take_vad_chunk(flush=flush)
+    if chunk is None:
+        return False
+    start, samples = chunk
+    if vad_model is not None:
+        timestamps = await run_inference(detect_speech, torch.from_numpy(samples), session.sr)
+        session.record_speech(start, timestamps)
+
+        # Online diarization: speech is assigned to a speaker once a region has >= 0.5s,
+        # even when it arrived across several chunks
+        pending = session.take_speaker_spans() if speaker_recognition_model is not None else None
+        if pending is not None:
+            _, speech, spans = pending
+            embeddings = await run_inference(
+                extract_embeddings, speaker_recognition_model, torch.from_numpy(speech), spans, session.sr)
+            session.record_speakers(embeddings)
+    else:
+        # No VAD: treat everything as speech
+        session.record_speech(start, [{'start': 0, 'end': len(samples)}])
+
+    windows = session.take_windows()
+    if windows and cnn_batcher is not None:
+        mels = await asyncio.gather(*(
+            run_dsp(dsp.mel_spectrogram, window, sr=session.sr, duration=WINDOW_SECONDS)
+            for _, window in windows
+        ))
+        predictions = await cnn_batcher.predict_many_async([mel[..., np.newaxis] for mel in mels])
+        session.record_scores(float(p[0]) for p in predictions)
+    return True
+
+@app.websocket("/ws/monitor")
+async def monitor_socket(websocket: WebSocket, codec: str = "pcm16", sample_rate: int = 16000):
+    """
+    Streaming Live Monitor.
+    Binary messages: audio frames (codec=pcm16 int16 mono, or codec=opus packets).
+    Text messages: {"type": "reset"} or {"type": "end"} (flush and close).
+    Server pushes {"type": "update", ...} risk updates as new audio is scored.
+    """
+    await websocket.accept()
+    try:
+        session = new_monitor_session(codec, sample_rate)
+    except Exception as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close()
+        return
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            flush = False
+            if message.get("bytes"):
+                session.push(message["bytes"])
+            elif message.get("text"):
+                control = json.loads(message["text"])
+                if control.get("type") == "reset":
+                    session = new_monitor_session(codec, sample_rate)
+                    continue
+                flush = control.get("type") == "end"
+
+            if await process_monitor_audio(session, flush=flush):
+                await websocket.send_json(session.snapshot(THRESHOLD_MODERATE))
+            if flush:
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Monitor session error: {e}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close()
+        except Exception:
+            pass
+
+@app.get("/cache_stats")
+def cache_stats():
+    return result_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus scrape endpoint: per-stage latency, input sizes, batching"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/batching_stats")
+def batching_stats():
+    if cnn_batcher is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "max_batch_size": cnn_batcher.max_batch_size,
+        "window_ms": cnn_batcher.max_wait * 1000,
+        "batch_size": cnn_batcher.batch_size_hist.snapshot(),
+        "queue_wait_seconds": cnn_batcher.queue_wait_hist.snapshot(),
+    }
+
 @app.get("/")
 def read_root():
     return {"status": "VoiceShield AI Backend Running"}
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
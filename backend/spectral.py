@@ -0,0 +1,109 @@
+"""
+Bounded-cost spectral analysis for /analyze_image.
+
+Instead of an FFT of the full-resolution frame, the spectrum is taken on a
+power-of-two center crop (or an evenly spread grid of such tiles) with
+rfft2, so the cost does not grow with the photo size. The magnitude is
+reduced to an azimuthally averaged radial profile through precomputed bin
+masks, cached per tile size.
+"""
+import functools
+import os
+
+import numpy as np
+
+SPECTRAL_CROP = int(os.environ.get("VOICESHIELD_SPECTRAL_CROP", "512"))  # max tile side (px)
+SPECTRAL_TILES = int(os.environ.get("VOICESHIELD_SPECTRAL_TILES", "1"))  # tiles per side (1 = center crop)
+RADIAL_BINS = 32
+MIN_CROP = 64
+HIGH_FREQ_START = 0.25  # cycles/px; the outer ring of the old full-frame heuristic
+REFERENCE_AREA = 1024 * 1024  # px; magnitudes are expressed per this frame area
+
+
+def crop_size(width, height, limit=SPECTRAL_CROP):
+    """Largest power of two that fits the image and the limit (None if too small)"""
+    side = min(width, height, limit)
+    if side < MIN_CROP:
+        return None
+    return 1 << (side.bit_length() - 1)
+
+
+def tile_boxes(width, height, size, grid=SPECTRAL_TILES):
+    """(left, top, right, bottom) of grid x grid tiles spread over the image"""
+    def starts(extent):
+        if grid <= 1:
+            return [(extent - size) // 2]
+        return [round(i * (extent - size) / (grid - 1)) for i in range(grid)]
+    return [(left, top, left + size, top + size) for top in starts(height) for left in starts(width)]
+
+
+@functools.lru_cache(maxsize=16)
+def radial_bins(size, nbins=RADIAL_BINS):
+    """
+    Flat bin index, weight and per-bin weight total for a size x size rfft2.
+    Bins split 0..Nyquist evenly; bin `nbins` collects the corners beyond it.
+    Arrays are shared between calls and read-only.
+    """
+    fy = np.fft.fftfreq(size)[:, np.newaxis]
+    fx = np.fft.rfftfreq(size)[np.newaxis, :]
+    radius = np.sqrt(fx ** 2 + fy ** 2)
+    index = np.minimum((radius * (2 * nbins)).astype(np.intp), nbins).ravel()
+
+    # rfft2 keeps half the plane: interior columns also stand for their mirror image
+    weights = np.full(radius.shape, 2.0)
+    weights[:, 0] = 1.0
+    weights[:, -1] = 1.0  # Nyquist column (size is even)
+    weights = weights.ravel()
+
+    totals = np.bincount(index, weights=weights, minlength=nbins + 1)
+    for array in (index, weights, totals):
+        array.setflags(write=False)
+    return index, weights, totals
+
+
+def log_magnitude(tile):
+    """
+    20*log(|F| + 1) with |F| normalized by the tile area, so the values no
+    longer depend on the crop size. The unnormalized full-frame FFT grew
+    with the photo, so no fixed scale reproduces it exactly; the normalized
+    magnitude is rescaled to REFERENCE_AREA (a ~1 MP frame) to keep the
+    same order of magnitude inside the log.
+    """
+    magnitude = np.abs(np.fft.rfft2(tile)) * (REFERENCE_AREA / tile.size)
+    return 20 * np.log(magnitude + 1)
+
+
+def radial_spectrum(img, crop=SPECTRAL_CROP, grid=SPECTRAL_TILES, nbins=RADIAL_BINS):
+    """
+    Radial log-magnitude profile of an RGB PIL image. Returns {"size", "tiles",
+    "profile" (nbins values, DC to Nyquist), "high_freq_ratio", "slope"
+    (dB per decade of frequency)}, or None if the image is too small.
+    """
+    size = crop_size(img.width, img.height, crop)
+    if size is None:
+        return None
+    index, weights, totals = radial_bins(size, nbins)
+
+    boxes = tile_boxes(img.width, img.height, size, grid)
+    sums = np.zeros(nbins + 1)
+    for box in boxes:
+        tile = np.asarray(img.crop(box).convert("L"), dtype=np.float32)
+        sums += np.bincount(index, weights=log_magnitude(tile).ravel() * weights, minlength=nbins + 1)
+    sums /= len(boxes)
+
+    profile = sums[:nbins] / np.maximum(totals[:nbins], 1e-12)
+    high = int(HIGH_FREQ_START * 2 * nbins)
+    high_freq_mean = sums[high:].sum() / totals[high:].sum()
+    total_mean = sums.sum() / totals.sum()
+
+    # Natural images decay roughly as 1/f; fit the profile against log frequency (DC excluded)
+    freqs = (np.arange(1, nbins) + 0.5) / (2 * nbins)
+    slope = np.polyfit(np.log10(freqs), profile[1:], 1)[0]
+
+    return {
+        "size": size,
+        "tiles": len(boxes),
+        "profile": profile.tolist(),
+        "high_freq_ratio": float(high_freq_mean / total_mean),
+        "slope": float(slope),
+    }
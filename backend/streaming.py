@@ -0,0 +1,198 @@
+"""
+Stateful Live Monitor sessions for the /ws/monitor WebSocket.
+
+Each session keeps a rolling ring buffer of 16 kHz audio and remembers how
+far VAD and deepfake scoring have progressed, so every update only touches
+the audio that arrived since the previous one.
+"""
+from collections import deque
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity float32 buffer addressed by absolute sample position"""
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._data = np.zeros(self.capacity, dtype=np.float32)
+        self.total = 0  # Samples ever written
+
+    @property
+    def oldest(self):
+        return max(0, self.total - self.capacity)
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) >= self.capacity:
+            # Only the newest `capacity` samples can be kept
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        pos = self.total % self.capacity
+        first = min(len(samples), self.capacity - pos)
+        self._data[pos:pos + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self.total += len(samples)
+
+    def read(self, start, end):
+        """Copy of samples [start, end) in absolute positions (clamped to what is buffered)"""
+        start = max(start, self.oldest)
+        end = min(end, self.total)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            return self._data[a:b].copy()
+        return np.concatenate([self._data[a:], self._data[:b - self.capacity]])
+
+
+class MonitorSession:
+    def __init__(self, decoder, sr=16000, buffer_seconds=30, window_seconds=3,
+                 hop_seconds=1.0, min_vad_seconds=0.5, min_speech_ratio=0.3, ema_alpha=0.5,
+                 speakers=None, min_speaker_seconds=0.5, join_gap_seconds=0.1):
+        self.decoder = decoder
+        self.sr = sr
+        self.buffer = RingBuffer(buffer_seconds * sr)
+        self.window_samples = int(window_seconds * sr)
+        self.hop_samples = int(hop_seconds * sr)
+        self.min_vad_samples = int(min_vad_seconds * sr)
+        self.min_speech_ratio = min_speech_ratio
+        self.min_speaker_samples = int(min_speaker_seconds * sr)
+        self.join_gap_samples = int(join_gap_seconds * sr)
+        self.ema_alpha = ema_alpha
+
+        self.vad_cursor = 0  # Absolute sample up to which VAD has run
+        self.next_window = 0  # Absolute start of the next window to score
+        self.speech = deque(maxlen=256)  # Recent (start, end) speech regions, absolute samples
+        self.speakers = speakers  # Optional OnlineSpeakerClusterer
+        self.speaker_cursor = 0  # Absolute sample up to which speech has been embedded
+        self.current_speaker = None
+
+        self.deepfake_score = None  # EMA over scored windows
+        self.latest_score = None
+        self.max_score = 0.0
+        self.windows_scored = 0
+        self.windows_skipped = 0
+
+    # --- Input ---
+
+    def push(self, payload):
+        samples = self.decoder.decode(payload)
+        if len(samples):
+            self.buffer.write(samples)
+        return len(samples)
+
+    # --- Incremental VAD ---
+
+    def take_vad_chunk(self, flush=False):
+        """New audio for VAD as (start, samples), or None until enough has arrived"""
+        start = max(self.vad_cursor, self.buffer.oldest)
+        end = self.buffer.total
+        if end - start < (1 if flush else self.min_vad_samples):
+            return None
+        self.vad_cursor = end
+        return start, self.buffer.read(start, end)
+
+    def record_speech(self, start, timestamps):
+        """
+        Store VAD timestamps (relative to the chunk at `start`). Speech cut by
+        the chunk boundary is joined to the region it continues.
+        """
+        for i, ts in enumerate(timestamps):
+            s, e = start + ts['start'], start + ts['end']
+            if (i == 0 and self.speech and self.speech[-1][1] >= start - self.join_gap_samples
+                    and s <= start + self.join_gap_samples):
+                self.speech[-1] = (self.speech[-1][0], e)
+            else:
+                self.speech.append((s, e))
+
+    def take_speaker_spans(self):
+        """
+        Speech not yet embedded for online diarization, as (start, samples,
+        [(s, e)] relative to start), or None. A region is embedded once its
+        new part reaches min_speaker_samples, so speech that arrives in short
+        chunks is still assigned a speaker; the region still open at the end
+        of the VAD'd audio waits for more. Closed regions that stay too short
+        are skipped.
+        """
+        cursor = max(self.speaker_cursor, self.buffer.oldest)
+        spans = []
+        for s, e in self.speech:
+            s = max(s, cursor)
+            if e <= s:
+                continue
+            if e - s >= self.min_speaker_samples:
+                spans.append((s, e))
+                cursor = e
+            elif e >= self.vad_cursor - self.join_gap_samples:
+                break  # Open: may continue in the next chunk
+            else:
+                cursor = e
+        self.speaker_cursor = cursor
+        if not spans:
+            return None
+        start = spans[0][0]
+        return start, self.buffer.read(start, spans[-1][1]), [(s - start, e - start) for s, e in spans]
+
+    def record_speakers(self, embeddings):
+        if self.speakers is None:
+            return
+        for embedding in embeddings:
+            self.current_speaker = self.speakers.assign(embedding)
+
+    def speech_ratio(self, start, end):
+        covered = 0
+        for s, e in self.speech:
+            covered += max(0, min(e, end) - max(s, start))
+        return covered / max(1, end - start)
+
+    # --- Incremental deepfake scoring ---
+
+    def take_windows(self):
+        """
+        Windows that are fully buffered and already covered by VAD.
+        Returns [(start, samples)] for windows with enough speech; silent
+        windows are skipped without scoring.
+        """
+        windows = []
+        # Windows that fell out of the ring buffer can no longer be scored
+        self.next_window = max(self.next_window, self.buffer.oldest)
+        while self.next_window + self.window_samples <= min(self.buffer.total, self.vad_cursor):
+            start = self.next_window
+            end = start + self.window_samples
+            if self.speech_ratio(start, end) >= self.min_speech_ratio:
+                windows.append((start, self.buffer.read(start, end)))
+            else:
+                self.windows_skipped += 1
+            self.next_window += self.hop_samples
+        return windows
+
+    def record_scores(self, scores):
+        for score in scores:
+            score = float(score)
+            self.latest_score = score
+            self.max_score = max(self.max_score, score)
+            if self.deepfake_score is None:
+                self.deepfake_score = score
+            else:
+                self.deepfake_score = self.ema_alpha * score + (1 - self.ema_alpha) * self.deepfake_score
+            self.windows_scored += 1
+
+    def snapshot(self, threshold):
+        recent_start = max(self.buffer.oldest, self.buffer.total - self.window_samples)
+        score = self.deepfake_score if self.deepfake_score is not None else 0.0
+        return {
+            "type": "update",
+            "time": round(self.buffer.total / self.sr, 2),
+            "deepfake_score": score,
+            "latest_window_score": self.latest_score,
+            "max_window_score": self.max_score,
+            "is_deepfake": score >= threshold,
+            "risk_score": int(round(score * 100)),
+            "speech_ratio": round(self.speech_ratio(recent_start, self.buffer.total), 3),
+            "windows_scored": self.windows_scored,
+            "windows_skipped": self.windows_skipped,
+            "speaker_count": len(self.speakers) if self.speakers is not None else None,
+            "current_speaker": f"Speaker {self.current_speaker + 1}" if self.current_speaker is not None else None,
+        }
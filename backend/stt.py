@@ -0,0 +1,76 @@
+"""
+Speech-to-text backends.
+
+All backends take 16-bit PCM (as produced by DecodedAudio.pcm16_bytes) and
+return the recognized text, or "" when nothing was recognized. Pick one with
+VOICESHIELD_STT_BACKEND:
+
+- google: Google Web Speech API via speech_recognition (needs network)
+- mock:   offline stand-in that sleeps like a network call and returns
+          canned text, for load tests and benchmarks
+"""
+import os
+import time
+from abc import ABC, abstractmethod
+
+import speech_recognition as sr
+
+STT_LANGUAGE = os.environ.get("VOICESHIELD_STT_LANGUAGE", "ko-KR")
+
+
+class STTBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, pcm16, sample_rate):
+        """Recognized text of 16-bit mono PCM, or an empty string"""
+
+
+class GoogleSTT(STTBackend):
+    name = "google"
+
+    def __init__(self, language=STT_LANGUAGE):
+        self.language = language
+
+    def transcribe(self, pcm16, sample_rate):
+        # Recognizer per call: instances hold mutable state and calls run concurrently
+        recognizer = sr.Recognizer()
+        audio_data = sr.AudioData(pcm16, sample_rate, 2)
+        try:
+            return recognizer.recognize_google(audio_data, language=self.language) or ""
+        except sr.UnknownValueError:
+            return ""
+
+
+class MockSTT(STTBackend):
+    """
+    Offline stand-in: waits `latency` seconds plus `realtime_factor` x audio
+    duration (like a remote service), then returns `text` (or a placeholder
+    naming the segment length).
+    """
+    name = "mock"
+
+    def __init__(self, latency=0.2, realtime_factor=0.1, text=None):
+        self.latency = latency
+        self.realtime_factor = realtime_factor
+        self.text = text
+
+    def transcribe(self, pcm16, sample_rate):
+        duration = len(pcm16) / 2 / sample_rate
+        time.sleep(self.latency + self.realtime_factor * duration)
+        if self.text is not None:
+            return self.text
+        return f"(mock transcript {duration:.1f}s)"
+
+
+def create_backend(name=None):
+    name = (name or os.environ.get("VOICESHIELD_STT_BACKEND", "google")).lower()
+    if name == "google":
+        return GoogleSTT()
+    if name == "mock":
+        return MockSTT(
+            latency=float(os.environ.get("VOICESHIELD_STT_MOCK_LATENCY", "0.2")),
+            realtime_factor=float(os.environ.get("VOICESHIELD_STT_MOCK_RTF", "0.1")),
+            text=os.environ.get("VOICESHIELD_STT_MOCK_TEXT"),
+        )
+    raise ValueError(f"Unknown STT backend: {name}")
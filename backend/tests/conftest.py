@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Backend modules are flat (`from dsp import ...`), imported from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# DSP on the inference threads: no worker processes to spawn in tests
+os.environ.setdefault("VOICESHIELD_DSP_PROCESSES", "0")
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import dsp
+
+
+def speech_like(seconds, sr=16000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+    return (tone + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def test_first_window_matches_mel_spectrogram():
+    audio = speech_like(3.0)
+    window_frames = dsp.window_frames_for(16000, 3)
+    log_mel = dsp.log_mel_spectrogram(audio, sr=16000)
+    windows = dsp.mel_windows(log_mel, window_frames)
+    starts = dsp.window_starts(log_mel.shape[1], window_frames, 47)
+
+    batch = dsp.normalize_windows(windows[starts])
+    expected = dsp.mel_spectrogram(audio, sr=16000)
+
+    assert batch.shape == (1,) + expected.shape
+    np.testing.assert_allclose(batch[0], expected, atol=1e-3)
+
+
+def test_short_recording_is_padded_to_one_window():
+    audio = speech_like(1.0)
+    window_frames = dsp.window_frames_for(16000, 3)
+    log_mel = dsp.log_mel_spectrogram(audio, sr=16000)
+    windows = dsp.mel_windows(log_mel, window_frames)
+    starts = dsp.window_starts(log_mel.shape[1], window_frames, 47)
+
+    assert list(starts) == [0]
+    assert windows[starts].shape == (1, 128, window_frames)
+    np.testing.assert_allclose(windows[0, :, log_mel.shape[1]:], dsp.AMIN_DB)
+
+
+@pytest.mark.parametrize("n_frames, hop, expected", [
+    (314, 47, [0, 47, 94, 141, 188, 220]),  # 10 s: a final window covers the tail
+    (282, 47, [0, 47, 94, 141, 188]),       # hops land on the end exactly
+    (94, 47, [0]),
+    (50, 47, [0]),
+])
+def test_window_starts_cover_the_end(n_frames, hop, expected):
+    starts = dsp.window_starts(n_frames, 94, hop)
+    assert list(starts) == expected
+    assert starts[-1] + 94 >= min(n_frames, 94)
+
+
+def test_windows_are_views_of_the_spectrogram():
+    log_mel = dsp.log_mel_spectrogram(speech_like(5.0), sr=16000)
+    windows = dsp.mel_windows(log_mel, 94)
+    assert np.shares_memory(windows, log_mel)
+    np.testing.assert_array_equal(windows[10], log_mel[:, 10:104])
@@ -0,0 +1,77 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from image_hash_index import BKTree, NearDuplicateIndex, hamming, image_hashes
+
+
+def flip_bits(value, bits, rng):
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    values += [flip_bits(values[0], n, rng) for n in range(1, 9)]
+    tree = BKTree()
+    for key, value in enumerate(values):
+        tree.add(value, key)
+
+    for query in (values[0], rng.getrandbits(64), flip_bits(values[7], 3, rng)):
+        for radius in (0, 4, 8):
+            expected = sorted((hamming(query, v), k) for k, v in enumerate(values) if hamming(query, v) <= radius)
+            assert sorted(tree.search(query, radius)) == expected
+
+
+def test_empty_tree_finds_nothing():
+    assert BKTree().search(123, 10) == []
+
+
+def test_lookup_needs_both_hashes_close_and_the_same_variant():
+    index = NearDuplicateIndex(max_entries=10, phash_radius=6, dhash_radius=10)
+    index.add(1, 0b1111, 0b0000, "full")
+
+    assert index.lookup(0b1110, 0b0001, "full") == (1, 1, 1)
+    assert index.lookup(0b1111, (1 << 11) - 1, "full") is None  # dHash too far
+    assert index.lookup(0b1111, 0b0000, "tiled") is None
+
+
+def test_lookup_prefers_the_closest_entry():
+    index = NearDuplicateIndex(max_entries=10)
+    index.add(1, 0b111, 0, "full")
+    index.add(2, 0b001, 0, "full")
+    assert index.lookup(0b000, 0, "full")[0] == 2
+
+
+def test_eviction_is_least_recently_used():
+    far_apart = (0, (1 << 32) - 1, (1 << 64) - 1)  # Pairwise Hamming distance >= 32
+    index = NearDuplicateIndex(max_entries=2)
+    assert index.add(1, far_apart[0], 0, "full") == []
+    assert index.add(2, far_apart[1], 0, "full") == []
+    index.lookup(far_apart[0], 0, "full")  # 1 is now the most recently used
+    assert index.add(3, far_apart[2], 0, "full") == [2]
+    assert index.lookup(far_apart[1], 0, "full") is None
+    assert index.lookup(far_apart[0], 0, "full")[0] == 1
+    assert len(index) == 2
+
+
+def test_removed_entries_are_not_returned():
+    index = NearDuplicateIndex()
+    index.add(1, 42, 42, "full")
+    index.remove(1)
+    assert index.lookup(42, 42, "full") is None
+
+
+def test_recompressed_copy_hashes_close(tmp_path):
+    rng = np.random.default_rng(0)
+    base = np.kron(rng.integers(0, 255, (16, 16, 3)), np.ones((32, 32, 1))).astype(np.uint8)
+    original = tmp_path / "original.png"
+    copy = tmp_path / "copy.jpg"
+    Image.fromarray(base).save(original)
+    Image.fromarray(base).resize((384, 384)).save(copy, quality=70)
+
+    (p1, d1), (p2, d2) = image_hashes(original), image_hashes(copy)
+    assert hamming(p1, p2) <= 6 and hamming(d1, d2) <= 10
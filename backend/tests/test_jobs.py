@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import jobs
+from database import AnalysisJob, Base
+
+
+@pytest.fixture(autouse=True)
+def job_db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(jobs, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield
+    engine.dispose()
+
+
+def submit(key="k1", path="/tmp/upload"):
+    return jobs.submit_job("call.wav", path, key, {"scoring": "head", "profile": "full"})
+
+
+def test_identical_submissions_share_a_job():
+    job_id, created = submit()
+    again, created_again = submit(path="/tmp/other")
+    other, created_other = submit(key="k2")
+
+    assert created and not created_again and created_other
+    assert again == job_id and other != job_id
+    assert jobs.queued_count() == 2
+
+
+def test_concurrent_identical_submissions_create_one_job():
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(submit())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({job_id for job_id, _ in results}) == 1
+    assert sum(created for _, created in results) == 1
+
+
+def test_finished_jobs_do_not_dedupe():
+    job_id, _ = submit()
+    jobs.update_job(job_id, status="done")
+    assert submit()[1]
+
+
+def test_claim_takes_the_oldest_and_counts_attempts():
+    first, _ = submit(key="k1")
+    submit(key="k2")
+
+    job = jobs.claim_next_job()
+    assert job["id"] == first
+    info = jobs.get_job(first)
+    assert info["status"] == "running" and info["started_at"] is not None
+    assert jobs.get_job(jobs.claim_next_job()["id"])["status"] == "running"
+    assert jobs.claim_next_job() is None
+
+
+def test_interrupted_jobs_are_requeued():
+    job_id, _ = submit()
+    jobs.claim_next_job()
+    jobs.update_job(job_id, progress={"cnn": "done"}, partial={"score": 1})
+
+    assert jobs.requeue_interrupted_jobs(max_attempts=3) == (1, [])
+    info = jobs.get_job(job_id)
+    assert info["status"] == "queued"
+    assert info["progress"] == {} and info["partial"] == {}
+
+
+def test_jobs_interrupted_too_often_are_failed():
+    job_id, _ = submit(path="/tmp/poison")
+    for _ in range(3):
+        jobs.claim_next_job()
+        requeued, abandoned = jobs.requeue_interrupted_jobs(max_attempts=3)
+
+    assert (requeued, abandoned) == (0, ["/tmp/poison"])
+    info = jobs.get_job(job_id)
+    assert info["status"] == "failed" and "3 times" in info["error"]
+    assert info["finished_at"] is not None
+    assert jobs.claim_next_job() is None
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from pipeline import StageGraph, StagePlanner
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_stages_start_after_their_dependencies():
+    events = []
+
+    def stage(name, delay):
+        async def fn(**deps):
+            events.append(("start", name))
+            await asyncio.sleep(delay)
+            events.append(("end", name))
+            return name
+        return fn
+
+    graph = StageGraph()
+    graph.add("a", stage("a", 0.03), deps=("audio",))
+    graph.add("b", stage("b", 0.01), deps=("audio",))
+    graph.add("c", stage("c", 0), deps=("a", "b"))
+    results, skipped = run(graph.run(audio="x"))
+
+    assert results["c"] == "c" and not skipped
+    assert events.index(("start", "c")) > events.index(("end", "a"))
+    assert events.index(("start", "c")) > events.index(("end", "b"))
+    assert events.index(("start", "b")) < events.index(("end", "a"))  # Independent stages overlap
+
+
+def test_dependency_results_are_passed_by_name():
+    graph = StageGraph()
+    graph.add("double", lambda audio: audio * 2, deps=("audio",), pool="inference")
+    graph.add("total", lambda audio, double: audio + double, deps=("audio", "double"), pool="io")
+    results, _ = run(graph.run(audio=3))
+    assert results["double"] == 6 and results["total"] == 9
+
+
+def test_skips_propagate_to_dependents_but_not_optional_users():
+    async def value(**deps):
+        return 1
+
+    async def with_optional(audio, extra):
+        return extra
+
+    graph = StageGraph()
+    graph.add("extra", value, deps=("audio",), when=lambda: False)
+    graph.add("needs_extra", value, deps=("extra",))
+    graph.add("maybe_extra", with_optional, deps=("audio",), optional=("extra",))
+    results, skipped = run(graph.run(audio=None))
+
+    assert skipped == {"extra", "needs_extra"}
+    assert results["maybe_extra"] is None
+
+
+def test_gated_stage_runs_when_a_gate_escalates_the_plan():
+    planner = StagePlanner("fast")
+    statuses = []
+
+    async def verdict(audio):
+        planner.observe_deepfake(0.9)
+        return 0.9
+
+    async def context(audio):
+        return "context"
+
+    graph = StageGraph()
+    graph.add("deepfake", verdict, deps=("audio",))
+    graph.add("context", context, deps=("audio",), when=lambda: planner.wants("context"), gates=("deepfake",))
+    results, skipped = run(graph.run(on_stage=lambda name, status, result=None: statuses.append((name, status)),
+                                     audio=None))
+
+    assert results["context"] == "context" and not skipped
+    assert statuses.index(("deepfake", "done")) < statuses.index(("context", "running"))
+
+
+def test_gated_stage_is_skipped_without_escalation():
+    planner = StagePlanner("fast")
+
+    async def verdict(audio):
+        planner.observe_deepfake(0.0)
+        return 0.0
+
+    graph = StageGraph()
+    graph.add("deepfake", verdict, deps=("audio",))
+    graph.add("context", verdict, deps=("audio",), when=lambda: planner.wants("context"), gates=("deepfake",))
+    _, skipped = run(graph.run(audio=None))
+    assert skipped == {"context"}
+
+
+def test_failure_cancels_the_other_stages():
+    cancelled = []
+
+    async def fails(audio):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def slow(audio):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    graph = StageGraph()
+    graph.add("fails", fails, deps=("audio",))
+    graph.add("slow", slow, deps=("audio",))
+    with pytest.raises(RuntimeError):
+        run(graph.run(audio=None))
+    assert cancelled == [True]
+
+
+def test_dependencies_must_be_inputs_or_earlier_stages():
+    graph = StageGraph()
+    graph.add("a", lambda b: b, deps=("b",), pool="inference")
+    graph.add("b", lambda audio: audio, deps=("audio",), pool="inference")
+    with pytest.raises(ValueError):
+        run(graph.run(audio=1))
+    with pytest.raises(ValueError):
+        StageGraph().add("x", lambda: None, gates=("unknown",))
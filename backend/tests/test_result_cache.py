@@ -0,0 +1,138 @@
+import asyncio
+import os
+
+import pytest
+
+from result_cache import ResultCache, make_key
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_callers_share_one_computation():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"score": 0.5}
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(3)))
+
+    results = run(scenario())
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == ["coalesced", "coalesced", "miss"]
+    assert all(result == {"score": 0.5} for result, _ in results)
+    assert run(cache.get_or_compute("k", compute)) == ({"score": 0.5}, "hit")
+
+
+def test_hits_are_independent_copies():
+    cache = ResultCache()
+
+    async def scenario():
+        await cache.put("k", {"items": [1]})
+        first = await cache.get("k")
+        first["items"].append(2)
+        return await cache.get("k")
+
+    assert run(scenario()) == {"items": [1]}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    cache = ResultCache()
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_compute("k", failing) for _ in range(2)),
+                                    return_exceptions=True)
+
+    results = run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.stats()["errors"] == 1
+    assert run(cache.get("k")) is None
+
+
+def test_waiters_recompute_when_the_first_caller_is_cancelled():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"n": len(calls)}
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await waiter
+
+    assert run(scenario()) == ({"n": 2}, "miss")
+    assert len(calls) == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_computation():
+    cache = ResultCache()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await first
+
+    assert run(scenario()) == ({"ok": True}, "miss")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=40)
+
+    async def scenario():
+        await cache.put("a", {"v": "x" * 10})
+        await cache.put("b", {"v": "y" * 10})
+        await cache.get("a")
+        await cache.put("c", {"v": "z" * 10})
+        return [await cache.get(k) is not None for k in ("a", "b", "c")]
+
+    assert run(scenario()) == [True, False, True]
+
+
+def test_disk_tier_survives_restart_and_is_bounded(tmp_path):
+    disk = str(tmp_path / "cache")
+    cache = ResultCache(max_bytes=0, disk_dir=disk, max_disk_bytes=50)
+
+    async def fill():
+        await cache.put("a", {"v": "x" * 10})
+        await cache.put("b", {"v": "y" * 10})
+        await cache.put("c", {"v": "z" * 10})
+
+    run(fill())
+    assert sorted(os.listdir(disk)) == ["b.json", "c.json"]
+
+    reopened = ResultCache(max_bytes=0, disk_dir=disk, max_disk_bytes=50)
+    assert run(reopened.get("c")) == {"v": "z" * 10}
+    assert reopened.stats()["disk_entries"] == 2
+
+
+def test_make_key_depends_on_every_part():
+    base = make_key("analyze", "abc", "v1", scoring="head")
+    assert base == make_key("analyze", "abc", "v1", scoring="head")
+    assert base != make_key("analyze", "abc", "v2", scoring="head")
+    assert base != make_key("analyze", "abc", "v1", scoring="windowed")
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from voice_index import VoiceIndex
+
+
+def vectors(n, dim=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.standard_normal(dim).astype(np.float32) for _ in range(n)]
+
+
+def test_search_returns_best_match_first():
+    index = VoiceIndex()
+    a, b, c = vectors(3)
+    index.load([("alice", a), ("bob", b), ("carol", c)])
+
+    matches = index.search(b * 3, k=2)
+    assert matches[0][0] == "bob"
+    assert matches[0][1] == pytest.approx(100.0, abs=1e-3)
+    assert len(matches) == 2 and matches[1][1] <= matches[0][1]
+
+
+def test_upsert_replaces_and_appends():
+    index = VoiceIndex()
+    a, b, c = vectors(3)
+    index.load([("alice", a)])
+
+    index.upsert("bob", b)
+    index.upsert("alice", c)
+
+    assert len(index) == 2
+    assert index.similarity("alice", c) == pytest.approx(100.0, abs=1e-3)
+    assert index.search(b, k=1)[0][0] == "bob"
+
+
+def test_upsert_rejects_other_dimension():
+    index = VoiceIndex()
+    index.load([("alice", vectors(1)[0])])
+    with pytest.raises(ValueError):
+        index.upsert("bob", vectors(1, dim=20)[0])
+    assert index.dim == 40 and "bob" not in index
+
+
+def test_remove_keeps_remaining_rows():
+    index = VoiceIndex()
+    a, b, c = vectors(3)
+    index.load([("alice", a), ("bob", b), ("carol", c)])
+
+    assert index.remove("alice")
+    assert not index.remove("alice")
+    assert len(index) == 2
+    assert index.similarity("carol", c) == pytest.approx(100.0, abs=1e-3)
+    assert index.search(b, k=1)[0][0] == "bob"
+
+
+def test_digest_follows_content_not_history():
+    a, b, c = vectors(3)
+    first = VoiceIndex()
+    first.load([("alice", a), ("bob", b)])
+    second = VoiceIndex()
+    second.load([("bob", b)])
+    second.upsert("carol", c)
+    second.upsert("alice", a)
+    second.remove("carol")
+
+    assert first.digest == second.digest  # Same voices, different row order and history
+    before = first.digest
+    first.upsert("bob", c)
+    assert first.digest != before
+
+
+def test_persisted_index_is_validated_against_the_db(tmp_path):
+    a, b, c = vectors(3)
+    path = str(tmp_path / "voices")
+    VoiceIndex(path).load([("alice", a), ("bob", b)])
+
+    reloaded = VoiceIndex(path)
+    assert reloaded.load_persisted([("alice", a), ("bob", b)])
+    assert reloaded.search(a, k=1)[0][0] == "alice"
+
+    assert not VoiceIndex(path).load_persisted([("alice", a), ("bob", c)])  # Re-registered elsewhere
+    assert not VoiceIndex(path).load_persisted([("alice", a)])
+    assert not VoiceIndex(path).load_persisted([("alice", a[:20]), ("bob", b[:20])])
@@ -0,0 +1,114 @@
+"""
+Per-stage latency tracing.
+
+Every stage observes wall time (and CPU time of the thread that ran it)
+into the voiceshield_stage_* histograms. When a request has started a
+Trace, the same numbers are also collected for its optional `timings`
+block. The trace lives in a context variable, which the executor helpers
+copy into worker threads, so stages that run off the event loop still
+report to the right request.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import histogram
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+AUDIO_SECONDS_BUCKETS = (1, 3, 5, 10, 30, 60, 120, 300, 600, 1800)
+IMAGE_PIXEL_BUCKETS = (0.1e6, 0.5e6, 1e6, 2e6, 4e6, 8e6, 12e6, 24e6, 50e6, 100e6)
+
+_current_trace = contextvars.ContextVar("voiceshield_trace", default=None)
+
+
+class Trace:
+    """Stage timings and input sizes for one request"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.inputs = {}
+        self._lock = threading.Lock()  # Stages may finish on several threads at once
+
+    def add(self, name, wall, cpu):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": None, "count": 0})
+            entry["wall_seconds"] += wall
+            if cpu is not None:
+                entry["cpu_seconds"] = (entry["cpu_seconds"] or 0.0) + cpu
+            entry["count"] += 1
+
+    def finish(self):
+        """Observe the total request time; returns the `timings` block"""
+        total = time.perf_counter() - self.started
+        histogram("voiceshield_request_seconds", "End-to-end request latency",
+                  STAGE_BUCKETS, labels={"endpoint": self.endpoint}).observe(total)
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self.stages.items()}
+            inputs = dict(self.inputs)
+        return {"total_seconds": total, "stages": stages, "inputs": inputs}
+
+
+def start_trace(endpoint):
+    trace = Trace(endpoint)
+    _current_trace.set(trace)
+    return trace
+
+
+def record_stage(name, wall, cpu=None):
+    histogram("voiceshield_stage_wall_seconds", "Wall time per pipeline stage",
+              STAGE_BUCKETS, labels={"stage": name}).observe(wall)
+    if cpu is not None:
+        histogram("voiceshield_stage_cpu_seconds", "CPU time per pipeline stage (thread running it)",
+                  STAGE_BUCKETS, labels={"stage": name}).observe(cpu)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, wall, cpu)
+
+
+@contextmanager
+def stage(name, cpu=True):
+    """
+    Time a block as pipeline stage `name`. Pass cpu=False around `await`s:
+    the event loop thread's CPU time would include other requests.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - wall_start,
+                     time.thread_time() - cpu_start if cpu else None)
+
+
+def traced(name, fn):
+    """`fn` wrapped as stage `name` (for run_inference / run_io calls)"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def timed_call(fn, *args, **kwargs):
+    """
+    (result, wall, cpu) of fn(*args). Module-level and picklable, so it can
+    run in the DSP process pool where the request's trace is not visible.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - wall_start, time.thread_time() - cpu_start
+
+
+def observe_input(name, value):
+    """Record an input size: "audio_seconds" or "image_pixels" """
+    buckets = AUDIO_SECONDS_BUCKETS if name == "audio_seconds" else IMAGE_PIXEL_BUCKETS
+    histogram(f"voiceshield_input_{name}", f"Input size ({name})", buckets).observe(value)
+    trace = _current_trace.get()
+    if trace is not None:
+        with trace._lock:
+            trace.inputs[name] = value
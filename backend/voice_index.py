@@ -0,0 +1,194 @@
+"""
+In-memory Voice ID index.
+
+Keeps every enrolled fingerprint as a row of an L2-normalized float32 matrix
+so identification is one matrix-vector product instead of a per-row cosine
+loop over the Voice table. The DB stays the source of truth; the index is
+rebuilt from it at startup and updated by /register_voice and /delete_voice.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _digest(rows):
+    """SHA-256 of (name, normalized row) pairs, independent of row order"""
+    h = hashlib.sha256()
+    for name, vector in sorted(rows, key=lambda row: row[0]):
+        h.update(name.encode("utf-8") + b"\0")
+        h.update(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+class VoiceIndex:
+    def __init__(self, path=None):
+        # Optional persistence: <path>.npy (matrix, memory-mapped on load) + <path>.json (names)
+        self.path = path
+        self._lock = threading.Lock()
+        self._names = []
+        self._rows = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._digest = None  # Content digest (used in cache keys), reset on every change
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    @property
+    def dim(self):
+        """Fingerprint dimension, or None while the index is empty"""
+        with self._lock:
+            return self._matrix.shape[1] if self._matrix.size else None
+
+    # --- Building ---
+
+    def load(self, items):
+        """Replace the index with (name, fingerprint) pairs"""
+        names = []
+        vectors = []
+        for name, fingerprint in items:
+            if fingerprint is None:
+                continue
+            names.append(name)
+            vectors.append(_normalize(fingerprint))
+        matrix = np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._names = names
+            self._rows = {name: i for i, name in enumerate(names)}
+            self._matrix = matrix
+            self._digest = None
+        self._save()
+
+    def load_persisted(self, items):
+        """
+        Load the persisted matrix (memory-mapped) if it holds exactly the
+        (name, fingerprint) pairs from the DB: names, dimension and the
+        content digest must all match. Returns False when the file is
+        missing or stale, so the caller rebuilds.
+        """
+        if not self.path or not os.path.exists(self.path + ".npy") or not os.path.exists(self.path + ".json"):
+            return False
+        try:
+            with open(self.path + ".json", "r", encoding="utf-8") as f:
+                names = json.load(f)
+            expected = [(name, _normalize(fingerprint)) for name, fingerprint in items if fingerprint is not None]
+            if sorted(names) != sorted(name for name, _ in expected):
+                return False
+            matrix = np.load(self.path + ".npy", mmap_mode="r")
+            dim = expected[0][1].shape[0] if expected else None
+            if matrix.shape[0] != len(names) or (names and (matrix.ndim != 2 or matrix.shape[1] != dim)):
+                return False
+            if _digest(zip(names, matrix)) != _digest(expected):
+                return False
+        except Exception as e:
+            print(f"Voice index load error: {e}")
+            return False
+        with self._lock:
+            self._names = names
+            self._rows = {name: i for i, name in enumerate(names)}
+            self._matrix = matrix
+            self._digest = None
+        return True
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            names = list(self._names)
+            matrix = np.array(self._matrix, dtype=np.float32)
+        try:
+            tmp_npy = self.path + ".tmp.npy"
+            np.save(tmp_npy, matrix)
+            os.replace(tmp_npy, self.path + ".npy")
+            tmp_json = self.path + ".json.tmp"
+            with open(tmp_json, "w", encoding="utf-8") as f:
+                json.dump(names, f, ensure_ascii=False)
+            os.replace(tmp_json, self.path + ".json")
+        except Exception as e:
+            print(f"Voice index save error: {e}")
+
+    # --- Incremental updates ---
+
+    def upsert(self, name, fingerprint):
+        vector = _normalize(fingerprint)
+        with self._lock:
+            if self._matrix.size and self._matrix.shape[1] != vector.shape[0]:
+                raise ValueError(f"Fingerprint dim {vector.shape[0]} != index dim {self._matrix.shape[1]}")
+            if name in self._rows:
+                matrix = np.array(self._matrix)  # Writable copy (the persisted matrix may be read-only)
+                matrix[self._rows[name]] = vector
+            else:
+                self._rows[name] = len(self._names)
+                # New list rather than append: search() reads a lock-free snapshot
+                self._names = self._names + [name]
+                matrix = np.vstack([self._matrix, vector[np.newaxis]]) if self._matrix.size else vector[np.newaxis].copy()
+            self._matrix = matrix
+            self._digest = None
+        self._save()
+
+    def remove(self, name):
+        with self._lock:
+            row = self._rows.pop(name, None)
+            if row is None:
+                return False
+            # Move the last row into the hole to keep the matrix dense
+            last = len(self._names) - 1
+            names = list(self._names)
+            matrix = np.array(self._matrix)
+            if row != last:
+                moved = names[last]
+                matrix[row] = matrix[last]
+                names[row] = moved
+                self._rows[moved] = row
+            self._names = names[:last]
+            self._matrix = matrix[:last]
+            self._digest = None
+        self._save()
+        return True
+
+    @property
+    def digest(self):
+        """
+        SHA-256 of the enrolled names and their fingerprints, independent of
+        row order. Stable across restarts, unlike a change counter, so cached
+        results on disk never outlive the index they were computed against.
+        """
+        with self._lock:
+            if self._digest is None:
+                self._digest = _digest((name, self._matrix[row]) for name, row in self._rows.items())
+            return self._digest
+
+    # --- Queries ---
+
+    def search(self, fingerprint, k=1):
+        """Top-k [(name, similarity %)] by cosine similarity, best first"""
+        with self._lock:
+            names = self._names
+            matrix = self._matrix
+        if not names:
+            return []
+        sims = matrix @ _normalize(fingerprint)
+        k = min(k, len(names))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(names[i], float(sims[i]) * 100) for i in top]
+
+    def similarity(self, name, fingerprint):
+        """Cosine similarity % against one enrolled voice, or None if not enrolled"""
+        with self._lock:
+            row = self._rows.get(name)
+            if row is None:
+                return None
+            target = self._matrix[row]
+        return float(target @ _normalize(fingerprint)) * 100